@@ -1,17 +1,26 @@
-# config/asgi.py
+# LiveStatusAPI/asgi.py
 import os
 from django.core.asgi import get_asgi_application
-from channels.routing import ProtocolTypeRouter, URLRouter
-from channels.auth import AuthMiddlewareStack
-import presence.routing 
 
-os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "LiveStatusAPI.settings")
+
+# Initialise Django before importing anything that touches models.
+django_asgi_app = get_asgi_application()
+
+from channels.routing import ProtocolTypeRouter, URLRouter  # noqa: E402
+from django.urls import re_path  # noqa: E402
+from presence.buffer import lifespan  # noqa: E402
+from presence.middleware import JWTAuthMiddleware  # noqa: E402
+import presence.routing  # noqa: E402
 
 application = ProtocolTypeRouter({
-    "http": get_asgi_application(),
-    "websocket": AuthMiddlewareStack(
+    "http": URLRouter(
+        presence.routing.http_urlpatterns + [re_path(r"", django_asgi_app)]
+    ),
+    "websocket": JWTAuthMiddleware(
         URLRouter(
             presence.routing.websocket_urlpatterns
         )
     ),
-})
\ No newline at end of file
+    "lifespan": lifespan,
+})
@@ -0,0 +1,130 @@
+# LiveStatusAPI/routers.py
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+
+_routing = ContextVar("database_routing", default=None)
+
+
+class RoutingState:
+    __slots__ = ("replica", "wrote")
+
+    def __init__(self):
+        self.replica = False  # reads may go to a replica
+        self.wrote = False  # something was written to the primary
+
+
+def get_routing_settings():
+    config = getattr(settings, "DATABASE_ROUTING", {})
+    return {
+        "REPLICAS": config.get("REPLICAS", []),
+        "STICKY_SECONDS": config.get("STICKY_SECONDS", 5),
+    }
+
+
+def sticky_key(user_id):
+    return f"database-routing:sticky:{user_id}"
+
+
+def is_sticky(user_id):
+    return cache.get(sticky_key(user_id)) is not None
+
+
+def mark_sticky(user_id):
+    cache.set(sticky_key(user_id), 1, timeout=get_routing_settings()["STICKY_SECONDS"])
+
+
+@contextmanager
+def request_routing():
+    """
+    Track routing for one request: replica reads are off until the view
+    opts in, and any write turns them off again.
+    """
+    state = RoutingState()
+    token = _routing.set(state)
+    try:
+        yield state
+    finally:
+        _routing.reset(token)
+
+
+def use_replica_reads(user):
+    """
+    Let the rest of the current request read from a replica, unless ``user``
+    wrote something within the last STICKY_SECONDS (read-your-writes).
+    """
+    state = _routing.get()
+    if state is None or not get_routing_settings()["REPLICAS"]:
+        return
+    if user is not None and user.is_authenticated and is_sticky(user.pk):
+        return
+    state.replica = True
+
+
+class PrimaryReplicaRouter:
+    """
+    Writes, and reads by default, go to the primary ("default"). Reads in
+    views that opt in through ReplicaReadMixin go to a random replica from
+    DATABASE_ROUTING["REPLICAS"], except inside a transaction or after the
+    request has written anything.
+    """
+
+    def db_for_read(self, model, **hints):
+        state = _routing.get()
+        if state is None or not state.replica:
+            return None
+        replicas = get_routing_settings()["REPLICAS"]
+        if not replicas or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return None
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        state = _routing.get()
+        if state is not None:
+            state.wrote = True
+            state.replica = False
+        # Explicit, so that objects loaded from a replica are saved to the
+        # primary rather than back where they came from.
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True  # replicas hold the same data as the primary
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in get_routing_settings()["REPLICAS"]:
+            return False
+        return None
+
+
+class DatabaseRoutingMiddleware:
+    """
+    Scopes routing state to the request and, when the request wrote to the
+    primary, keeps the user's reads there for STICKY_SECONDS so they see
+    their own writes despite replication lag.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with request_routing() as state:
+            response = self.get_response(request)
+        # DRF copies the authenticated user back onto the Django request
+        user = getattr(request, "user", None)
+        if state.wrote and user is not None and user.is_authenticated and get_routing_settings()["REPLICAS"]:
+            mark_sticky(user.pk)
+        return response
+
+
+class ReplicaReadMixin:
+    """
+    For read-only DRF views whose queries can be served by a replica.
+    """
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        use_replica_reads(request.user)
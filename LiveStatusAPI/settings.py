@@ -12,7 +12,7 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 
 import os
 from pathlib import Path
-from decouple import config
+from decouple import Csv, config
 from datetime import timedelta
 import sys
 
@@ -58,19 +58,149 @@ INSTALLED_APPS = [
     "corsheaders",
     # Local apps
     "users",
+    "webhooks",
 ]
 
-ASGI_APPLICATION = 'liveStatusAPI.asgi.application'
+ASGI_APPLICATION = 'LiveStatusAPI.asgi.application'
 
-# Redis channel layer configuration
+# Channel layer configuration. "redis" is needed as soon as consumers run in
+# more than one process; single-process nodes can use "local", a bounded
+# in-process layer (see presence.layers.LocalChannelLayer).
 
-CHANNEL_LAYERS = {
-    "default": {
+CHANNEL_LAYER_CHOICES = {
+    "redis": {
         "BACKEND": "channels_redis.core.RedisChannelLayer",
         "CONFIG": {
             "hosts": [("redis", 6379)],  
         },
     },
+    "local": {
+        "BACKEND": "presence.layers.LocalChannelLayer",
+        "CONFIG": {
+            "capacity": 1000,
+            "overflow": "drop_oldest",
+        },
+    },
+}
+
+CHANNEL_LAYERS = {
+    "default": CHANNEL_LAYER_CHOICES[config("CHANNEL_LAYER", default="redis")],
+}
+
+# Current-presence store (one record per user, in front of presence_record)
+# Use "presence.store.RedisPresenceStore" with {"url": "redis://redis:6379/1"}
+# when running more than one worker.
+
+PRESENCE_STORE = {
+    "BACKEND": config("PRESENCE_STORE_BACKEND", default="presence.store.LocalPresenceStore"),
+    "OPTIONS": {},
+}
+
+# Presence write buffer used by the WebSocket consumer. Identical statuses
+# from the same user within COALESCE_WINDOW seconds are dropped; the rest are
+# bulk-inserted every FLUSH_INTERVAL seconds or once MAX_BATCH_SIZE are queued.
+# A batch that fails to write is retried up to MAX_RETRIES times in a row.
+
+PRESENCE_WRITE_BUFFER = {
+    "COALESCE_WINDOW": 30,
+    "FLUSH_INTERVAL": 1.0,
+    "MAX_BATCH_SIZE": 500,
+    "MAX_RETRIES": 3,
+}
+
+# Server-side liveness for WebSocket users. Users with no inbound frames for
+# AWAY_AFTER seconds are marked away and after OFFLINE_AFTER seconds offline,
+# as are users whose last socket closed DISCONNECT_GRACE seconds ago. Clients
+# only need to send {"type": "heartbeat"} more often than AWAY_AFTER.
+# Workers share each user's connection count and, every ACTIVITY_INTERVAL
+# seconds, their last activity through the default cache, so a user still
+# connected to another worker is left alone; use a shared CACHES backend.
+PRESENCE_LIVENESS = {
+    "AWAY_AFTER": 300,
+    "OFFLINE_AFTER": 900,
+    "DISCONNECT_GRACE": 30,
+    "ACTIVITY_INTERVAL": 30,
+}
+
+# Presence history retention. `manage.py compact_presence` rolls raw
+# presence_record rows older than RETENTION_DAYS up into per-user daily
+# summaries and deletes them, BATCH_SIZE users/rows at a time. Each user's
+# last row is kept as their current status.
+PRESENCE_HISTORY = {
+    "RETENTION_DAYS": 90,
+    "BATCH_SIZE": 500,
+}
+
+# Maximum number of users a single multiplexed presence socket (or event
+# stream) may watch.
+PRESENCE_MAX_SUBSCRIPTIONS = 1000
+
+# Server-Sent Events presence feed (/sse/presence/). Each worker keeps the
+# last REPLAY_SIZE updates for clients resuming with Last-Event-ID; updates
+# arriving within BATCH_INTERVAL seconds are written as one chunk of at most
+# MAX_BATCH events. KEEPALIVE is the seconds between keepalive comments and
+# RETRY the reconnect delay (ms) suggested to clients.
+PRESENCE_EVENT_STREAM = {
+    "REPLAY_SIZE": 1000,
+    "BATCH_INTERVAL": 0.05,
+    "MAX_BATCH": 100,
+    "KEEPALIVE": 15,
+    "RETRY": 3000,
+}
+
+# Maximum number of user IDs accepted by the bulk presence snapshot endpoint.
+PRESENCE_SNAPSHOT_MAX_IDS = 5000
+
+# Presence fan-out to teammates and granted watchers. Watchers are spread
+# over SHARDS channel groups so one status change costs at most one
+# group_send per shard. The subscription graph is rebuilt after TTL seconds
+# and keeps recipient lists for up to CACHE_SIZE users. Team and watcher
+# changes reach other processes through a version key in the default cache,
+# checked every VERSION_CHECK seconds, so configure a shared CACHES backend
+# when running several processes.
+PRESENCE_FANOUT = {
+    "SHARDS": 64,
+    "TTL": 60,
+    "CACHE_SIZE": 10000,
+    "VERSION_CHECK": 1,
+}
+
+# Per-process cache of active users used to authenticate WebSocket
+# connections without a database query. Entries expire after TTL seconds so
+# deactivations made by other processes are picked up.
+
+USER_CACHE = {
+    "MAX_SIZE": 10000,
+    "TTL": 300,
+}
+
+# User-Agent classification for presence writes. Results are cached per raw
+# header, keeping up to CACHE_SIZE distinct User-Agents; only the first
+# MAX_LENGTH characters are inspected.
+
+DEVICE_CLASSIFICATION = {
+    "CACHE_SIZE": 1024,
+    "MAX_LENGTH": 512,
+}
+
+# Revoked token JTIs and per-user "issued before" watermarks, checked on every
+# authenticated request. Entries expire with the tokens they cover. Use
+# "users.revocation.RedisRevocationStore" with {"url": "redis://redis:6379/1"}
+# when running more than one worker.
+
+TOKEN_REVOCATION = {
+    "BACKEND": config("TOKEN_REVOCATION_BACKEND", default="users.revocation.LocalRevocationStore"),
+    "OPTIONS": {},
+}
+
+# Sliding-window counters behind the DRF throttles and the per-user
+# "websocket" message rate (see DEFAULT_THROTTLE_RATES). Use
+# "LiveStatusAPI.throttling.RedisRateLimitStore" with
+# {"url": "redis://redis:6379/2"} so limits hold across workers.
+
+RATE_LIMITS = {
+    "BACKEND": config("RATE_LIMIT_BACKEND", default="LiveStatusAPI.throttling.LocalRateLimitStore"),
+    "OPTIONS": {},
 }
 
 MIDDLEWARE = [
@@ -83,6 +213,7 @@ MIDDLEWARE = [
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
+    'LiveStatusAPI.routers.DatabaseRoutingMiddleware',
 ]
 
 ROOT_URLCONF = "LiveStatusAPI.urls"
@@ -114,14 +245,67 @@ CORS_ALLOW_CREDENTIALS = True
 
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
-
-DATABASES = {
-    "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
+#
+# DATABASE_PROFILE selects the setup:
+# - "sqlite" (default): a local file. DB_SQLITE_REPLICA=True adds a "replica"
+#   alias on the same file to try out replica routing.
+# - "postgres": DB_NAME on DB_HOST through psycopg's connection pool
+#   (DB_POOL_MIN_SIZE..DB_POOL_MAX_SIZE connections per process), plus one
+#   "replica_N" alias per host in DB_REPLICA_HOSTS. DB_POOL=False uses
+#   persistent connections with health checks instead, kept for
+#   DB_CONN_MAX_AGE seconds.
+
+DATABASE_PROFILE = config("DATABASE_PROFILE", default="sqlite")
+
+if DATABASE_PROFILE == "postgres":
+    DB_POOL = config("DB_POOL", default=True, cast=bool)
+
+    def postgres_database(host, **extra):
+        return {
+            "ENGINE": "django.db.backends.postgresql",
+            "NAME": config("DB_NAME"),
+            "USER": config("DB_USER"),
+            "PASSWORD": config("DB_PASSWORD"),
+            "HOST": host,
+            "PORT": config("DB_PORT", default=5432, cast=int),
+            "OPTIONS": {
+                "pool": {
+                    "min_size": config("DB_POOL_MIN_SIZE", default=2, cast=int),
+                    "max_size": config("DB_POOL_MAX_SIZE", default=20, cast=int),
+                    "timeout": config("DB_POOL_TIMEOUT", default=10, cast=int),
+                },
+            } if DB_POOL else {},
+            "CONN_MAX_AGE": 0 if DB_POOL else config("DB_CONN_MAX_AGE", default=60, cast=int),
+            "CONN_HEALTH_CHECKS": not DB_POOL,
+            **extra,
+        }
+
+    DATABASES = {"default": postgres_database(config("DB_HOST", default="localhost"))}
+    for number, host in enumerate(config("DB_REPLICA_HOSTS", default="", cast=Csv()), start=1):
+        DATABASES[f"replica_{number}"] = postgres_database(host, TEST={"MIRROR": "default"})
+else:
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": BASE_DIR / "db.sqlite3",
+        }
     }
+    if config("DB_SQLITE_REPLICA", default=False, cast=bool):
+        DATABASES["replica"] = {**DATABASES["default"], "TEST": {"MIRROR": "default"}}
+
+# Reads in the presence and analytics read views (see
+# LiveStatusAPI.routers.ReplicaReadMixin) go to one of REPLICAS; everything
+# else uses the primary. A user who wrote something reads from the primary
+# for STICKY_SECONDS afterwards. Stickiness is kept in the default cache, so
+# configure a shared CACHES backend when running several processes.
+
+DATABASE_ROUTING = {
+    "REPLICAS": [alias for alias in DATABASES if alias != "default"],
+    "STICKY_SECONDS": config("DB_STICKY_SECONDS", default=5, cast=int),
 }
 
+DATABASE_ROUTERS = ["LiveStatusAPI.routers.PrimaryReplicaRouter"]
+
 # Authentication Settings
 AUTH_USER_MODEL = 'users.CustomUser'
 
@@ -147,7 +331,7 @@ AUTH_PASSWORD_VALIDATORS = [
 # Rest Framework Authentication
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'users.authentication.RevocableJWTAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
@@ -156,12 +340,14 @@ REST_FRAMEWORK = {
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
     
  "DEFAULT_THROTTLE_CLASSES": [
-        "rest_framework.throttling.AnonRateThrottle",
-        "rest_framework.throttling.UserRateThrottle",
+        "LiveStatusAPI.throttling.AnonRateThrottle",
+        "LiveStatusAPI.throttling.UserRateThrottle",
+        "LiveStatusAPI.throttling.ScopedRateThrottle",
     ],
     "DEFAULT_THROTTLE_RATES": {
         "anon": "100/hour",
         "user": "1000/hour",
+        "websocket": "120/minute",
         "register": "50/hour",
         "verify_email": "100/hour",
         "login": "50/hour",
@@ -196,6 +382,40 @@ EMAIL_HOST_USER = "EMAIL_HOST_USER"
 EMAIL_HOST_PASSWORD = "EMAIL_HOST_PASSWORD"
 DEFAULT_FROM_EMAIL = EMAIL_HOST_USER
 
+# Outbound mail queue. Requests only store the message; with WORKER "thread"
+# each process delivers it on a background thread, with "command" run
+# `manage.py send_queued_mail --loop` instead. Failed deliveries are retried
+# after RETRY_BACKOFF * 2**(attempt - 1) seconds, up to MAX_ATTEMPTS times.
+# A worker leases its batch for LEASE seconds and sends it outside any
+# database transaction.
+
+EMAIL_QUEUE = {
+    "WORKER": config("EMAIL_QUEUE_WORKER", default="thread"),
+    "BATCH_SIZE": 50,
+    "MAX_ATTEMPTS": 5,
+    "RETRY_BACKOFF": 60,
+    "LEASE": 300,
+}
+
+# Webhook delivery. Events are written to an outbox and posted in batches of
+# up to MAX_EVENTS_PER_REQUEST per endpoint, CONCURRENCY requests at a time,
+# over pooled keep-alive connections. With WORKER "command" run
+# `manage.py deliver_webhooks --loop` instead of the in-process worker.
+# Webhook URLs must resolve to public addresses, both when registered and
+# when connecting; ALLOW_PRIVATE_ADDRESSES lifts that for local development.
+
+WEBHOOKS = {
+    "WORKER": config("WEBHOOKS_WORKER", default="thread"),
+    "BATCH_SIZE": 500,
+    "MAX_EVENTS_PER_REQUEST": 50,
+    "MAX_ATTEMPTS": 8,
+    "RETRY_BACKOFF": 30,
+    "TIMEOUT": 10,
+    "CONCURRENCY": 8,
+    "MAX_IDLE_CONNECTIONS": 4,
+    "ALLOW_PRIVATE_ADDRESSES": config("WEBHOOKS_ALLOW_PRIVATE_ADDRESSES", default=False, cast=bool),
+}
+
 SPECTACULAR_SETTINGS = {
     'TITLE': 'LiveStatusAPI',
     'DESCRIPTION': 'A real-time presence tracking API that enables applications to monitor user activity, predict response times, and analyze engagement trends.',
@@ -205,6 +425,16 @@ SPECTACULAR_SETTINGS = {
 
 FRONTEND_URL = "http://localhost:3000"
 
+# Response-time prediction. EWMA_ALPHA weights the most recent response in the
+# decayed mean; set USE_EWMA to predict from it instead of the plain mean.
+RESPONSE_TIME_PREDICTION = {
+    "EWMA_ALPHA": 0.1,
+    "USE_EWMA": False,
+}
+
+# Maximum number of user IDs accepted by the batch prediction endpoint.
+RESPONSE_TIME_PREDICTION_MAX_IDS = 1000
+
 # Internationalization
 # https://docs.djangoproject.com/en/5.1/topics/i18n/
 
@@ -0,0 +1,269 @@
+# LiveStatusAPI/throttling.py
+import asyncio
+import threading
+import time
+from typing import NamedTuple
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+from rest_framework import throttling
+
+DURATIONS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def parse_rate(rate):
+    """
+    "100/hour" -> (100, 3600). Same format as DRF's throttle rates.
+    """
+    if rate is None:
+        return None, None
+    num, period = rate.split("/")
+    return int(num), DURATIONS[period[0]]
+
+
+class RateLimitResult(NamedTuple):
+    allowed: bool
+    remaining: int
+    retry_after: float
+
+
+def window_state(now, window):
+    """
+    (current window number, weight of the previous window's count).
+    """
+    current = int(now // window)
+    return current, (window - (now - current * window)) / window
+
+
+def evaluate(limit, window, now, previous, current, allowed):
+    """
+    Build the result of a sliding-window check from the two window counts
+    (after the hit was counted, if it was allowed).
+    """
+    estimate = previous * window_state(now, window)[1] + current
+    remaining = max(int(limit - estimate), 0)
+    if allowed:
+        return RateLimitResult(True, remaining, 0.0)
+    elapsed = now - int(now // window) * window
+    if current + 1 <= limit and previous:
+        # Wait for the previous window's share to drain far enough
+        retry_after = window * (1 - (limit - 1 - current) / previous) - elapsed
+    else:
+        # Nothing more fits in this window; wait for enough of it to slide out
+        retry_after = window - elapsed + window * max(1 - (limit - 1) / max(current, 1), 0)
+    return RateLimitResult(False, remaining, max(round(retry_after, 3), 0.001))
+
+
+class BaseRateLimitStore:
+    """
+    Counts hits per key with a sliding-window counter: the current fixed
+    window's count plus the previous window's, weighted by how much of it
+    still overlaps the sliding window. Denied hits are not counted.
+    """
+
+    def hit(self, key, limit, window, now=None):
+        raise NotImplementedError
+
+    async def ahit(self, key, limit, window, now=None):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+
+class LocalRateLimitStore(BaseRateLimitStore):
+    """
+    In-process store. Only suitable for a single worker or for tests.
+    """
+
+    def __init__(self):
+        self._windows = {}  # (key, window) -> [window number, current hits, previous hits]
+        self._lock = threading.Lock()
+        self._pruned_at = time.time()
+
+    def hit(self, key, limit, window, now=None):
+        now = time.time() if now is None else now
+        number, weight = window_state(now, window)
+        with self._lock:
+            entry = self._windows.get((key, window))
+            if entry is None or entry[0] < number - 1:
+                entry = self._windows[(key, window)] = [number, 0, 0]
+            elif entry[0] == number - 1:
+                entry[:] = [number, 0, entry[1]]
+            previous, current = entry[2], entry[1]
+            allowed = previous * weight + current + 1 <= limit
+            if allowed:
+                current = entry[1] = current + 1
+            if now - self._pruned_at >= 60:
+                self._prune(now)
+        return evaluate(limit, window, now, previous, current, allowed)
+
+    async def ahit(self, key, limit, window, now=None):
+        return self.hit(key, limit, window, now)
+
+    def _prune(self, now):
+        # Keys whose last hit is more than a window behind count for nothing
+        self._pruned_at = now
+        stale = [
+            (key, window)
+            for (key, window), (number, _, _) in self._windows.items()
+            if number < int(now // window) - 1
+        ]
+        for entry in stale:
+            del self._windows[entry]
+
+    def clear(self):
+        with self._lock:
+            self._windows.clear()
+
+
+# KEYS: previous window, current window. ARGV: limit, previous weight, ttl.
+SLIDING_WINDOW_SCRIPT = """
+local previous = tonumber(redis.call('GET', KEYS[1]) or '0')
+local current = tonumber(redis.call('GET', KEYS[2]) or '0')
+if previous * tonumber(ARGV[2]) + current + 1 > tonumber(ARGV[1]) then
+    return {0, previous, current}
+end
+current = redis.call('INCR', KEYS[2])
+if current == 1 then
+    redis.call('EXPIRE', KEYS[2], ARGV[3])
+end
+return {1, previous, current}
+"""
+
+
+class RedisRateLimitStore(BaseRateLimitStore):
+    """
+    Redis-backed store shared by every worker. Each check is one EVALSHA of
+    a Lua script, so reading both windows and counting the hit is atomic and
+    costs a single round trip.
+
+    Pass ``client`` to use an existing connection (e.g. ``fakeredis.FakeRedis``
+    in tests); otherwise one is created from ``url``. WebSocket consumers use
+    a ``redis.asyncio`` client, ``async_client`` or one per event loop made
+    from ``url``.
+    """
+
+    def __init__(self, url="redis://localhost:6379/0", key_prefix="ratelimit:", client=None, async_client=None):
+        self.url = url if client is None else None
+        if client is None:
+            import redis
+
+            client = redis.Redis.from_url(url)
+        self.client = client
+        self.key_prefix = key_prefix
+        self.script = client.register_script(SLIDING_WINDOW_SCRIPT)
+        self._async_script = async_client.register_script(SLIDING_WINDOW_SCRIPT) if async_client else None
+        self._loop_script = None
+        self._loop = None
+
+    def make_args(self, key, limit, window, now):
+        current_window, weight = window_state(now, window)
+        keys = [f"{self.key_prefix}{key}:{current_window - 1}", f"{self.key_prefix}{key}:{current_window}"]
+        return keys, [limit, repr(weight), 2 * window]
+
+    def hit(self, key, limit, window, now=None):
+        now = time.time() if now is None else now
+        keys, args = self.make_args(key, limit, window, now)
+        allowed, previous, current = self.script(keys=keys, args=args)
+        return evaluate(limit, window, now, int(previous), int(current), bool(allowed))
+
+    def get_async_script(self):
+        """
+        The script bound to an asyncio client for the running loop, or None
+        when the store was given a sync client only.
+        """
+        if self._async_script is not None or self.url is None:
+            return self._async_script
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            import redis.asyncio
+
+            # Connections belong to the loop that opened them
+            self._loop_script = redis.asyncio.Redis.from_url(self.url).register_script(SLIDING_WINDOW_SCRIPT)
+            self._loop = loop
+        return self._loop_script
+
+    async def ahit(self, key, limit, window, now=None):
+        script = self.get_async_script()
+        if script is None:
+            return await sync_to_async(self.hit)(key, limit, window, now)
+        now = time.time() if now is None else now
+        keys, args = self.make_args(key, limit, window, now)
+        allowed, previous, current = await script(keys=keys, args=args)
+        return evaluate(limit, window, now, int(previous), int(current), bool(allowed))
+
+    def clear(self):
+        keys = list(self.client.scan_iter(match=f"{self.key_prefix}*"))
+        if keys:
+            self.client.delete(*keys)
+
+
+_store = None
+
+
+def get_rate_limit_store():
+    """
+    Return the process-wide store configured by settings.RATE_LIMITS.
+    """
+    global _store
+    if _store is None:
+        config = getattr(settings, "RATE_LIMITS", {})
+        backend = import_string(config.get("BACKEND", "LiveStatusAPI.throttling.LocalRateLimitStore"))
+        _store = backend(**config.get("OPTIONS", {}))
+    return _store
+
+
+@receiver(setting_changed)
+def reset_rate_limit_store(setting, **kwargs):
+    global _store
+    if setting == "RATE_LIMITS":
+        _store = None
+
+
+class SlidingWindowRateThrottle(throttling.SimpleRateThrottle):
+    """
+    SimpleRateThrottle counted in the shared rate-limit store instead of
+    the per-process cache, so a limit holds across all workers.
+    """
+
+    result = None
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+        self.result = get_rate_limit_store().hit(self.key, self.num_requests, self.duration)
+        return self.result.allowed
+
+    def wait(self):
+        return self.result.retry_after if self.result is not None else None
+
+
+class AnonRateThrottle(throttling.AnonRateThrottle, SlidingWindowRateThrottle):
+    pass
+
+
+class UserRateThrottle(throttling.UserRateThrottle, SlidingWindowRateThrottle):
+    pass
+
+
+class ScopedRateThrottle(throttling.ScopedRateThrottle, SlidingWindowRateThrottle):
+    pass
+
+
+async def allow_message(scope_name, ident):
+    """
+    Rate-limit a WebSocket message against the ``scope_name`` rate in
+    DEFAULT_THROTTLE_RATES. Returns the RateLimitResult, or None when the
+    scope has no rate.
+    """
+    limit, window = parse_rate(throttling.api_settings.DEFAULT_THROTTLE_RATES.get(scope_name))
+    if limit is None:
+        return None
+    return await get_rate_limit_store().ahit(f"throttle_{scope_name}_{ident}", limit, window)
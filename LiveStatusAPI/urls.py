@@ -20,6 +20,7 @@ urlpatterns = [
     path('api/', include('users.urls')),
     path('api/', include('presence.urls')),
     path('api/', include('analytics.urls')),
+    path('api/', include('webhooks.urls')),
 
     # Authentication URLs
     path('api/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
@@ -0,0 +1,66 @@
+# LiveStatusAPI/workers.py
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import connection as db_connection
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+
+class BackgroundWorker:
+    """
+    In-process worker that runs ``drain`` on one background thread, so
+    request threads never wait on slow deliveries. ``wake()`` queues a pass
+    (it is typically registered with transaction.on_commit); after each pass
+    a timer wakes the worker again when the earliest pending row of
+    ``model`` falls due, going by its ``next_attempt_at``.
+    """
+
+    def __init__(self, name, drain, model):
+        self.name = name
+        self.drain = drain
+        self.model = model
+        self._executor = None
+        self._timer = None
+        self._scheduled = False
+        self._lock = threading.Lock()
+
+    def wake(self):
+        with self._lock:
+            if self._scheduled:
+                return
+            self._scheduled = True
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=self.name)
+        self._executor.submit(self.run)
+
+    def run(self):
+        with self._lock:
+            # Cleared before draining so a wake() during the drain queues another pass.
+            self._scheduled = False
+        try:
+            self.drain()
+            self.schedule_retry()
+        except Exception:
+            logger.exception(f"{self.name} failed")
+        finally:
+            db_connection.close()
+
+    def schedule_retry(self):
+        next_attempt_at = (
+            self.model.objects.filter(status="pending")
+            .order_by("next_attempt_at")
+            .values_list("next_attempt_at", flat=True)
+            .first()
+        )
+        if next_attempt_at is None:
+            return
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+            delay = max((next_attempt_at - timezone.now()).total_seconds(), 0)
+            self._timer = threading.Timer(delay, self.wake)
+            self._timer.daemon = True
+            self._timer.start()
@@ -0,0 +1,121 @@
+# analytics/activity.py
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Count, FloatField, Sum
+from django.db.models.functions import Cast, TruncDate
+from django.utils import timezone
+
+from analytics.models import ResponseHistory, ResponseTimeDaily
+from presence.history import (
+    ACTIVE_STATUSES,
+    add_to_table,
+    day_start,
+    get_daily_status_totals,
+    get_open_span,
+    split_hours,
+)
+from presence.models import PresenceHourlySummary
+
+TIME_RANGES = {"day": 1, "week": 7, "month": 30}
+REPORTED_STATUSES = ("online", "away", "busy")  # offline time isn't tracked
+PEAK_HOURS = 3
+
+
+def record_daily_response(user_id, responded_at, response_time):
+    add_to_table(
+        ResponseTimeDaily,
+        ["user", "day"],
+        [{"user": user_id, "day": timezone.localdate(responded_at), "count": 1, "total": float(response_time)}],
+    )
+
+
+def rebuild_response_rollups(user_ids):
+    """
+    Recompute ResponseTimeDaily for ``user_ids`` from ResponseHistory.
+    """
+    rows = (
+        ResponseHistory.objects.filter(user_id__in=user_ids)
+        .annotate(day=TruncDate("responded_at"))
+        .values("user", "day")
+        .annotate(count=Count("id"), total=Sum(Cast("response_time", FloatField())))
+    )
+    with transaction.atomic():
+        ResponseTimeDaily.objects.filter(user_id__in=user_ids).delete()
+        created = ResponseTimeDaily.objects.bulk_create(
+            ResponseTimeDaily(user_id=row["user"], day=row["day"], count=row["count"], total=row["total"])
+            for row in rows
+        )
+    return len(created)
+
+
+def status_totals(entries):
+    totals = {status: 0.0 for status in REPORTED_STATUSES}
+    totals["transitions"] = 0
+    for statuses in entries:
+        for status, values in statuses.items():
+            if status in totals:
+                totals[status] += values["seconds"]
+            totals["transitions"] += values["transitions"]
+    return totals
+
+
+def get_user_analytics(user, time_range="week"):
+    """
+    Engagement score, time in status per day and week, response-time trend
+    and peak activity hours over the last ``time_range`` (see TIME_RANGES).
+    Everything comes from rollups plus the open presence span, so the
+    number of queries doesn't grow with the user's history.
+    """
+    last_day = timezone.localdate()
+    first_day = last_day - timedelta(days=TIME_RANGES[time_range] - 1)
+    days = [first_day + timedelta(days=offset) for offset in range(TIME_RANGES[time_range])]
+
+    open_span = get_open_span(user.id)
+    by_day = get_daily_status_totals(user.id, first_day, last_day, open_span=open_span)
+    daily = [{"date": day, **status_totals([by_day.get(day, {})])} for day in days]
+
+    weeks = {}
+    for day in days:
+        weeks.setdefault(day - timedelta(days=day.weekday()), []).append(by_day.get(day, {}))
+    weekly = [{"week_start": week, **status_totals(entries)} for week, entries in weeks.items()]
+
+    hours = dict(
+        PresenceHourlySummary.objects.filter(user=user, day__gte=first_day, day__lte=last_day)
+        .values_list("hour")
+        .annotate(total=Sum("seconds"))
+    )
+    if open_span is not None and open_span.status in ACTIVE_STATUSES:
+        for _, hour, seconds in split_hours(max(open_span.started_at, day_start(first_day)), timezone.now()):
+            hours[hour] = hours.get(hour, 0.0) + seconds
+    peak_hours = sorted((hour for hour, seconds in hours.items() if seconds), key=lambda hour: (-hours[hour], hour))
+
+    responses = {
+        day: (count, total)
+        for day, count, total in ResponseTimeDaily.objects.filter(
+            user=user, day__gte=first_day, day__lte=last_day
+        ).values_list("day", "count", "total")
+    }
+    response_count = sum(count for count, _ in responses.values())
+    response_total = sum(total for _, total in responses.values())
+
+    return {
+        "user_id": str(user.id),
+        "time_range": time_range,
+        "engagement_score": user.engagement_score,
+        "time_in_status": {"daily": daily, "weekly": weekly},
+        "response_times": {
+            "count": response_count,
+            "average": int(response_total / response_count) if response_count else None,
+            "daily": [
+                {
+                    "date": day,
+                    "count": responses[day][0],
+                    "average": int(responses[day][1] / responses[day][0]),
+                }
+                for day in days
+                if day in responses
+            ],
+        },
+        "peak_activity_hours": peak_hours[:PEAK_HOURS],
+    }
@@ -0,0 +1,175 @@
+# analytics/engine.py
+import numpy as np
+from django.db import transaction
+from django.db.models.functions import ExtractHour, ExtractIsoWeekDay
+from django.utils import timezone
+from analytics.models import ResponseHistory, ResponseTimeBucket
+from presence.history import add_to_table
+
+STATUSES = ("online", "away", "offline", "busy")
+HOURS_PER_WEEK = 7 * 24
+# Log-spaced bins from 1 second to 7 days; bin 0 holds sub-second responses
+# and the last bin everything slower than a week.
+BIN_EDGES = np.concatenate(([0.0], np.geomspace(1, 7 * 86400, 64)))
+NUM_BINS = len(BIN_EDGES)
+HISTOGRAM_SHAPE = (len(STATUSES), HOURS_PER_WEEK, NUM_BINS)
+
+
+def bin_index(response_times):
+    return np.clip(np.searchsorted(BIN_EDGES, response_times, side="right") - 1, 0, NUM_BINS - 1)
+
+
+def hour_of_week(moment):
+    moment = timezone.localtime(moment)
+    return (moment.isoweekday() - 1) * 24 + moment.hour
+
+
+class ResponseTimeHistogram:
+    """
+    Response-time counts indexed by [status, hour_of_week, bin].
+
+    hour_of_week is 0 for Monday 00:00-01:00 in the active time zone.
+    """
+
+    def __init__(self, counts=None):
+        self.counts = np.zeros(HISTOGRAM_SHAPE, dtype=np.int64) if counts is None else counts
+
+    @classmethod
+    def for_user(cls, user_id):
+        """
+        Load a user's histogram from its ResponseTimeBucket rows. Read-only.
+        """
+        histogram = cls()
+        for status, hour, bucket, count in ResponseTimeBucket.objects.filter(user_id=user_id).values_list(
+            "presence_status", "hour_of_week", "bucket", "count"
+        ):
+            if status in STATUSES:
+                histogram.counts[STATUSES.index(status), hour, bucket] += count
+        return histogram
+
+    def add(self, statuses, hours_of_week, response_times):
+        """
+        Add a batch of responses given as parallel arrays.
+        """
+        status_index = np.full(len(statuses), -1, dtype=np.int64)
+        for index, status in enumerate(STATUSES):
+            status_index[statuses == status] = index
+        known = status_index >= 0
+        bins = bin_index(response_times[known])
+        np.add.at(self.counts, (status_index[known], hours_of_week[known], bins), 1)
+
+    def select(self, status=None, hour_of_week=None):
+        counts = self.counts
+        if status is not None:
+            counts = counts[STATUSES.index(status)]
+        else:
+            counts = counts.sum(axis=0)
+        if hour_of_week is not None:
+            return counts[hour_of_week]
+        return counts.sum(axis=0)
+
+    @staticmethod
+    def percentiles(counts, quantiles=(0.5, 0.9)):
+        """
+        Estimate quantiles (in seconds) from a 1-D bin count vector, using
+        linear interpolation inside the bin. Returns None for empty vectors.
+        """
+        total = counts.sum()
+        if not total:
+            return None
+        cumulative = np.cumsum(counts)
+        targets = np.asarray(quantiles) * total
+        bins = np.searchsorted(cumulative, targets, side="left")
+        before = np.where(bins > 0, cumulative[np.maximum(bins - 1, 0)], 0)
+        fraction = (targets - before) / counts[bins]
+        lower = BIN_EDGES[bins]
+        upper = BIN_EDGES[np.minimum(bins + 1, NUM_BINS - 1)]
+        return (lower + fraction * (upper - lower)).tolist()
+
+    def summarize(self, counts):
+        result = self.percentiles(counts)
+        if result is None:
+            return None
+        return {"count": int(counts.sum()), "p50": round(result[0]), "p90": round(result[1])}
+
+    def report(self):
+        by_status = {}
+        for status in STATUSES:
+            summary = self.summarize(self.select(status=status))
+            if summary:
+                by_status[status] = summary
+
+        by_hour = {}
+        per_hour = self.counts.sum(axis=0)
+        for hour_of_week in np.flatnonzero(per_hour.sum(axis=1)):
+            by_hour[int(hour_of_week)] = self.summarize(per_hour[hour_of_week])
+
+        return {
+            "overall": self.summarize(self.select()),
+            "by_status": by_status,
+            "by_hour_of_week": by_hour,
+        }
+
+
+def record_profile_response(user_id, presence_status, received_at, response_time):
+    """
+    Count one new response in the user's histogram: a single upsert that adds
+    1 to its bucket, in the same transaction as the ResponseHistory row.
+    """
+    if presence_status not in STATUSES:
+        return
+    add_to_table(
+        ResponseTimeBucket,
+        ["user", "presence_status", "hour_of_week", "bucket"],
+        [{
+            "user": user_id,
+            "presence_status": presence_status,
+            "hour_of_week": hour_of_week(received_at),
+            "bucket": int(bin_index(float(response_time))),
+            "count": 1,
+        }],
+    )
+
+
+def fetch_responses(user_id):
+    """
+    Pull a user's responses as columnar arrays with one values_list query;
+    hour of week is computed by the database.
+    """
+    rows = list(
+        ResponseHistory.objects.filter(user_id=user_id)
+        .annotate(weekday=ExtractIsoWeekDay("received_at"), hour=ExtractHour("received_at"))
+        .values_list("presence_status", "response_time", "weekday", "hour")
+    )
+    if not rows:
+        return None
+    statuses, response_times, weekdays, hours = zip(*rows)
+    return {
+        "statuses": np.array(statuses, dtype=object),
+        "response_times": np.array(response_times, dtype=np.float64),
+        "hours_of_week": (np.array(weekdays, dtype=np.int64) - 1) * 24 + np.array(hours, dtype=np.int64),
+    }
+
+
+def rebuild_profile(user_id):
+    """
+    Recompute a user's histogram buckets from ResponseHistory, e.g. after
+    history was edited, deleted or bulk-imported without signals.
+    """
+    histogram = ResponseTimeHistogram()
+    batch = fetch_responses(user_id)
+    if batch is not None:
+        histogram.add(batch["statuses"], batch["hours_of_week"], batch["response_times"])
+    with transaction.atomic():
+        ResponseTimeBucket.objects.filter(user_id=user_id).delete()
+        ResponseTimeBucket.objects.bulk_create(
+            ResponseTimeBucket(
+                user_id=user_id,
+                presence_status=STATUSES[status],
+                hour_of_week=hour,
+                bucket=bucket,
+                count=int(histogram.counts[status, hour, bucket]),
+            )
+            for status, hour, bucket in zip(*np.nonzero(histogram.counts))
+        )
+    return histogram
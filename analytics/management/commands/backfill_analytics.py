@@ -0,0 +1,38 @@
+# analytics/management/commands/backfill_analytics.py
+
+from django.core.management.base import BaseCommand
+
+from analytics.activity import rebuild_response_rollups
+from presence.history import rebuild_rollups
+from users.models import CustomUser
+
+
+class Command(BaseCommand):
+    help = (
+        'Rebuild the daily and hourly rollups behind the user analytics endpoint from presence '
+        'spans and response history, e.g. after bulk imports that skip the save signals.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user-id', type=str, help='Only backfill this user')
+        parser.add_argument('--batch-size', type=int, default=500, help='Users per transaction')
+
+    def handle(self, *args, **options):
+        users = CustomUser.objects.order_by('id').values_list('id', flat=True)
+        if options['user_id']:
+            users = users.filter(id=options['user_id'])
+        after = None
+        totals = {'users': 0, 'presence': 0, 'responses': 0}
+        while True:
+            batch = list((users.filter(id__gt=after) if after else users)[:options['batch_size']])
+            if not batch:
+                break
+            after = batch[-1]
+            totals['presence'] += rebuild_rollups(batch)
+            totals['responses'] += rebuild_response_rollups(batch)
+            totals['users'] += len(batch)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Backfilled {totals["presence"]} daily presence rollups and {totals["responses"]} '
+            f'daily response rollups for {totals["users"]} users'
+        ))
@@ -0,0 +1,308 @@
+# analytics/management/commands/benchmark.py
+
+from datetime import datetime, timezone as dt_timezone
+from io import StringIO
+import asyncio
+import json
+import platform
+import subprocess
+import time
+
+import django
+import numpy as np
+from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+from django.urls import reverse
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+from users.models import CustomUser
+from presence.buffer import get_presence_buffer
+from presence.dispatch import dispatcher
+from presence.middleware import JWTAuthMiddleware
+from presence.models import Presence
+from presence.routing import websocket_urlpatterns
+from presence.store import get_presence_store
+from analytics.management.commands.generate_response_data import generate_chunk
+
+SCENARIOS = ['presence', 'analytics', 'websocket', 'auth']
+CHANNEL_LAYER_BACKENDS = {
+    'inmemory': 'channels.layers.InMemoryChannelLayer',
+    'local': 'presence.layers.LocalChannelLayer',
+}
+PASSWORD = 'Bench123!@#'
+
+
+def summarize(samples):
+    """
+    Latency percentiles in milliseconds for a list of durations in seconds.
+    """
+    if not samples:
+        return None
+    values = np.asarray(samples) * 1000
+    return {
+        'p50': round(float(np.percentile(values, 50)), 3),
+        'p90': round(float(np.percentile(values, 90)), 3),
+        'p99': round(float(np.percentile(values, 99)), 3),
+        'mean': round(float(values.mean()), 3),
+        'max': round(float(values.max()), 3),
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True, cwd=settings.BASE_DIR
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark the presence, analytics, WebSocket and auth hot paths against a throwaway '
+        'test database and print the results as JSON'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--scenarios', type=str, default=','.join(SCENARIOS),
+            help=f'Comma-separated scenarios to run ({", ".join(SCENARIOS)})',
+        )
+        parser.add_argument(
+            '--history-sizes', type=str, default='100,1000,10000',
+            help='Comma-separated presence/response history sizes for the REST scenarios',
+        )
+        parser.add_argument('--iterations', type=int, default=200, help='Requests or messages per measurement')
+        parser.add_argument('--auth-iterations', type=int, default=20, help='Logins and registrations to time')
+        parser.add_argument('--listeners', type=int, default=20, help='WebSocket listeners for the broadcast scenario')
+        parser.add_argument('--seed', type=int, default=0, help='Seed for generated history')
+        parser.add_argument(
+            '--channel-layer', choices=sorted(CHANNEL_LAYER_BACKENDS), default='inmemory',
+            help='In-process channel layer for the WebSocket scenario',
+        )
+        parser.add_argument('--output', type=str, help='Write the JSON report to this file instead of stdout')
+
+    def handle(self, *args, **options):
+        scenarios = [name.strip() for name in options['scenarios'].split(',') if name.strip()]
+        unknown = set(scenarios) - set(SCENARIOS)
+        if unknown:
+            raise CommandError(f'Unknown scenarios: {", ".join(sorted(unknown))}')
+        self.options = options
+        self.history_sizes = [int(size) for size in options['history_sizes'].split(',') if size.strip()]
+        self.results = []
+
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            with override_settings(
+                CHANNEL_LAYERS={'default': {
+                    'BACKEND': CHANNEL_LAYER_BACKENDS[options['channel_layer']],
+                    'CONFIG': {'capacity': max(options['iterations'] * 2, 100)},
+                }},
+                PRESENCE_STORE={'BACKEND': 'presence.store.LocalPresenceStore'},
+                # Measure the hot paths, not the rate limits: no API throttles
+                # and no per-user WebSocket message rate.
+                REST_FRAMEWORK={
+                    **settings.REST_FRAMEWORK,
+                    'DEFAULT_THROTTLE_CLASSES': [],
+                    'DEFAULT_THROTTLE_RATES': {
+                        **settings.REST_FRAMEWORK.get('DEFAULT_THROTTLE_RATES', {}), 'websocket': None,
+                    },
+                },
+            ):
+                self.client = APIClient(raise_request_exception=False)
+                self.staff = CustomUser.objects.create_user(
+                    email='bench-staff@example.com', username='bench_staff', password=PASSWORD,
+                    is_staff=True, is_verified=True,
+                )
+                self.client.force_authenticate(self.staff)
+                for name in scenarios:
+                    getattr(self, f'bench_{name}')()
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        report = json.dumps({
+            'meta': {
+                'revision': git_revision(),
+                'timestamp': datetime.now(dt_timezone.utc).isoformat(),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+                'iterations': options['iterations'],
+            },
+            'results': self.results,
+        }, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as report_file:
+                report_file.write(report)
+            self.stderr.write(self.style.SUCCESS(f'Wrote {len(self.results)} results to {options["output"]}'))
+        else:
+            self.stdout.write(report)
+
+    def record(self, name, params, samples, errors=0, elapsed=None, operations=None):
+        result = {
+            'name': name,
+            'params': params,
+            'iterations': len(samples) if operations is None else operations,
+            'errors': errors,
+            'latency_ms': summarize(samples),
+        }
+        if elapsed:
+            result['throughput_per_s'] = round((operations or len(samples)) / elapsed, 2)
+        self.results.append(result)
+        self.stderr.write(f'{name} {params}: {result.get("latency_ms")} ({errors} errors)')
+
+    def time_requests(self, request, before_each=None):
+        samples, errors = [], 0
+        started = time.perf_counter()
+        for _ in range(self.options['iterations']):
+            if before_each:
+                before_each()
+            start = time.perf_counter()
+            response = request()
+            samples.append(time.perf_counter() - start)
+            errors += response.status_code >= 400
+        return samples, errors, time.perf_counter() - started
+
+    def user_with_history(self, size):
+        user = CustomUser.objects.filter(email=f'bench-{size}@example.com').first()
+        if user:
+            return user
+        user = CustomUser.objects.create_user(
+            email=f'bench-{size}@example.com', username=f'bench_{size}', password=PASSWORD, is_verified=True
+        )
+        generate_chunk(([user.id], self.options['seed'] + size, {
+            'days': 30,
+            'batch_size': 5000,
+            'presence_per_user': size,
+            'responses_per_user': size,
+            'distribution': 'lognormal',
+            'min_delay': 5,
+            'max_delay': 7200,
+            'status_weights': [0.25, 0.25, 0.25, 0.25],
+        }))
+        call_command('rebuild_response_stats', user_id=str(user.id), stdout=StringIO())
+        Presence.objects.create(user=user, status='online', device_type='desktop')
+        return user
+
+    def bench_presence(self):
+        store = get_presence_store()
+        for size in self.history_sizes:
+            user = self.user_with_history(size)
+            url = reverse('user-presence', kwargs={'userId': user.id})
+            for cache in ('warm', 'cold'):
+                before_each = (lambda: store.delete(user.id)) if cache == 'cold' else None
+                samples, errors, elapsed = self.time_requests(lambda: self.client.get(url), before_each)
+                self.record('presence.user_presence', {'history_size': size, 'cache': cache}, samples, errors, elapsed)
+
+    def bench_analytics(self):
+        for size in self.history_sizes:
+            user = self.user_with_history(size)
+            url = reverse('response-time-prediction', kwargs={'userId': user.id})
+            samples, errors, elapsed = self.time_requests(lambda: self.client.get(url))
+            self.record('analytics.response_time_prediction', {'history_size': size}, samples, errors, elapsed)
+
+    def bench_auth(self):
+        count = self.options['auth_iterations']
+        client = APIClient(raise_request_exception=False)
+
+        users = [
+            CustomUser.objects.create_user(
+                email=f'bench-login-{i}@example.com', username=f'bench_login_{i}', password=PASSWORD, is_verified=True
+            )
+            for i in range(count)
+        ]
+        samples, errors = [], 0
+        started = time.perf_counter()
+        for user in users:
+            start = time.perf_counter()
+            response = client.post(reverse('login'), {'email': user.email, 'password': PASSWORD}, format='json')
+            samples.append(time.perf_counter() - start)
+            errors += response.status_code >= 400
+        self.record('auth.login', {}, samples, errors, time.perf_counter() - started)
+
+        samples, errors = [], 0
+        started = time.perf_counter()
+        for i in range(count):
+            payload = {'email': f'bench-register-{i}@example.com', 'username': f'bench_register_{i}', 'password': PASSWORD}
+            start = time.perf_counter()
+            response = client.post(reverse('register'), payload, format='json')
+            samples.append(time.perf_counter() - start)
+            errors += response.status_code >= 400
+        self.record('auth.register', {}, samples, errors, time.perf_counter() - started)
+
+    def bench_websocket(self):
+        async_to_sync(self.bench_websocket_async)()
+
+    async def bench_websocket_async(self):
+        iterations = self.options['iterations']
+        application = JWTAuthMiddleware(URLRouter(websocket_urlpatterns))
+        user = await database_sync_to_async(CustomUser.objects.create_user)(
+            email='bench-ws@example.com', username='bench_ws', password=PASSWORD, is_verified=True
+        )
+        await database_sync_to_async(Presence.objects.create)(user=user, status='online', device_type='desktop')
+        path = f'/ws/presence/{user.id}/?token={AccessToken.for_user(user)}'
+
+        # Connect: authenticate, join the group and receive the snapshot
+        samples, errors = [], 0
+        started = time.perf_counter()
+        for _ in range(iterations):
+            communicator = WebsocketCommunicator(application, path)
+            start = time.perf_counter()
+            connected, _ = await communicator.connect()
+            if connected:
+                await communicator.receive_json_from()
+            samples.append(time.perf_counter() - start)
+            errors += not connected
+            await communicator.disconnect()
+        self.record('websocket.connect', {}, samples, errors, time.perf_counter() - started)
+
+        # Update: client frames through the write buffer, including the flush
+        communicator = WebsocketCommunicator(application, path)
+        await communicator.connect()
+        await communicator.receive_json_from()
+        buffer = get_presence_buffer()
+        statuses = ['busy', 'away', 'online']  # never repeats, so nothing is coalesced
+        queued_before = buffer.written_count + len(buffer.pending)
+        started = time.perf_counter()
+        for i in range(iterations):
+            await communicator.send_json_to({'type': 'presence_update', 'data': {'status': statuses[i % 3]}})
+        while buffer.written_count + len(buffer.pending) - queued_before < iterations:
+            if time.perf_counter() - started > 60:
+                raise CommandError('Timed out waiting for presence updates to be queued')
+            await asyncio.sleep(0.001)
+        await buffer.flush()
+        elapsed = time.perf_counter() - started
+        self.record('websocket.update', {}, [], 0, elapsed, operations=iterations)
+        await communicator.disconnect()
+
+        # Broadcast: one dispatch fanned out to every listener
+        staff_token = AccessToken.for_user(self.staff)
+        listeners = []
+        for _ in range(self.options['listeners']):
+            listener = WebsocketCommunicator(application, f'/ws/presence/{user.id}/?token={staff_token}')
+            await listener.connect()
+            await listener.receive_json_from()
+            listeners.append(listener)
+        presences = [Presence(user=user, status=statuses[i % 3], device_type='desktop') for i in range(iterations)]
+        await database_sync_to_async(Presence.objects.bulk_create)(presences)
+        started = time.perf_counter()
+        await database_sync_to_async(dispatcher.dispatch)(presences)
+        for listener in listeners:
+            for _ in range(iterations):
+                await listener.receive_json_from(timeout=5)
+        elapsed = time.perf_counter() - started
+        self.record(
+            'websocket.broadcast', {'listeners': len(listeners), 'channel_layer': self.options['channel_layer']},
+            [], 0, elapsed, operations=iterations * len(listeners),
+        )
+        for listener in listeners:
+            await listener.disconnect()
@@ -1,59 +1,277 @@
 # analytics/management/commands/generate_response_data.py
 
-from django.core.management.base import BaseCommand
-from django.utils import timezone
-import random
+from datetime import timedelta
+import multiprocessing
+import time
 import uuid
+
+import numpy as np
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections, transaction
+from django.utils import timezone
 from users.models import CustomUser
+from presence.history import rebuild_spans
 from presence.models import Presence
+from analytics.activity import rebuild_response_rollups
 from analytics.models import ResponseHistory
 
+STATUSES = ['online', 'offline', 'away', 'busy']
+DISTRIBUTIONS = ['uniform', 'lognormal', 'exponential']
+
+
+def parse_weights(value):
+    """
+    Parse "online=4,away=1,busy=1,offline=2" into probabilities in STATUSES order.
+    """
+    weights = dict.fromkeys(STATUSES, 0.0)
+    for part in value.split(','):
+        status, _, weight = part.partition('=')
+        if status.strip() not in weights:
+            raise CommandError(f'Unknown status in --status-weights: {status}')
+        weights[status.strip()] = float(weight)
+    total = sum(weights.values())
+    if total <= 0:
+        raise CommandError('--status-weights must not all be zero')
+    return [weights[status] / total for status in STATUSES]
+
+
+def response_delays(rng, size, distribution, min_delay, max_delay):
+    """
+    Response delays in seconds, clipped to [min_delay, max_delay].
+    """
+    if distribution == 'lognormal':
+        # Median around a tenth of the range, with a long tail
+        delays = rng.lognormal(mean=np.log(min_delay + (max_delay - min_delay) / 10), sigma=1.0, size=size)
+    elif distribution == 'exponential':
+        delays = min_delay + rng.exponential(scale=(max_delay - min_delay) / 4, size=size)
+    else:
+        delays = rng.integers(min_delay, max_delay, size=size, endpoint=True)
+    return np.clip(delays, min_delay, max_delay).astype(np.int64)
+
+
+def generate_chunk(task):
+    """
+    Generate and bulk insert presence and response history for one chunk of
+    users. Runs in the main process or in a worker.
+    """
+    user_ids, seed, options = task
+    rng = np.random.default_rng(seed)
+    now = timezone.now()
+    window = options['days'] * 86400
+    batch_size = options['batch_size']
+    status_weights = options['status_weights']
+    created = {'presence': 0, 'responses': 0}
+
+    presences = []
+    responses = []
+    for user_id in user_ids:
+        count = options['presence_per_user']
+        if count:
+            offsets = np.sort(rng.integers(0, window, size=count))[::-1]
+            statuses = rng.choice(STATUSES, size=count, p=status_weights)
+            devices = rng.choice(['desktop', 'mobile', 'tablet'], size=count)
+            for offset, status, device in zip(offsets, statuses, devices):
+                presences.append(Presence(
+                    user_id=user_id,
+                    status=status,
+                    device_type=device,
+                    last_seen=now - timedelta(seconds=int(offset)),
+                ))
+
+        count = options['responses_per_user']
+        if count:
+            received_offsets = rng.integers(options['max_delay'], window, size=count)
+            delays = response_delays(rng, count, options['distribution'], options['min_delay'], options['max_delay'])
+            statuses = rng.choice(STATUSES, size=count, p=status_weights)
+            message_ids = rng.integers(0, 2 ** 63, size=(count, 2), dtype=np.uint64)
+            for offset, delay, status, (high, low) in zip(received_offsets, delays, statuses, message_ids):
+                received_at = now - timedelta(seconds=int(offset))
+                responses.append(ResponseHistory(
+                    user_id=user_id,
+                    message_id=str(uuid.UUID(int=(int(high) << 64) | int(low))),
+                    received_at=received_at,
+                    responded_at=received_at + timedelta(seconds=int(delay)),
+                    presence_status=status,
+                    response_time=int(delay),
+                ))
+
+        if len(presences) >= batch_size:
+            created['presence'] += flush(Presence, presences, batch_size)
+        if len(responses) >= batch_size:
+            created['responses'] += flush(ResponseHistory, responses, batch_size)
+
+    created['presence'] += flush(Presence, presences, batch_size)
+    created['responses'] += flush(ResponseHistory, responses, batch_size)
+    return created
+
+
+def insert_presence(objects, batch_size):
+    """
+    INSERT presence rows with the generated last_seen values. bulk_create()
+    would stamp every row with the current time, because Presence.last_seen
+    is auto_now_add, and putting the timestamps back would rewrite each row.
+    """
+    fields = [field for field in Presence._meta.concrete_fields if not field.primary_key]
+    quote = connection.ops.quote_name
+    columns = ', '.join(quote(field.column) for field in fields)
+    batch_size = min(batch_size, connection.ops.bulk_batch_size(fields, objects))
+    with transaction.atomic(), connection.cursor() as cursor:
+        for start in range(0, len(objects), batch_size):
+            batch = objects[start:start + batch_size]
+            values = connection.ops.bulk_insert_sql(fields, [['%s'] * len(fields)] * len(batch))
+            params = [field.get_db_prep_save(getattr(obj, field.attname), connection) for obj in batch for field in fields]
+            cursor.execute(f'INSERT INTO {quote(Presence._meta.db_table)} ({columns}) {values}', params)
+
+
+def flush(model, objects, batch_size):
+    if not objects:
+        return 0
+    if model is Presence:
+        insert_presence(objects, batch_size)
+    else:
+        model.objects.bulk_create(objects, batch_size=batch_size)
+    count = len(objects)
+    objects.clear()
+    return count
+
+
 class Command(BaseCommand):
-    help = 'Generate fake response history data for users'
+    help = 'Generate fake users, presence history and response history data for load testing'
 
     def add_arguments(self, parser):
-        parser.add_argument('--user-id', type=str, help='UUID of the user to generate data for')
+        parser.add_argument('--user-id', type=str, help='UUID of an existing user to generate data for')
+        parser.add_argument('--users', type=int, default=0, help='Number of new users to create')
+        parser.add_argument('--prefix', type=str, default='loadtest', help='Email/username prefix for new users')
+        parser.add_argument('--presence-per-user', type=int, default=None, help='Presence history rows per user')
+        parser.add_argument('--responses-per-user', type=int, default=10, help='Response history rows per user')
+        parser.add_argument('--days', type=int, default=30, help='Spread generated history over this many days')
+        parser.add_argument('--distribution', choices=DISTRIBUTIONS, default='uniform', help='Response delay distribution')
+        parser.add_argument('--min-delay', type=int, default=60, help='Shortest response delay in seconds')
+        parser.add_argument('--max-delay', type=int, default=7200, help='Longest response delay in seconds')
+        parser.add_argument(
+            '--status-weights', type=str, default='online=1,offline=1,away=1,busy=1',
+            help='Relative status frequencies, e.g. online=4,away=1,busy=1,offline=2',
+        )
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows per bulk insert')
+        parser.add_argument('--seed', type=int, default=None, help='Seed for reproducible data')
+        parser.add_argument('--workers', type=int, default=1, help='Worker processes for history generation')
+        parser.add_argument(
+            '--rebuild-stats', action='store_true',
+            help='Rebuild response statistics, presence spans and rollups afterwards (bulk inserts skip the save signals)',
+        )
 
     def handle(self, *args, **options):
-        user_id = options['user_id']
-        if not user_id:
-            self.stdout.write(self.style.ERROR('Please provide a user ID using --user-id'))
+        if not options['user_id'] and not options['users']:
+            self.stdout.write(self.style.ERROR('Please provide a user ID using --user-id or a number of users using --users'))
             return
+        if options['min_delay'] > options['max_delay']:
+            raise CommandError('--min-delay must not be greater than --max-delay')
+        if options['days'] * 86400 <= options['max_delay']:
+            raise CommandError('--days must cover more than --max-delay')
+
+        seed_sequence = np.random.SeedSequence(options['seed'])
+        user_seed, history_seed = seed_sequence.spawn(2)
+
+        if options['user_id']:
+            try:
+                user = CustomUser.objects.get(id=options['user_id'])
+            except CustomUser.DoesNotExist:
+                self.stdout.write(self.style.ERROR(f'User with ID {options["user_id"]} not found'))
+                return
+            user_ids = [user.id]
+            presence_per_user = options['presence_per_user'] or 0
+        else:
+            user_ids = self.create_users(options, np.random.default_rng(user_seed))
+            presence_per_user = 20 if options['presence_per_user'] is None else options['presence_per_user']
+
+        chunk_options = {
+            'days': options['days'],
+            'batch_size': options['batch_size'],
+            'presence_per_user': presence_per_user,
+            'responses_per_user': options['responses_per_user'],
+            'distribution': options['distribution'],
+            'min_delay': options['min_delay'],
+            'max_delay': options['max_delay'],
+            'status_weights': parse_weights(options['status_weights']),
+        }
+        rows_per_user = max(presence_per_user + options['responses_per_user'], 1)
+        chunk_users = max(options['batch_size'] // rows_per_user, 1)
+        chunks = [user_ids[i:i + chunk_users] for i in range(0, len(user_ids), chunk_users)]
+        tasks = [
+            (chunk, seed, chunk_options)
+            for chunk, seed in zip(chunks, history_seed.spawn(len(chunks)))
+        ]
+
+        started = time.monotonic()
+        totals = {'presence': 0, 'responses': 0}
+        for created in self.run_tasks(tasks, options['workers']):
+            totals['presence'] += created['presence']
+            totals['responses'] += created['responses']
+        elapsed = time.monotonic() - started
+
+        if options['rebuild_stats']:
+            call_command('rebuild_response_stats', stdout=self.stdout)
+            call_command('rebuild_response_profiles', stdout=self.stdout)
+            # Bulk-inserted presence rows have no spans; without them the
+            # rollups miss these users and compaction would drop their rows
+            # unsummarised. rebuild_spans() also rebuilds the rollups.
+            for i in range(0, len(user_ids), 500):
+                batch = user_ids[i:i + 500]
+                if presence_per_user:
+                    rebuild_spans(batch)
+                rebuild_response_rollups(batch)
+
+        if options['user_id']:
+            self.stdout.write(self.style.SUCCESS(
+                f'Successfully generated {totals["responses"]} response history records for user {user.email}'
+            ))
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f'Generated {len(user_ids)} users, {totals["presence"]} presence rows and '
+                f'{totals["responses"]} response history rows in {elapsed:.1f}s'
+            ))
+
+    def create_users(self, options, rng):
+        # Hash the shared password once; hashing per user would dominate the run.
+        password = make_password('LoadTest123!')
+        prefix = options['prefix']
+        if CustomUser.objects.filter(email__startswith=f'{prefix}-').exists():
+            raise CommandError(f'Users with prefix "{prefix}" already exist; pass a different --prefix')
+
+        # Same seed and prefix give the same IDs; a new prefix gives new ones.
+        namespace = uuid.UUID(bytes=rng.bytes(16))
+        user_ids = []
+        users = []
+        for index in range(options['users']):
+            user_id = uuid.uuid5(namespace, f'{prefix}-{index}')
+            user_ids.append(user_id)
+            users.append(CustomUser(
+                id=user_id,
+                email=f'{prefix}-{index}@example.com',
+                username=f'{prefix}_{index}',
+                password=password,
+                is_active=True,
+                is_verified=True,
+                verification_token=None,
+            ))
+            if len(users) >= options['batch_size']:
+                CustomUser.objects.bulk_create(users)
+                users = []
+        if users:
+            CustomUser.objects.bulk_create(users)
+        return user_ids
 
-        try:
-            user = CustomUser.objects.get(id=user_id)
-        except CustomUser.DoesNotExist:
-            self.stdout.write(self.style.ERROR(f'User with ID {user_id} not found'))
+    def run_tasks(self, tasks, workers):
+        if workers <= 1 or len(tasks) <= 1:
+            for task in tasks:
+                yield generate_chunk(task)
             return
 
-        # Get the user's current presence status
-        presence, created = Presence.objects.get_or_create(user=user)
-
-        # Generate 10 fake response records
-        for _ in range(10):
-            # Simulate a message received within the last 30 days
-            days_ago = random.randint(1, 30)
-            hours_ago = random.randint(0, 23)
-            minutes_ago = random.randint(0, 59)
-            received_at = timezone.now() - timezone.timedelta(
-                days=days_ago, hours=hours_ago, minutes=minutes_ago
-            )
-
-            # Simulate response time (between 1 minute and 2 hours)
-            response_delay = random.randint(60, 7200)  # Seconds (1 min to 2 hours)
-            responded_at = received_at + timezone.timedelta(seconds=response_delay)
-
-            # Simulate presence status at the time of response
-            possible_statuses = ['online', 'offline', 'away', 'busy']
-            simulated_status = random.choice(possible_statuses)
-
-            ResponseHistory.objects.create(
-                user=user,
-                message_id=str(uuid.uuid4()),
-                received_at=received_at,
-                responded_at=responded_at,
-                presence_status=simulated_status,
-                response_time=response_delay
-            )
-
-        self.stdout.write(self.style.SUCCESS(f'Successfully generated 10 response history records for user {user.email}'))
\ No newline at end of file
+        if connection.vendor == 'sqlite':
+            self.stdout.write(self.style.WARNING('SQLite allows a single writer; extra workers will mostly wait on locks'))
+        # Children must open their own database connections.
+        connections.close_all()
+        with multiprocessing.get_context('fork').Pool(workers) as pool:
+            yield from pool.imap_unordered(generate_chunk, tasks)
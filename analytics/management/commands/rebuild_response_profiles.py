@@ -0,0 +1,24 @@
+# analytics/management/commands/rebuild_response_profiles.py
+
+from django.core.management.base import BaseCommand
+from analytics.engine import rebuild_profile
+from analytics.models import ResponseHistory
+
+class Command(BaseCommand):
+    help = 'Rebuild the response-time percentile histograms from ResponseHistory'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user-id', type=str, help='Only rebuild this user')
+
+    def handle(self, *args, **options):
+        if options['user_id']:
+            user_ids = [options['user_id']]
+        else:
+            user_ids = ResponseHistory.objects.values_list('user_id', flat=True).distinct().iterator()
+
+        rebuilt = 0
+        for user_id in user_ids:
+            rebuild_profile(user_id)
+            rebuilt += 1
+
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {rebuilt} response-time profiles'))
@@ -0,0 +1,53 @@
+# analytics/management/commands/rebuild_response_stats.py
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, FloatField, Sum
+from django.db.models.functions import Cast
+from analytics.models import ResponseHistory, ResponseTimeStats
+from analytics.predictions import get_prediction_settings
+
+class Command(BaseCommand):
+    help = 'Rebuild the running response-time statistics from ResponseHistory'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user-id', type=str, help='Only rebuild statistics for this user')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows per bulk insert')
+
+    def handle(self, *args, **options):
+        history = ResponseHistory.objects.all()
+        stats = ResponseTimeStats.objects.all()
+        if options['user_id']:
+            history = history.filter(user_id=options['user_id'])
+            stats = stats.filter(user_id=options['user_id'])
+
+        response_time = Cast('response_time', FloatField())
+        rows = {
+            (row['user'], row['presence_status']): ResponseTimeStats(
+                user_id=row['user'],
+                presence_status=row['presence_status'],
+                count=row['count'],
+                total=row['total'],
+                total_squares=row['total_squares'],
+            )
+            for row in history.values('user', 'presence_status').annotate(
+                count=Count('id'),
+                total=Sum(response_time),
+                total_squares=Sum(response_time * response_time),
+            )
+        }
+
+        # The decayed mean depends on order, so stream the history once.
+        alpha = get_prediction_settings()['EWMA_ALPHA']
+        ordered = history.order_by('user', 'presence_status', 'responded_at').values_list(
+            'user', 'presence_status', 'response_time'
+        )
+        for user_id, presence_status, value in ordered.iterator(chunk_size=options['batch_size']):
+            row = rows[(user_id, presence_status)]
+            row.ewma = value if row.ewma is None else row.ewma * (1 - alpha) + alpha * value
+
+        with transaction.atomic():
+            stats.delete()
+            ResponseTimeStats.objects.bulk_create(rows.values(), batch_size=options['batch_size'])
+
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {len(rows)} response-time statistics rows'))
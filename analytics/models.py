@@ -21,4 +21,92 @@ class ResponseHistory(models.Model):
         super().save(*args, **kwargs)
 
     def __str__(self):
-        return f"{self.user.email} - Message {self.message_id} - {self.response_time}s"
\ No newline at end of file
+        return f"{self.user.email} - Message {self.message_id} - {self.response_time}s"
+
+class ResponseTimeStats(models.Model):
+    """
+    Running response-time statistics per user and presence status, kept up to
+    date as ResponseHistory rows are saved so predictions never have to
+    aggregate a user's whole history.
+    """
+    user = models.ForeignKey(
+        CustomUser,
+        on_delete=models.CASCADE,
+        related_name='response_time_stats'
+    )
+    presence_status = models.CharField(max_length=10)
+    count = models.PositiveIntegerField(default=0)
+    total = models.FloatField(default=0.0)  # Sum of response times in seconds
+    total_squares = models.FloatField(default=0.0)  # Sum of squared response times
+    ewma = models.FloatField(null=True, blank=True)  # Exponentially decayed mean
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'presence_status'], name='unique_response_stats_per_status'),
+        ]
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+    @property
+    def variance(self):
+        if self.count < 2:
+            return None
+        return max(self.total_squares / self.count - self.mean ** 2, 0.0)
+
+    def __str__(self):
+        return f"{self.user.email} - {self.presence_status} - {self.count} responses"
+
+
+class ResponseTimeBucket(models.Model):
+    """
+    One cell of a user's response-time histogram: how many responses given
+    in ``presence_status`` during ``hour_of_week`` fell into ``bucket`` (see
+    analytics.engine). Added to as ResponseHistory rows are saved, so reads
+    never have to fold in new history.
+    """
+    user = models.ForeignKey(
+        CustomUser,
+        on_delete=models.CASCADE,
+        related_name='response_time_buckets'
+    )
+    presence_status = models.CharField(max_length=10)
+    hour_of_week = models.PositiveSmallIntegerField()  # 0 = Monday 00:00-01:00
+    bucket = models.PositiveSmallIntegerField()
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'presence_status', 'hour_of_week', 'bucket'], name='unique_response_time_bucket'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.user.email} - {self.presence_status} - hour {self.hour_of_week} - {self.count} responses"
+
+
+class ResponseTimeDaily(models.Model):
+    """
+    Per-user, per-day response count and total response time, added to as
+    ResponseHistory rows are saved. Feeds the response-time trend of the
+    user analytics endpoint.
+    """
+    user = models.ForeignKey(
+        CustomUser,
+        on_delete=models.CASCADE,
+        related_name='response_time_daily'
+    )
+    day = models.DateField()
+    count = models.PositiveIntegerField(default=0)
+    total = models.FloatField(default=0.0)  # Sum of response times in seconds
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'day'], name='unique_response_time_daily'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.email} - {self.day} - {self.count} responses"
@@ -0,0 +1,124 @@
+# analytics/predictions.py
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Case, F, FloatField, Value, When
+from django.utils import timezone
+from analytics.models import ResponseTimeStats
+
+DEFAULT_PREDICTION = 600  # 10 minutes, used when a user has no history
+MIN_STATUS_SAMPLES = 5  # Responses needed before a status-specific prediction is trusted
+IDLE_SESSION_SECONDS = 3600  # Sessions longer than this are treated as possibly idle
+IDLE_FACTOR = 1.2
+
+
+def get_prediction_settings():
+    config = getattr(settings, "RESPONSE_TIME_PREDICTION", {})
+    return {
+        "EWMA_ALPHA": config.get("EWMA_ALPHA", 0.1),
+        "USE_EWMA": config.get("USE_EWMA", False),
+    }
+
+
+def record_response(user_id, presence_status, response_time):
+    """
+    Fold one response into the user's running statistics with a single
+    atomic UPDATE (plus an INSERT the first time a status is seen).
+    """
+    alpha = get_prediction_settings()["EWMA_ALPHA"]
+    value = float(response_time)
+    updates = {
+        "count": F("count") + 1,
+        "total": F("total") + value,
+        "total_squares": F("total_squares") + value * value,
+        "ewma": Case(
+            When(ewma__isnull=True, then=Value(value)),
+            default=F("ewma") * (1 - alpha) + alpha * value,
+            output_field=FloatField(),
+        ),
+    }
+    stats = ResponseTimeStats.objects.filter(user_id=user_id, presence_status=presence_status)
+    if stats.update(**updates):
+        return
+    try:
+        with transaction.atomic():
+            ResponseTimeStats.objects.create(
+                user_id=user_id,
+                presence_status=presence_status,
+                count=1,
+                total=value,
+                total_squares=value * value,
+                ewma=value,
+            )
+    except IntegrityError:
+        # Another writer created the row first.
+        stats.update(**updates)
+
+
+def predict_from_stats(stats, current_status):
+    """
+    Predict a response time in seconds from a user's ResponseTimeStats rows.
+
+    Returns None when the user has no history at all.
+    """
+    stats = list(stats)
+    total_count = sum(row.count for row in stats)
+    if not total_count:
+        return None
+
+    status_stats = next((row for row in stats if row.presence_status == current_status), None)
+    if status_stats and status_stats.count >= MIN_STATUS_SAMPLES:
+        # Enough data for a status-specific prediction
+        if get_prediction_settings()["USE_EWMA"] and status_stats.ewma is not None:
+            return status_stats.ewma
+        return status_stats.mean
+
+    # Fall back to overall average
+    return sum(row.total for row in stats) / total_count
+
+
+def get_session_durations(current_statuses):
+    """
+    Seconds each user has been in their current status, read from their
+    open presence span. ``current_statuses`` maps user_id -> status.
+    """
+    from presence.models import PresenceSpan
+
+    now = timezone.now()
+    rows = PresenceSpan.objects.filter(
+        user_id__in=list(current_statuses), ended_at__isnull=True
+    ).values_list("user_id", "status", "started_at")
+    durations = {}
+    for user_id, status, started_at in rows:
+        user_id = str(user_id)
+        if current_statuses.get(user_id) == status:
+            durations[user_id] = int((now - started_at).total_seconds())
+    return durations
+
+
+def predict_response_times(current_statuses):
+    """
+    Predicted response time in seconds for every user in ``current_statuses``
+    (user_id -> status), computed with a fixed number of queries regardless
+    of how many users are asked for.
+    """
+    current_statuses = {str(user_id): status for user_id, status in current_statuses.items()}
+    stats_by_user = defaultdict(list)
+    for row in ResponseTimeStats.objects.filter(user_id__in=list(current_statuses)):
+        stats_by_user[str(row.user_id)].append(row)
+    durations = get_session_durations(current_statuses)
+
+    predictions = {}
+    for user_id, status in current_statuses.items():
+        predicted_time = predict_from_stats(stats_by_user[user_id], status)
+        if predicted_time is None:
+            # No historical data; return a default prediction
+            predictions[user_id] = DEFAULT_PREDICTION
+            continue
+        # If the user has been in the current status for a long time they
+        # might be idle, so increase the predicted time
+        if durations.get(user_id, 0) > IDLE_SESSION_SECONDS:
+            predicted_time *= IDLE_FACTOR
+        predictions[user_id] = int(predicted_time)
+    return predictions
@@ -1,3 +1,4 @@
+from django.conf import settings
 from rest_framework import serializers
 
 class ResponseTimePredictionSerializer(serializers.Serializer):
@@ -16,4 +17,14 @@ class ResponseTimePredictionSerializer(serializers.Serializer):
         else:
             hours = seconds // 3600
             representation['predicted_response_time_display'] = f"{hours} hour{'s' if hours != 1 else ''}"
-        return representation
\ No newline at end of file
+        return representation
+
+class UserResponseTimePredictionSerializer(ResponseTimePredictionSerializer):
+    user_id = serializers.CharField()
+
+class BatchResponseTimePredictionRequestSerializer(serializers.Serializer):
+    user_ids = serializers.ListField(
+        child=serializers.UUIDField(),
+        allow_empty=False,
+        max_length=getattr(settings, "RESPONSE_TIME_PREDICTION_MAX_IDS", 1000),
+    )
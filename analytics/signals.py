@@ -0,0 +1,18 @@
+# analytics/signals.py
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from analytics.models import ResponseHistory
+from analytics.activity import record_daily_response
+from analytics.engine import record_profile_response
+from analytics.predictions import record_response
+
+@receiver(post_save, sender=ResponseHistory)
+def update_response_time_stats(sender, instance, created, **kwargs):
+    # Only new rows are folded in; run rebuild_response_stats and
+    # rebuild_response_profiles after editing or deleting history.
+    if created:
+        record_response(instance.user_id, instance.presence_status, instance.response_time)
+        record_daily_response(instance.user_id, instance.responded_at, instance.response_time)
+        record_profile_response(
+            instance.user_id, instance.presence_status, instance.received_at, instance.response_time
+        )
@@ -1,3 +1,243 @@
-from django.test import TestCase
+from datetime import timedelta
+from io import StringIO
 
-# Create your tests here.
+import numpy as np
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from presence.history import day_start
+from presence.models import Presence, PresenceDailySummary, PresenceSpan
+from users.models import CustomUser
+from .engine import ResponseTimeHistogram, rebuild_profile
+from .management.commands.benchmark import summarize
+from .models import ResponseHistory, ResponseTimeBucket, ResponseTimeDaily, ResponseTimeStats
+from .predictions import DEFAULT_PREDICTION, predict_from_stats
+
+
+def add_response(user, seconds, status="online"):
+    received_at = timezone.now() - timedelta(hours=1)
+    return ResponseHistory.objects.create(
+        user=user,
+        message_id=f"msg-{seconds}-{status}",
+        received_at=received_at,
+        responded_at=received_at + timedelta(seconds=seconds),
+        presence_status=status,
+        response_time=seconds,
+    )
+
+
+class ResponseTimeStatsTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            email="stats@example.com", username="statsuser", password="Test123!@#"
+        )
+
+    def test_stats_are_updated_on_save(self):
+        for seconds in (60, 120, 180):
+            add_response(self.user, seconds)
+        stats = ResponseTimeStats.objects.get(user=self.user, presence_status="online")
+        self.assertEqual(stats.count, 3)
+        self.assertEqual(stats.mean, 120)
+        self.assertAlmostEqual(stats.variance, 2400)
+
+    def test_prediction_prefers_status_with_enough_samples(self):
+        for seconds in (100, 100, 100, 100, 100):
+            add_response(self.user, seconds, "online")
+        add_response(self.user, 1000, "busy")
+        stats = ResponseTimeStats.objects.filter(user=self.user)
+        self.assertEqual(predict_from_stats(stats, "online"), 100)
+        self.assertEqual(predict_from_stats(stats, "busy"), 250)
+        self.assertIsNone(predict_from_stats([], "online"))
+
+    def test_rebuild_matches_incremental_stats(self):
+        for seconds, status in ((60, "online"), (300, "away"), (90, "online")):
+            add_response(self.user, seconds, status)
+        incremental = {
+            row.presence_status: (row.count, row.total, row.total_squares, row.ewma)
+            for row in ResponseTimeStats.objects.filter(user=self.user)
+        }
+        ResponseTimeStats.objects.all().delete()
+        call_command("rebuild_response_stats", stdout=StringIO())
+        rebuilt = {
+            row.presence_status: (row.count, row.total, row.total_squares, row.ewma)
+            for row in ResponseTimeStats.objects.filter(user=self.user)
+        }
+        self.assertEqual(rebuilt, incremental)
+
+
+@override_settings(
+    CHANNEL_LAYERS={"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}},
+    PRESENCE_STORE={"BACKEND": "presence.store.LocalPresenceStore"},
+)
+class BatchResponseTimePredictionTests(TestCase):
+    def setUp(self):
+        self.users = [
+            CustomUser.objects.create_user(email=f"agent{i}@example.com", username=f"agent{i}", password="Test123!@#")
+            for i in range(4)
+        ]
+        for user in self.users[:3]:
+            Presence.objects.create(user=user, status="online", device_type="desktop")
+        for seconds in (60, 60, 60, 60, 60):
+            add_response(self.users[0], seconds)
+        add_response(self.users[1], 7200, "busy")
+        self.client = APIClient()
+        self.client.force_authenticate(self.users[0])
+
+    def test_predicts_every_user_with_a_fixed_number_of_queries(self):
+        user_ids = [str(user.id) for user in self.users]
+        with self.assertNumQueries(3):  # presence cold miss, stats, session durations
+            response = self.client.post(reverse("batch-response-time-prediction"), {"user_ids": user_ids}, format="json")
+        self.assertEqual(response.status_code, 200)
+        results = {row["user_id"]: row for row in response.data["results"]}
+        self.assertEqual(results[user_ids[0]]["predicted_response_time"], 60)
+        self.assertEqual(results[user_ids[1]]["predicted_response_time_display"], "2 hours")
+        self.assertEqual(results[user_ids[2]]["predicted_response_time"], DEFAULT_PREDICTION)
+        self.assertEqual(response.data["missing"], [user_ids[3]])
+
+    def test_single_user_prediction_uses_the_same_engine(self):
+        response = self.client.get(reverse("response-time-prediction", kwargs={"userId": self.users[0].id}))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["predicted_response_time"], 60)
+
+
+class ResponseTimePercentileTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            email="pct@example.com", username="pctuser", password="Test123!@#"
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_histogram_percentiles_are_close_to_exact(self):
+        rng = np.random.default_rng(7)
+        values = rng.lognormal(mean=6, sigma=1, size=5000)
+        histogram = ResponseTimeHistogram()
+        histogram.add(np.array(["online"] * len(values), dtype=object), np.zeros(len(values), dtype=np.int64), values)
+        p50, p90 = histogram.percentiles(histogram.select(status="online"))
+        self.assertAlmostEqual(p50, np.percentile(values, 50), delta=np.percentile(values, 50) * 0.1)
+        self.assertAlmostEqual(p90, np.percentile(values, 90), delta=np.percentile(values, 90) * 0.1)
+
+    def test_profile_is_updated_on_write(self):
+        for seconds in (60, 60, 600):
+            add_response(self.user, seconds, "online")
+        add_response(self.user, 3600, "busy")
+        incremental = ResponseTimeHistogram.for_user(self.user.id).counts
+        self.assertEqual(incremental.sum(), 4)
+        self.assertTrue((rebuild_profile(self.user.id).counts == incremental).all())
+        self.assertTrue((ResponseTimeHistogram.for_user(self.user.id).counts == incremental).all())
+
+        # Reads are read-only: the user check and one bucket query
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse("response-time-percentiles", kwargs={"userId": self.user.id}))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["overall"]["count"], 4)
+        self.assertEqual(response.data["by_status"]["busy"]["count"], 1)
+        self.assertEqual(sum(bucket["count"] for bucket in response.data["by_hour_of_week"].values()), 4)
+        self.assertEqual(ResponseTimeBucket.objects.filter(user=self.user).count(), 3)
+
+@override_settings(
+    CHANNEL_LAYERS={"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}},
+    PRESENCE_STORE={"BACKEND": "presence.store.LocalPresenceStore"},
+)
+class GenerateResponseDataTests(TestCase):
+    def generate(self, prefix, **options):
+        call_command(
+            "generate_response_data", users=4, prefix=prefix, presence_per_user=3, responses_per_user=5,
+            batch_size=7, seed=42, distribution="lognormal", stdout=StringIO(), **options
+        )
+        return CustomUser.objects.filter(email__startswith=f"{prefix}-")
+
+    def test_generates_requested_volumes_in_batches(self):
+        with CaptureQueriesContext(connection) as queries:
+            users = self.generate("gen", rebuild_stats=True)
+        # Generated timestamps are written by the INSERT, not a second pass
+        self.assertFalse([q for q in queries if q["sql"].startswith('UPDATE "presence_record"')])
+        self.assertEqual(users.count(), 4)
+        self.assertEqual(Presence.objects.filter(user__in=users).count(), 12)
+        self.assertEqual(ResponseHistory.objects.filter(user__in=users).count(), 20)
+        self.assertEqual(sum(ResponseTimeStats.objects.filter(user__in=users).values_list("count", flat=True)), 20)
+        self.assertEqual(PresenceSpan.objects.filter(user__in=users).values("user").distinct().count(), 4)
+        self.assertEqual(PresenceDailySummary.objects.filter(user__in=users).values("user").distinct().count(), 4)
+        self.assertEqual(
+            sum(ResponseTimeDaily.objects.filter(user__in=users).values_list("count", flat=True)), 20
+        )
+        oldest = Presence.objects.filter(user__in=users).order_by("last_seen").first()
+        self.assertLess(oldest.last_seen, timezone.now() - timedelta(minutes=5))
+        self.assertTrue(Presence._meta.get_field("last_seen").auto_now_add)
+
+    def test_seed_makes_runs_reproducible(self):
+        first = self.generate("first")
+        second = self.generate("second")
+
+        def response_times(users):
+            return list(
+                ResponseHistory.objects.filter(user__in=users)
+                .order_by("user__username", "received_at")
+                .values_list("response_time", "presence_status")
+            )
+
+        self.assertEqual(response_times(first), response_times(second))
+
+    def test_existing_user_mode(self):
+        user = CustomUser.objects.create_user(email="single@example.com", username="single", password="Test123!@#")
+        call_command("generate_response_data", user_id=str(user.id), stdout=StringIO())
+        self.assertEqual(ResponseHistory.objects.filter(user=user).count(), 10)
+
+
+@override_settings(
+    CHANNEL_LAYERS={"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}},
+    PRESENCE_STORE={"BACKEND": "presence.store.LocalPresenceStore"},
+)
+class UserAnalyticsTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            email="analytics@example.com", username="analyticsuser", password="Test123!@#"
+        )
+        self.yesterday = timezone.localdate() - timedelta(days=1)
+        for status, hour in (("online", 9), ("away", 11), ("offline", 12)):
+            presence = Presence.objects.create(user=self.user, status=status, device_type="desktop")
+            Presence.objects.filter(pk=presence.pk).update(last_seen=day_start(self.yesterday) + timedelta(hours=hour))
+        call_command("rebuild_presence_spans", stdout=StringIO())
+        for seconds in (60, 120):
+            add_response(self.user, seconds)
+        self.url = reverse("user-analytics", kwargs={"userId": self.user.id})
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_analytics_are_read_from_rollups(self):
+        with self.assertNumQueries(5):  # user, open span, daily, hourly and response rollups
+            response = self.client.get(self.url, {"timeRange": "week"})
+        self.assertEqual(response.status_code, 200)
+        daily = {row["date"]: row for row in response.data["time_in_status"]["daily"]}
+        self.assertEqual(len(daily), 7)
+        self.assertEqual(daily[self.yesterday]["online"], 7200)
+        self.assertEqual(daily[self.yesterday]["away"], 3600)
+        self.assertEqual(daily[self.yesterday]["transitions"], 3)
+        self.assertEqual(response.data["peak_activity_hours"], [9, 10])
+        self.assertEqual(response.data["response_times"]["count"], 2)
+        self.assertEqual(response.data["response_times"]["average"], 90)
+
+        self.assertEqual(self.client.get(self.url, {"timeRange": "year"}).status_code, 400)
+        stranger = CustomUser.objects.create_user(email="stranger@example.com", username="stranger", password="Test123!@#")
+        self.client.force_authenticate(stranger)
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+
+    def test_backfill_restores_rollups(self):
+        expected = self.client.get(self.url, {"timeRange": "month"}).data
+        PresenceDailySummary.objects.all().delete()
+        ResponseTimeDaily.objects.all().delete()
+        call_command("backfill_analytics", batch_size=1, stdout=StringIO())
+        self.assertEqual(self.client.get(self.url, {"timeRange": "month"}).data, expected)
+
+
+class BenchmarkSummaryTests(TestCase):
+    def test_summarize_reports_percentiles_in_milliseconds(self):
+        summary = summarize([0.001 * i for i in range(1, 101)])
+        self.assertEqual(summary["p50"], 50.5)
+        self.assertEqual(summary["max"], 100.0)
+        self.assertIsNone(summarize([]))
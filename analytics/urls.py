@@ -1,8 +1,11 @@
 # analytics/urls.py
 
 from django.urls import path
-from .views import ResponseTimePredictionView
+from .views import ResponseTimePredictionView, BatchResponseTimePredictionView, ResponseTimePercentileView, UserAnalyticsView
 
 urlpatterns = [
     path('users/<uuid:userId>/response-time-prediction/', ResponseTimePredictionView.as_view(), name='response-time-prediction'),
+    path('users/<uuid:userId>/response-time-percentiles/', ResponseTimePercentileView.as_view(), name='response-time-percentiles'),
+    path('users/<uuid:userId>/analytics/', UserAnalyticsView.as_view(), name='user-analytics'),
+    path('response-time-predictions/', BatchResponseTimePredictionView.as_view(), name='batch-response-time-prediction'),
 ]
\ No newline at end of file
@@ -4,70 +4,131 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from rest_framework import serializers
-from django.db.models import Avg
-from django.utils import timezone
+from rest_framework.exceptions import PermissionDenied
+from drf_spectacular.utils import OpenApiParameter, extend_schema
+from LiveStatusAPI.routers import ReplicaReadMixin
 from users.models import CustomUser
-from presence.models import Presence, PresenceRecord  # Import PresenceRecord
-from analytics.models import ResponseHistory
-from analytics.serializers import ResponseTimePredictionSerializer
+from presence.graph import user_can_watch
+from presence.store import get_current_presence, get_current_presences
+from analytics.activity import TIME_RANGES, get_user_analytics
+from analytics.engine import HOURS_PER_WEEK, STATUSES, ResponseTimeHistogram
+from analytics.predictions import predict_response_times
+from analytics.serializers import (
+    ResponseTimePredictionSerializer,
+    BatchResponseTimePredictionRequestSerializer,
+    UserResponseTimePredictionSerializer,
+)
 
-class ResponseTimePredictionView(APIView):
+class ResponseTimePredictionView(ReplicaReadMixin, APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request, userId, *args, **kwargs):
         # Retrieve the user and their current presence status
         try:
             user = CustomUser.objects.get(id=userId)
-            presence = Presence.objects.get(user=user)
-        except (CustomUser.DoesNotExist, Presence.DoesNotExist):
+        except CustomUser.DoesNotExist:
+            raise serializers.ValidationError("User or presence data not found.")
+        presence = get_current_presence(user.id)
+        if presence is None:
             raise serializers.ValidationError("User or presence data not found.")
 
         # Get the user's current presence status
-        current_status = presence.status
-
-        # Calculate session duration (time since last status change)
-        latest_presence_record = PresenceRecord.objects.filter(
-            user=user,
-            status=current_status
-        ).order_by('-changed_at').first()
-
-        session_duration = 0  # Default to 0 if no record exists
-        if latest_presence_record:
-            delta = timezone.now() - latest_presence_record.changed_at
-            session_duration = int(delta.total_seconds())  # Duration in seconds
-
-        # Query response history for this user
-        response_history = ResponseHistory.objects.filter(user=user)
-
-        if not response_history.exists():
-            # No historical data; return a default prediction
-            predicted_time = 600  # 10 minutes
-        else:
-            # Try to predict based on the current presence status
-            status_specific_history = response_history.filter(presence_status=current_status)
-            if status_specific_history.count() >= 5:
-                # Enough data for a status-specific prediction
-                avg_response_time = status_specific_history.aggregate(
-                    avg_time=Avg('response_time')
-                )['avg_time']
-                predicted_time = avg_response_time if avg_response_time is not None else 600
-            else:
-                # Fall back to overall average
-                avg_response_time = response_history.aggregate(
-                    avg_time=Avg('response_time')
-                )['avg_time']
-                predicted_time = avg_response_time if avg_response_time is not None else 600
-
-            # Adjust prediction based on session duration
-            # If the user has been in the current status for a long time (> 1 hour),
-            # they might be idle, so increase the predicted time by 20%
-            if session_duration > 3600:  # 1 hour
-                predicted_time *= 1.2
-
-            predicted_time = int(predicted_time)
+        current_status = presence["status"]
+
+        # Predict from the user's running statistics and the time spent in
+        # the current status
+        predicted_time = predict_response_times({user.id: current_status})[str(user.id)]
 
         # Serialize the prediction
         serializer = ResponseTimePredictionSerializer({
             'predicted_response_time': predicted_time
         })
-        return Response(serializer.data)
\ No newline at end of file
+        return Response(serializer.data)
+
+class BatchResponseTimePredictionView(ReplicaReadMixin, APIView):
+    """
+    Predicted response times for many users in one request. The number of
+    queries does not depend on how many users are asked for.
+    """
+    permission_classes = [IsAuthenticated]
+
+    @extend_schema(
+        summary="Predict response times for many users",
+        request=BatchResponseTimePredictionRequestSerializer,
+        responses=UserResponseTimePredictionSerializer(many=True),
+    )
+    def post(self, request, *args, **kwargs):
+        serializer = BatchResponseTimePredictionRequestSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        user_ids = [str(user_id) for user_id in dict.fromkeys(serializer.validated_data["user_ids"])]
+
+        presences = get_current_presences(user_ids)
+        predictions = predict_response_times(
+            {user_id: presence["status"] for user_id, presence in presences.items()}
+        )
+        results = [
+            {"user_id": user_id, "predicted_response_time": predictions[user_id]}
+            for user_id in user_ids
+            if user_id in predictions
+        ]
+        return Response({
+            "results": UserResponseTimePredictionSerializer(results, many=True).data,
+            "missing": [user_id for user_id in user_ids if user_id not in predictions],
+        })
+
+
+class ResponseTimePercentileView(ReplicaReadMixin, APIView):
+    """
+    p50/p90 response times by presence status and by hour of the week, served
+    from the user's histogram buckets, which are kept up to date as responses
+    are recorded. Nothing is written on read.
+
+    Pass ``status`` and/or ``hour_of_week`` (0 = Monday 00:00) to also get the
+    percentiles for that single bucket.
+    """
+    permission_classes = [IsAuthenticated]
+
+    @extend_schema(summary="Get response-time percentiles")
+    def get(self, request, userId, *args, **kwargs):
+        if not CustomUser.objects.filter(id=userId).exists():
+            raise serializers.ValidationError("User not found.")
+
+        status = request.query_params.get("status")
+        if status is not None and status not in STATUSES:
+            raise serializers.ValidationError({"status": f"Must be one of {', '.join(STATUSES)}."})
+        hour_of_week = request.query_params.get("hour_of_week")
+        if hour_of_week is not None:
+            if not hour_of_week.isdigit() or int(hour_of_week) >= HOURS_PER_WEEK:
+                raise serializers.ValidationError({"hour_of_week": f"Must be between 0 and {HOURS_PER_WEEK - 1}."})
+            hour_of_week = int(hour_of_week)
+
+        histogram = ResponseTimeHistogram.for_user(userId)
+        data = histogram.report()
+        if status is not None or hour_of_week is not None:
+            data["bucket"] = histogram.summarize(histogram.select(status=status, hour_of_week=hour_of_week))
+        return Response(data)
+
+
+class UserAnalyticsView(ReplicaReadMixin, APIView):
+    """
+    Engagement score, time in status per day and week, response-time trend
+    and peak activity hours for a user over the last day, week or month.
+    Served from rollups kept up to date as presence and responses are
+    recorded; nothing is aggregated from raw history here.
+    """
+    permission_classes = [IsAuthenticated]
+
+    @extend_schema(
+        summary="Get user analytics",
+        parameters=[OpenApiParameter("timeRange", str, enum=list(TIME_RANGES), default="week")],
+    )
+    def get(self, request, userId, *args, **kwargs):
+        time_range = request.query_params.get("timeRange", "week")
+        if time_range not in TIME_RANGES:
+            raise serializers.ValidationError({"timeRange": f"Must be one of {', '.join(TIME_RANGES)}."})
+        user = CustomUser.objects.filter(id=userId).first()
+        if user is None:
+            raise serializers.ValidationError("User not found.")
+        if not user_can_watch(request.user, userId):
+            raise PermissionDenied()
+        return Response(get_user_analytics(user, time_range))
@@ -1,4 +1,15 @@
 from django.contrib import admin
-from .models import Presence
+from .models import Presence, PresenceSubscription, Team, TeamMembership
 
 admin.site.register(Presence)
+admin.site.register(PresenceSubscription)
+
+
+class TeamMembershipInline(admin.TabularInline):
+    model = TeamMembership
+    raw_id_fields = ["user"]
+
+
+@admin.register(Team)
+class TeamAdmin(admin.ModelAdmin):
+    inlines = [TeamMembershipInline]
@@ -0,0 +1,218 @@
+# presence/buffer.py
+import asyncio
+import atexit
+import logging
+import time
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import router, transaction
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .dispatch import dispatcher
+from .models import Presence
+from .store import get_presence_store
+
+logger = logging.getLogger(__name__)
+
+
+class PresenceWriteBuffer:
+    """
+    Buffers presence updates coming from WebSocket clients.
+
+    Repeats of the same status/device from a user inside ``coalesce_window``
+    seconds are dropped. Real transitions are written with a single
+    ``bulk_create`` every ``flush_interval`` seconds, or as soon as
+    ``max_batch_size`` updates are pending. ``bulk_create`` doesn't send
+    ``post_save``, so the whole batch is handed to the presence dispatcher
+    afterwards for the store update, engagement scores and broadcast.
+
+    A batch that fails to write goes back to the front of the queue and is
+    retried on the next flush, up to ``max_retries`` times in a row. Once a
+    batch is dropped its updates no longer count for coalescing.
+    """
+
+    def __init__(self, coalesce_window=30, flush_interval=1.0, max_batch_size=500, max_retries=3):
+        self.coalesce_window = coalesce_window
+        self.flush_interval = flush_interval
+        self.max_batch_size = max_batch_size
+        self.max_retries = max_retries
+        self.failures = 0  # consecutive failed writes
+        self.pending = []
+        self.last_accepted = {}  # user_id -> (status, device_type, monotonic time)
+        self.coalesced_count = 0
+        self.written_count = 0
+        self._flush_task = None
+
+    async def add(self, user_id, status, device_type="unknown", predicted_response_time=None):
+        """
+        Queue an update. Returns False if it was coalesced away.
+        """
+        user_id = str(user_id)
+        now = time.monotonic()
+        previous = self.last_accepted.get(user_id)
+        if previous is None:
+            previous = await self._previous_from_store(user_id, now)
+        if previous and previous[:2] == (status, device_type) and now - previous[2] < self.coalesce_window:
+            self.coalesced_count += 1
+            return False
+
+        self.last_accepted[user_id] = (status, device_type, now)
+        self.pending.append(
+            Presence(
+                user_id=user_id,
+                status=status,
+                device_type=device_type,
+                predicted_response_time=predicted_response_time,
+            )
+        )
+        if len(self.pending) >= self.max_batch_size:
+            await self.flush()
+        elif self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.ensure_future(self._flush_later())
+        return True
+
+    async def flush(self):
+        """
+        Write everything that is pending. Safe to call at any time.
+        """
+        if self._flush_task is not None and self._flush_task is not asyncio.current_task():
+            self._flush_task.cancel()
+            self._flush_task = None
+        batch, self.pending = self.pending, []
+        if batch:
+            # One worker-thread hop per batch for the database work; the
+            # broadcast is sent from the event loop once it has committed.
+            try:
+                messages = await database_sync_to_async(self.write_batch)(batch)
+            except Exception:
+                logger.exception(f"Failed to write {len(batch)} presence updates")
+                self._requeue(batch)
+                return
+            try:
+                await dispatcher.abroadcast(messages)
+            except Exception:
+                # The rows and the store are already updated; clients catch
+                # up from the next update or a snapshot.
+                logger.exception(f"Failed to broadcast {len(messages)} presence messages")
+        self._prune(time.monotonic())
+
+    def drain(self):
+        """
+        Write whatever is pending from outside the event loop, e.g. at exit.
+        """
+        batch, self.pending = self.pending, []
+        if batch:
+            try:
+                dispatcher.broadcast(self.write_batch(batch))
+            except Exception:
+                logger.exception(f"Dropped {len(batch)} presence updates at shutdown")
+
+    def write_batch(self, batch):
+        """
+        Write ``batch`` and return the channel-layer messages to send.
+        """
+        using = router.db_for_write(Presence)
+        # Keep the rows and anything dispatch writes (engagement, webhook
+        # outbox) in one transaction.
+        with transaction.atomic(using=using):
+            created = Presence.objects.using(using).bulk_create(batch)
+            messages = dispatcher.dispatch(created, broadcast=False)
+        self.written_count += len(created)
+        self.failures = 0
+        logger.debug(f"Flushed {len(created)} presence updates")
+        return messages
+
+    def _requeue(self, batch):
+        self.failures += 1
+        if self.failures > self.max_retries:
+            logger.error(f"Dropped {len(batch)} presence updates after {self.max_retries} retries")
+            self.failures = 0
+            for presence in batch:
+                # Let the next identical heartbeat through; it is no longer
+                # a repeat of anything that was written.
+                user_id = str(presence.user_id)
+                previous = self.last_accepted.get(user_id)
+                if previous is not None and previous[:2] == (presence.status, presence.device_type):
+                    del self.last_accepted[user_id]
+            return
+        for presence in batch:
+            # bulk_create may have assigned keys before the rollback
+            presence.pk = None
+            presence._state.adding = True
+        self.pending[:0] = batch
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.ensure_future(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.flush_interval)
+        await self.flush()
+
+    async def _previous_from_store(self, user_id, now):
+        # First update from this user in this process: compare against the
+        # current record so reconnecting clients don't re-write their status.
+        record = await get_presence_store().aget(user_id)
+        if record is None:
+            return None
+        age = (timezone.now() - parse_datetime(record["last_seen"])).total_seconds()
+        return (record["status"], record["device_type"], now - max(age, 0))
+
+    def _prune(self, now):
+        expired = [
+            user_id
+            for user_id, (_, _, accepted_at) in self.last_accepted.items()
+            if now - accepted_at >= self.coalesce_window
+        ]
+        for user_id in expired:
+            del self.last_accepted[user_id]
+
+
+_buffer = None
+
+
+def get_presence_buffer():
+    """
+    Return the process-wide buffer configured by settings.PRESENCE_WRITE_BUFFER.
+    """
+    global _buffer
+    if _buffer is None:
+        config = getattr(settings, "PRESENCE_WRITE_BUFFER", {})
+        _buffer = PresenceWriteBuffer(
+            coalesce_window=config.get("COALESCE_WINDOW", 30),
+            flush_interval=config.get("FLUSH_INTERVAL", 1.0),
+            max_batch_size=config.get("MAX_BATCH_SIZE", 500),
+            max_retries=config.get("MAX_RETRIES", 3),
+        )
+    return _buffer
+
+
+async def lifespan(scope, receive, send):
+    """
+    ASGI lifespan handler: writes pending updates when the server shuts down.
+    """
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            if _buffer is not None:
+                await _buffer.flush()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+@atexit.register
+def drain_at_exit():
+    # For servers that don't send lifespan events
+    if _buffer is not None:
+        _buffer.drain()
+
+
+@receiver(setting_changed)
+def reset_presence_buffer(setting, **kwargs):
+    global _buffer
+    if setting == "PRESENCE_WRITE_BUFFER":
+        _buffer = None
@@ -1,22 +1,52 @@
 # presence/consumers.py
+from urllib.parse import parse_qs
+
+from channels.exceptions import StopConsumer
+from channels.generic.http import AsyncHttpConsumer
 from channels.generic.websocket import AsyncJsonWebsocketConsumer
-from channels.db import database_sync_to_async
 from django.contrib.auth import get_user_model
-from rest_framework_simplejwt.authentication import JWTAuthentication
-from rest_framework.exceptions import AuthenticationFailed
-from rest_framework.throttling import AnonRateThrottle
+from LiveStatusAPI.throttling import allow_message
+from users.devices import get_scope_device
 
-from .models import Presence
+from .buffer import get_presence_buffer
+from .graph import fanout_group, get_subscription_graph, shard_for
+from .liveness import get_liveness_tracker
+from .middleware import authenticate_token, get_scope_token
+from .replay import get_replay_buffer
+from .services import aget_current_presence, aget_current_presences, aupdate_presence, auser_can_watch, awatchable
+from django.conf import settings
+import asyncio
 import logging
 import json
+import uuid
 
 logger = logging.getLogger(__name__)
 User = get_user_model()
 
+
+def split_user_ids(user_ids):
+    """
+    Split ``user_ids`` into (valid UUIDs in canonical form, invalid values),
+    both without duplicates.
+    """
+    cleaned, invalid = [], []
+    for user_id in user_ids if isinstance(user_ids, list) else []:
+        try:
+            cleaned.append(str(uuid.UUID(str(user_id))))
+        except ValueError:
+            invalid.append(str(user_id))
+    return list(dict.fromkeys(cleaned)), list(dict.fromkeys(invalid))
+
+
+def clean_user_ids(user_ids):
+    """
+    Valid UUIDs from ``user_ids`` in canonical form, without duplicates.
+    """
+    return split_user_ids(user_ids)[0]
+
 class PresenceConsumer(AsyncJsonWebsocketConsumer):
     
-    throttle_class = AnonRateThrottle
-    throttle_rate = "100/hour"
+    throttle_scope = "websocket"
 
     """
     WebSocket consumer for real-time presence updates for a specific user.
@@ -26,71 +56,355 @@ class PresenceConsumer(AsyncJsonWebsocketConsumer):
         self.user_id = self.scope["url_route"]["kwargs"]["user_id"]
         self.group_name = f"presence_{self.user_id}"
 
-        # Authenticate using JWT from query string
-        token = self.scope["query_string"].decode().split("token=")[-1] if "token=" in self.scope["query_string"].decode() else None
-        user = await self.authenticate_user(token)
-        if not user or (str(user.id) != self.user_id and not user.is_staff):
+        user = await self.authenticate_user()
+        if not user or not await auser_can_watch(user, self.user_id):
             await self.close(code=4001)  # Unauthorized
             return
 
         # Join the presence group
+        self.user = user
+        self.device = get_scope_device(self.scope)
         await self.channel_layer.group_add(self.group_name, self.channel_name)
-        await self.accept()
+        await self.accept(subprotocol=self.scope.get("auth_subprotocol"))
+        await get_liveness_tracker().aconnect(user.id)
         logger.info(f"WebSocket connected for user: {self.user_id}")
 
         # Send current presence
-        presence = await self.get_latest_presence()
+        presence = await aget_current_presence(self.user_id)
         if presence:
             await self.send_json({
                 "type": "presence_update",
                 "data": {
                     "user_id": self.user_id,
-                    "status": presence.status,
-                    "device_type": presence.device_type,
-                    "last_seen": presence.last_seen.isoformat(),
-                    "predicted_response_time": presence.predicted_response_time,
-                    "engagement_score": user.engagement_score,
+                    "status": presence["status"],
+                    "device_type": presence["device_type"],
+                    "last_seen": presence["last_seen"],
+                    "predicted_response_time": presence["predicted_response_time"],
+                    # The store is kept current by the dispatcher; the
+                    # cached user may be stale, and may not be the target.
+                    "engagement_score": presence["engagement_score"],
                 },
             })
 
     async def disconnect(self, close_code):
         if hasattr(self, "group_name"):
             await self.channel_layer.group_discard(self.group_name, self.channel_name)
+        if getattr(self, "user", None):
+            await get_liveness_tracker().adisconnect(self.user.id)
+            # Don't leave this client's last update waiting for the timer
+            await get_presence_buffer().flush()
         logger.info(f"WebSocket disconnected for user: {self.user_id}")
 
     async def receive_json(self, content):
+        if not await self.check_rate():
+            return
+        await self.record_activity(content)
         # Optionally handle client-initiated presence updates
         if content.get("type") == "presence_update":
             await self.update_presence(content.get("data", {}))
 
     async def presence_update(self, event):
+        if not await auser_can_watch(self.user, self.user_id):
+            # Access was revoked after connecting
+            await self.close(code=4001)
+            return
         # Broadcast presence updates to the group
         await self.send_json(event["data"])
 
-    @database_sync_to_async
-    def authenticate_user(self, token):
-        try:
-            validated_token = JWTAuthentication().get_validated_token(token)
-            user = JWTAuthentication().get_user(validated_token)
+    async def authenticate_user(self):
+        # JWTAuthMiddleware has normally resolved the user already; fall back
+        # to the token in the scope when the consumer is mounted without it.
+        user = self.scope.get("user")
+        if user is not None and user.is_authenticated:
             return user
-        except AuthenticationFailed:
-            return None
+        token, subprotocol = get_scope_token(self.scope)
+        self.scope["auth_subprotocol"] = subprotocol
+        return await authenticate_token(token)
 
-    @database_sync_to_async
-    def get_latest_presence(self):
-        try:
-            return Presence.objects.filter(user_id=self.user_id).order_by("-last_seen").first()
-        except Presence.DoesNotExist:
-            return None
-
-    @database_sync_to_async
-    def update_presence(self, data):
-        status = data.get("status")
-        device_type = data.get("device_type")
-        if status in ["online", "away", "offline", "busy"]:
-            Presence.objects.create(
-                user_id=self.user_id,
-                status=status,
-                device_type=device_type or "unknown",
-                predicted_response_time=data.get("predicted_response_time"),
-            )
\ No newline at end of file
+    async def check_rate(self):
+        # Every inbound frame counts against the user's rate, across all of
+        # their connections and every worker. Throttled frames are dropped.
+        result = await allow_message(self.throttle_scope, self.user.pk)
+        if result is None or result.allowed:
+            return True
+        await self.send_json({"type": "error", "code": "throttled", "retry_after": result.retry_after})
+        return False
+
+    async def record_activity(self, content):
+        # Any frame, including {"type": "heartbeat"}, counts as activity. A
+        # status update sets the status itself, so it isn't restored first.
+        tracker = get_liveness_tracker()
+        if await tracker.atouch(self.user.id) and content.get("type") != "presence_update":
+            await tracker.restore(self.user.id)
+
+    async def update_presence(self, data):
+        # Teammates and watchers may open this socket too, but only the user
+        # themself (or staff) may set the status.
+        if str(self.user.id) != self.user_id and not self.user.is_staff:
+            await self.send_json({"type": "error", "code": "forbidden", "detail": "You can only update your own presence."})
+            return
+        # Writes go through the shared buffer: repeated heartbeats are
+        # coalesced and real transitions are flushed in batches. Without an
+        # explicit device_type the connection's User-Agent decides.
+        await aupdate_presence(
+            self.user_id,
+            data.get("status"),
+            data.get("device_type") or self.device.device_type,
+            data.get("predicted_response_time"),
+        )
+
+
+class MultiplexPresenceConsumer(PresenceConsumer):
+    """
+    WebSocket consumer that watches the presence of many users over a single
+    connection. Clients send:
+
+        {"type": "subscribe", "user_ids": [...]}
+        {"type": "unsubscribe", "user_ids": [...]}
+
+    and receive one "presence_snapshot" batch per subscribe, followed by
+    "presence_update" messages for every subscribed user.
+    """
+    async def connect(self):
+        self.user = await self.authenticate_user()
+        if not self.user:
+            await self.close(code=4001)  # Unauthorized
+            return
+
+        self.user_id = str(self.user.id)
+        self.device = get_scope_device(self.scope)
+        self.subscriptions = set()
+        self.max_subscriptions = getattr(settings, "PRESENCE_MAX_SUBSCRIPTIONS", 1000)
+        # Updates from everyone this user may watch arrive via their shard
+        self.fanout_group = fanout_group(shard_for(self.user_id, get_subscription_graph().shards))
+        await self.channel_layer.group_add(self.fanout_group, self.channel_name)
+        await self.accept(subprotocol=self.scope.get("auth_subprotocol"))
+        await get_liveness_tracker().aconnect(self.user.id)
+        logger.info(f"Multiplexed WebSocket connected for user: {self.user.id}")
+
+    async def disconnect(self, close_code):
+        subscriptions = getattr(self, "subscriptions", set())
+        await asyncio.gather(
+            *[self.channel_layer.group_discard(f"presence_{user_id}", self.channel_name) for user_id in subscriptions]
+        )
+        if hasattr(self, "fanout_group"):
+            await self.channel_layer.group_discard(self.fanout_group, self.channel_name)
+            await get_liveness_tracker().adisconnect(self.user.id)
+            await get_presence_buffer().flush()
+        logger.info(f"Multiplexed WebSocket disconnected with {len(subscriptions)} subscriptions")
+
+    async def receive_json(self, content):
+        if not await self.check_rate():
+            return
+        await self.record_activity(content)
+        message_type = content.get("type")
+        if message_type == "subscribe":
+            await self.subscribe(content.get("user_ids", []))
+        elif message_type == "unsubscribe":
+            await self.unsubscribe(content.get("user_ids", []))
+        elif message_type == "presence_update":
+            await self.update_presence(content.get("data", {}))
+
+    async def presence_update(self, event):
+        user_id = event["data"]["user_id"]
+        if not await auser_can_watch(self.user, user_id):
+            # Access was revoked after subscribing
+            if user_id in self.subscriptions:
+                self.subscriptions.discard(user_id)
+                await self.channel_layer.group_discard(f"presence_{user_id}", self.channel_name)
+                await self.send_json({"type": "unsubscribed", "user_ids": [user_id], "reason": "revoked"})
+            return
+        await self.send_json({"type": "presence_update", "data": event["data"]})
+
+    async def presence_fanout(self, event):
+        # A shard message carries updates for several watchers; explicitly
+        # subscribed users already arrive through their own group.
+        for update in event["updates"]:
+            if self.user_id in update["recipients"] and update["data"]["user_id"] not in self.subscriptions:
+                await self.send_json({"type": "presence_update", "data": update["data"]})
+
+    def clean_user_ids(self, user_ids):
+        return clean_user_ids(user_ids)
+
+    async def subscribe(self, user_ids):
+        # Malformed IDs, users this user may not watch and anything over
+        # max_subscriptions all come back in "denied".
+        user_ids, invalid = split_user_ids(user_ids)
+        allowed = await awatchable(self.user, user_ids)
+        denied = [user_id for user_id in user_ids if user_id not in allowed]
+
+        new = [user_id for user_id in allowed if user_id not in self.subscriptions]
+        capacity = max(self.max_subscriptions - len(self.subscriptions), 0)
+        denied += new[capacity:] + invalid
+        new = new[:capacity]
+
+        await asyncio.gather(
+            *[self.channel_layer.group_add(f"presence_{user_id}", self.channel_name) for user_id in new]
+        )
+        self.subscriptions.update(new)
+
+        watched = [user_id for user_id in allowed if user_id in self.subscriptions]
+        records = await aget_current_presences(watched)
+        await self.send_json({
+            "type": "presence_snapshot",
+            "data": [records[user_id] for user_id in watched if user_id in records],
+            "denied": denied,
+        })
+
+    async def unsubscribe(self, user_ids):
+        user_ids = [user_id for user_id in self.clean_user_ids(user_ids) if user_id in self.subscriptions]
+        await asyncio.gather(
+            *[self.channel_layer.group_discard(f"presence_{user_id}", self.channel_name) for user_id in user_ids]
+        )
+        self.subscriptions.difference_update(user_ids)
+        await self.send_json({"type": "unsubscribed", "user_ids": user_ids})
+
+
+def sse_event(event, data, event_id=None):
+    """
+    Format one Server-Sent Event. JSON has no raw newlines, so ``data`` always
+    fits on a single line.
+    """
+    lines = [f"id: {event_id}"] if event_id is not None else []
+    lines += [f"event: {event}", f"data: {json.dumps(data)}"]
+    return "\n".join(lines) + "\n\n"
+
+
+class PresenceEventStreamConsumer(AsyncHttpConsumer):
+    """
+    Server-Sent Events feed of presence updates, for clients that only listen:
+
+        GET /sse/presence/?user_ids=<id>,<id>
+
+    The stream opens with a "presence_snapshot" event and continues with
+    "presence_update" events. Every event has an id; a client reconnecting
+    with Last-Event-ID is sent what it missed from the replay buffer, or a
+    fresh snapshot when that is no longer there. Updates that arrive close
+    together are written as one chunk.
+    """
+
+    async def http_request(self, message):
+        # Unlike AsyncHttpConsumer, the consumer stays up after the request
+        # while the stream is open: updates arrive as channel-layer events
+        # until the client disconnects.
+        if "body" in message:
+            self.body.append(message["body"])
+        if not message.get("more_body") and not await self.open_stream():
+            raise StopConsumer()
+
+    async def send_error(self, status, detail):
+        await self.send_response(
+            status, json.dumps({"detail": detail}).encode(), headers=[(b"Content-Type", b"application/json")]
+        )
+
+    async def open_stream(self):
+        """
+        Subscribe and send the opening events. Returns False after sending an
+        error response instead.
+        """
+        user = self.scope.get("user")
+        if user is None or not user.is_authenticated:
+            await self.send_error(401, "Authentication credentials were not provided.")
+            return False
+        query = parse_qs(self.scope.get("query_string", b"").decode())
+        user_ids = clean_user_ids(",".join(query.get("user_ids", [])).split(","))
+        if not user_ids:
+            await self.send_error(400, "user_ids is required.")
+            return False
+        allowed = await awatchable(user, user_ids)
+        watched = allowed[: getattr(settings, "PRESENCE_MAX_SUBSCRIPTIONS", 1000)]
+        if not watched:
+            await self.send_error(403, "You do not have permission to watch these users.")
+            return False
+
+        config = getattr(settings, "PRESENCE_EVENT_STREAM", {})
+        self.batch_interval = config.get("BATCH_INTERVAL", 0.05)
+        self.max_batch = config.get("MAX_BATCH", 100)
+        self.user = user
+        self.buffer = get_replay_buffer()
+        self.pending = []
+        self.flush_task = None
+        self.subscriptions = watched
+        await asyncio.gather(
+            *[self.channel_layer.group_add(f"presence_{user_id}", self.channel_name) for user_id in watched]
+        )
+        self.buffer.watch(watched)
+        await self.send_headers(headers=[
+            (b"Content-Type", b"text/event-stream"),
+            (b"Cache-Control", b"no-cache"),
+            (b"X-Accel-Buffering", b"no"),  # stop nginx from holding events back
+        ])
+
+        # Everything recorded up to here is already in the store, so it is
+        # covered by the snapshot or the replay; later updates are streamed.
+        self.last_seq = self.buffer.last_seq
+        chunks = [f"retry: {config.get('RETRY', 3000)}\n\n"]
+        headers = dict(self.scope.get("headers", []))
+        seq = self.buffer.parse_event_id(headers.get(b"last-event-id", b"").decode("latin-1"))
+        replay = None
+        if seq is not None:
+            # Users nobody here watched for a while are checked against the store
+            unwatched = self.buffer.unwatched_since(seq, watched)
+            current = await aget_current_presences(unwatched) if unwatched else {}
+            replay = self.buffer.since(seq, set(watched), current)
+        if replay is None:
+            records = await aget_current_presences(watched)
+            chunks.append(sse_event(
+                "presence_snapshot",
+                {
+                    "data": [records[user_id] for user_id in watched if user_id in records],
+                    "denied": [user_id for user_id in user_ids if user_id not in watched],
+                },
+                self.buffer.event_id(self.last_seq),
+            ))
+        else:
+            chunks += [sse_event("presence_update", data, self.buffer.event_id(number)) for number, data in replay]
+        await self.send_body("".join(chunks).encode(), more_body=True)
+        self.keepalive_task = asyncio.create_task(self.keep_alive(config.get("KEEPALIVE", 15)))
+        logger.info(f"Presence event stream opened for user {user.id} watching {len(watched)} users")
+        return True
+
+    async def presence_update(self, event):
+        seq = self.buffer.record(event["data"])
+        user_id = event["data"]["user_id"]
+        if not await auser_can_watch(self.user, user_id):
+            # Access was revoked after the stream opened
+            if user_id in self.subscriptions:
+                self.subscriptions.remove(user_id)
+                self.buffer.unwatch([user_id])
+                await self.channel_layer.group_discard(f"presence_{user_id}", self.channel_name)
+            return
+        if seq <= self.last_seq:
+            return  # already in the snapshot or replay
+        self.pending.append(sse_event("presence_update", event["data"], self.buffer.event_id(seq)))
+        if len(self.pending) >= self.max_batch or not self.batch_interval:
+            await self.flush()
+        elif self.flush_task is None:
+            self.flush_task = asyncio.create_task(self.flush_later())
+
+    async def flush_later(self):
+        await asyncio.sleep(self.batch_interval)
+        self.flush_task = None
+        await self.flush()
+
+    async def flush(self):
+        if self.pending:
+            chunk, self.pending = "".join(self.pending), []
+            await self.send_body(chunk.encode(), more_body=True)
+
+    async def keep_alive(self, interval):
+        # A comment line keeps proxies from timing out a quiet stream
+        while True:
+            await asyncio.sleep(interval)
+            await self.send_body(b": keepalive\n\n", more_body=True)
+
+    async def disconnect(self):
+        for task in (getattr(self, "flush_task", None), getattr(self, "keepalive_task", None)):
+            if task is not None:
+                task.cancel()
+        subscriptions = getattr(self, "subscriptions", [])
+        if subscriptions:
+            self.buffer.unwatch(subscriptions)
+        await asyncio.gather(
+            *[self.channel_layer.group_discard(f"presence_{user_id}", self.channel_name) for user_id in subscriptions]
+        )
@@ -0,0 +1,135 @@
+# presence/dispatch.py
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.contrib.auth import get_user_model
+from django.db.models import Case, F, FloatField, Value, When
+from django.dispatch import Signal
+from django.utils.dateparse import parse_datetime
+
+from .graph import get_subscription_graph
+from .history import record_transitions
+from .store import get_presence_store, presence_to_record
+
+User = get_user_model()
+
+# Sent after every dispatch with ``events`` (the presence_update payloads) and
+# ``engagement_scores`` ({user_id: score} for users whose score changed).
+presence_dispatched = Signal()
+
+
+class PresenceEventDispatcher:
+    """
+    Handles newly created Presence rows, one at a time from post_save or a
+    whole batch from the write buffer:
+
+    1. closes and opens presence spans where a user's status changed,
+    2. persists the engagement delta with a single atomic F() update,
+    3. refreshes the current-presence store,
+    4. sends one combined presence_update event per row, plus one
+       presence_fanout message per shard for the users' watchers,
+    5. notifies presence_dispatched receivers (e.g. webhooks) once.
+
+    Callers on the event loop pass ``broadcast=False``, which returns the
+    channel-layer messages instead of sending them, and await abroadcast()
+    themselves rather than having a worker thread hop back into the loop.
+    """
+
+    engagement_deltas = {"online": 0.1}
+
+    def dispatch(self, presences, broadcast=True):
+        if not presences:
+            return []
+        record_transitions(
+            [(presence.user_id, presence.status, presence.device_type, presence.last_seen) for presence in presences]
+        )
+        scores = self.apply_engagement(presences)
+        self.update_store(presences, scores)
+        events = [self.build_event(presence, scores.get(str(presence.user_id))) for presence in presences]
+        messages = events + get_subscription_graph().build_fanout(events)
+        changed = {str(presence.user_id) for presence in presences if self.engagement_deltas.get(presence.status)}
+        presence_dispatched.send(
+            sender=self.__class__,
+            events=[event["data"] for _, event in events],
+            engagement_scores={user_id: scores.get(user_id) for user_id in changed},
+        )
+        if not broadcast:
+            return messages
+        self.broadcast(messages)
+        return []
+
+    def apply_engagement(self, presences):
+        """
+        Return {user_id: engagement_score} for every user in the batch.
+        """
+        deltas = {}
+        for presence in presences:
+            user_id = str(presence.user_id)
+            deltas[user_id] = deltas.get(user_id, 0.0) + self.engagement_deltas.get(presence.status, 0.0)
+
+        changed = {user_id: delta for user_id, delta in deltas.items() if delta}
+        if changed:
+            User.objects.filter(pk__in=changed).update(
+                engagement_score=F("engagement_score")
+                + Case(
+                    *[When(pk=user_id, then=Value(delta)) for user_id, delta in changed.items()],
+                    default=Value(0.0),
+                    output_field=FloatField(),
+                )
+            )
+
+        # Users whose score didn't move can be answered from the store.
+        scores = {}
+        cached = get_presence_store().get_many([user_id for user_id in deltas if user_id not in changed])
+        for user_id, record in cached.items():
+            if record.get("engagement_score") is not None:
+                scores[user_id] = record["engagement_score"]
+        missing = [user_id for user_id in deltas if user_id not in scores]
+        if missing:
+            for user_id, score in User.objects.filter(pk__in=missing).values_list("pk", "engagement_score"):
+                scores[str(user_id)] = score
+        return scores
+
+    def update_store(self, presences, scores):
+        latest = {}
+        for presence in presences:
+            user_id = str(presence.user_id)
+            if user_id not in latest or latest[user_id].last_seen <= presence.last_seen:
+                latest[user_id] = presence
+
+        store = get_presence_store()
+        current = store.get_many(latest)
+        records = {}
+        for user_id, presence in latest.items():
+            record = current.get(user_id)
+            if record is None or parse_datetime(record["last_seen"]) <= presence.last_seen:
+                records[user_id] = presence_to_record(presence, engagement_score=scores.get(user_id))
+        store.set_many(records)
+
+    def build_event(self, presence, engagement_score):
+        return (
+            f"presence_{presence.user_id}",
+            {
+                "type": "presence_update",
+                "data": {
+                    "user_id": str(presence.user_id),
+                    "status": presence.status,
+                    "device_type": presence.device_type,
+                    "last_seen": presence.last_seen.isoformat(),
+                    "predicted_response_time": presence.predicted_response_time,
+                    "engagement_score": engagement_score,
+                },
+            },
+        )
+
+    def broadcast(self, messages):
+        async_to_sync(self.abroadcast)(messages)
+
+    async def abroadcast(self, messages):
+        channel_layer = get_channel_layer()
+        if channel_layer is None:
+            return
+        for group, message in messages:
+            await channel_layer.group_send(group, message)
+
+
+dispatcher = PresenceEventDispatcher()
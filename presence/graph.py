@@ -0,0 +1,237 @@
+# presence/graph.py
+import threading
+import time
+import uuid
+import zlib
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from .models import PresenceSubscription, TeamMembership
+
+
+GRAPH_VERSION_KEY = "presence:subscription-graph:version"
+
+
+def get_graph_version():
+    return cache.get(GRAPH_VERSION_KEY)
+
+
+def bump_graph_version():
+    cache.set(GRAPH_VERSION_KEY, uuid.uuid4().hex, timeout=None)
+
+
+def shard_for(user_id, shards):
+    return zlib.crc32(str(user_id).encode()) % shards
+
+
+def fanout_group(shard):
+    return f"presence_fanout_{shard}"
+
+
+def partition(user_ids, shards):
+    """
+    Split user IDs into {shard: tuple(user_ids)}.
+    """
+    by_shard = {}
+    for user_id in user_ids:
+        by_shard.setdefault(shard_for(user_id, shards), []).append(user_id)
+    return {shard: tuple(members) for shard, members in by_shard.items()}
+
+
+class SubscriptionGraph:
+    """
+    Precomputed index of who may watch whom, used to fan presence changes
+    out to every interested connection.
+
+    Teams are stored once as member lists already split into shards, rather
+    than as member x member edges, so a 5,000-person team costs 5,000
+    entries. Per-target recipient lists are merged on first use and kept in
+    a bounded LRU. The whole index is loaded with two queries and rebuilt
+    after ``ttl`` seconds, or when a team or subscription changes: every
+    change bumps a version key in the shared cache, which each process
+    compares against at most every ``version_check`` seconds.
+    """
+
+    def __init__(self, shards=64, ttl=60, cache_size=10000, version_check=1):
+        self.shards = shards
+        self.ttl = ttl
+        self.cache_size = cache_size
+        self.version_check = version_check
+        self._index = None
+        self._version = None
+        self._loaded_at = 0.0
+        self._checked_at = 0.0
+        self._recipients = OrderedDict()
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        with self._lock:
+            self._index = None
+            self._recipients.clear()
+
+    def load(self):
+        teams_of = {}
+        team_members = {}
+        for team_id, user_id in TeamMembership.objects.values_list("team_id", "user_id").iterator():
+            user_id = str(user_id)
+            teams_of.setdefault(user_id, set()).add(team_id)
+            team_members.setdefault(team_id, []).append(user_id)
+
+        watchers = {}
+        for target_id, watcher_id in PresenceSubscription.objects.values_list("target_id", "watcher_id").iterator():
+            watchers.setdefault(str(target_id), set()).add(str(watcher_id))
+
+        return {
+            "teams_of": {user_id: frozenset(teams) for user_id, teams in teams_of.items()},
+            "team_shards": {team_id: partition(members, self.shards) for team_id, members in team_members.items()},
+            "watchers": {target_id: frozenset(ids) for target_id, ids in watchers.items()},
+        }
+
+    def fresh_index(self):
+        """
+        The loaded index if it hasn't expired and was checked against the
+        shared version recently, else None. Never queries or reads the
+        cache, so it is safe to call from the event loop.
+        """
+        with self._lock:
+            now = time.monotonic()
+            if (
+                self._index is not None
+                and now - self._loaded_at < self.ttl
+                and now - self._checked_at < self.version_check
+            ):
+                return self._index
+        return None
+
+    def get_index(self):
+        index = self.fresh_index()
+        if index is not None:
+            return index
+        # Read before loading, so a change that lands during the load bumps
+        # the version again and is picked up at the next check.
+        version = get_graph_version()
+        with self._lock:
+            now = time.monotonic()
+            if self._index is not None and now - self._loaded_at < self.ttl and version == self._version:
+                self._checked_at = now
+                return self._index
+        index = self.load()
+        with self._lock:
+            self._index, self._version = index, version
+            self._loaded_at = self._checked_at = time.monotonic()
+            self._recipients.clear()
+        return index
+
+    def can_watch(self, watcher_id, target_id, index=None):
+        watcher_id, target_id = str(watcher_id), str(target_id)
+        if watcher_id == target_id:
+            return True
+        index = index or self.get_index()
+        if watcher_id in index["watchers"].get(target_id, ()):
+            return True
+        return not index["teams_of"].get(watcher_id, frozenset()).isdisjoint(index["teams_of"].get(target_id, ()))
+
+    def recipients_by_shard(self, user_id):
+        """
+        {shard: tuple(watcher_ids)} for everyone who may watch ``user_id``,
+        excluding the user themself.
+        """
+        user_id = str(user_id)
+        index = self.get_index()
+        with self._lock:
+            cached = self._recipients.get(user_id)
+            if cached is not None:
+                self._recipients.move_to_end(user_id)
+                return cached
+
+        teams = index["teams_of"].get(user_id, ())
+        contacts = index["watchers"].get(user_id, frozenset())
+        if len(teams) == 1 and not contacts:
+            # Common case: reuse the team's precomputed partition as-is.
+            shards = {
+                shard: tuple(member for member in members if member != user_id)
+                for shard, members in index["team_shards"][next(iter(teams))].items()
+            }
+        else:
+            ids = set(contacts)
+            for team_id in teams:
+                for members in index["team_shards"][team_id].values():
+                    ids.update(members)
+            ids.discard(user_id)
+            shards = partition(ids, self.shards)
+        shards = {shard: members for shard, members in shards.items() if members}
+
+        with self._lock:
+            self._recipients[user_id] = shards
+            while len(self._recipients) > self.cache_size:
+                self._recipients.popitem(last=False)
+        return shards
+
+    def build_fanout(self, events):
+        """
+        Turn presence_update events into one presence_fanout message per
+        shard, each listing which watchers in that shard should get which
+        update.
+        """
+        by_shard = {}
+        for _, event in events:
+            data = event["data"]
+            for shard, recipients in self.recipients_by_shard(data["user_id"]).items():
+                by_shard.setdefault(shard, []).append({"data": data, "recipients": list(recipients)})
+        return [
+            (fanout_group(shard), {"type": "presence_fanout", "updates": updates})
+            for shard, updates in by_shard.items()
+        ]
+
+
+_graph = None
+
+
+def get_subscription_graph():
+    """
+    Return the process-wide graph configured by settings.PRESENCE_FANOUT.
+    """
+    global _graph
+    if _graph is None:
+        config = getattr(settings, "PRESENCE_FANOUT", {})
+        _graph = SubscriptionGraph(
+            shards=config.get("SHARDS", 64),
+            ttl=config.get("TTL", 60),
+            cache_size=config.get("CACHE_SIZE", 10000),
+            version_check=config.get("VERSION_CHECK", 1),
+        )
+    return _graph
+
+
+def user_can_watch(user, user_id):
+    """
+    Users may watch themselves, staff may watch anyone, and everyone else
+    needs a shared team or a subscription granted by the target.
+    """
+    return user.is_staff or get_subscription_graph().can_watch(user.id, user_id)
+
+
+@receiver(setting_changed)
+def reset_subscription_graph(setting, **kwargs):
+    global _graph
+    if setting == "PRESENCE_FANOUT":
+        _graph = None
+
+
+@receiver(post_save, sender=TeamMembership)
+@receiver(post_delete, sender=TeamMembership)
+@receiver(m2m_changed, sender=TeamMembership)
+@receiver(post_save, sender=PresenceSubscription)
+@receiver(post_delete, sender=PresenceSubscription)
+def invalidate_subscription_graph(sender, using=None, **kwargs):
+    if _graph is not None:
+        _graph.invalidate()
+    # Other processes reload once they see the new version. It is bumped
+    # after commit so none of them can reload the old rows under it.
+    transaction.on_commit(bump_graph_version, using=using)
@@ -0,0 +1,380 @@
+# presence/history.py
+import datetime
+from collections import defaultdict
+from itertools import groupby
+
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models import Exists, OuterRef, Q, Sum
+from django.utils import timezone
+
+from .models import Presence, PresenceCompaction, PresenceDailySummary, PresenceHourlySummary, PresenceSpan
+
+# Statuses counted as activity in the hourly rollups
+ACTIVE_STATUSES = ("online", "busy")
+
+
+def get_history_settings():
+    config = getattr(settings, "PRESENCE_HISTORY", {})
+    return {
+        "RETENTION_DAYS": config.get("RETENTION_DAYS", 90),
+        "BATCH_SIZE": config.get("BATCH_SIZE", 500),
+    }
+
+
+def day_start(day):
+    return timezone.make_aware(datetime.datetime.combine(day, datetime.time.min))
+
+
+def split_days(begin, end):
+    """
+    Yield (day, seconds) for [begin, end), split at local midnight.
+    """
+    while begin < end:
+        day = timezone.localdate(begin)
+        chunk_end = min(day_start(day + datetime.timedelta(days=1)), end)
+        yield day, (chunk_end - begin).total_seconds()
+        begin = chunk_end
+
+
+def split_hours(begin, end):
+    """
+    Yield (day, hour, seconds) for [begin, end), split at local hours.
+    """
+    while begin < end:
+        local = timezone.localtime(begin)
+        chunk_end = min(local.replace(minute=0, second=0, microsecond=0) + datetime.timedelta(hours=1), end)
+        yield local.date(), local.hour, (chunk_end - begin).total_seconds()
+        begin = chunk_end
+
+
+def new_rollups():
+    # daily: {(user_id, day, status): [seconds, transitions]}
+    # hourly: {(user_id, day, hour): active seconds}
+    return defaultdict(lambda: [0.0, 0]), defaultdict(float)
+
+
+def accumulate(rollups, span, start=None, end=None, transition=True):
+    """
+    Add a span's share of [start, end) to ``rollups``. Its transition counts
+    on the day it started; its time only once it is closed (open spans are
+    added when the rollups are read). Offline time isn't counted.
+    """
+    daily, hourly = rollups
+    user_id = str(span.user_id)
+    if transition and (start is None or span.started_at >= start) and (end is None or span.started_at < end):
+        daily[(user_id, timezone.localdate(span.started_at), span.status)][1] += 1
+    if span.ended_at is None or span.status == "offline":
+        return
+    begin = max(span.started_at, start) if start else span.started_at
+    finish = min(span.ended_at, end) if end else span.ended_at
+    for day, seconds in split_days(begin, finish):
+        daily[(user_id, day, span.status)][0] += seconds
+    if span.status in ACTIVE_STATUSES:
+        for day, hour, seconds in split_hours(begin, finish):
+            hourly[(user_id, day, hour)] += seconds
+
+
+def add_to_table(model, unique_fields, rows):
+    """
+    Insert ``rows`` (dicts of field values), adding their non-key values to
+    any existing row with the same key. One INSERT ... ON CONFLICT DO
+    UPDATE per 500 rows, so concurrent writers never lose an increment.
+    Works on SQLite and PostgreSQL.
+    """
+    if not rows:
+        return
+    connection = connections[router.db_for_write(model)]
+    quote = connection.ops.quote_name
+    table = quote(model._meta.db_table)
+    fields = [model._meta.get_field(name) for name in rows[0]]
+    columns = ", ".join(quote(field.column) for field in fields)
+    conflict = ", ".join(quote(model._meta.get_field(name).column) for name in unique_fields)
+    updates = ", ".join(
+        f"{quote(field.column)} = {table}.{quote(field.column)} + excluded.{quote(field.column)}"
+        for field in fields
+        if field.name not in unique_fields
+    )
+    placeholder = "(" + ", ".join(["%s"] * len(fields)) + ")"
+    with connection.cursor() as cursor:
+        for begin in range(0, len(rows), 500):
+            chunk = rows[begin:begin + 500]
+            cursor.execute(
+                f"INSERT INTO {table} ({columns}) VALUES {', '.join([placeholder] * len(chunk))} "
+                f"ON CONFLICT ({conflict}) DO UPDATE SET {updates}",
+                [field.get_db_prep_save(row[field.name], connection) for row in chunk for field in fields],
+            )
+
+
+def add_rollups(rollups):
+    daily, hourly = rollups
+    add_to_table(
+        PresenceDailySummary,
+        ["user", "day", "status"],
+        [
+            {"user": user_id, "day": day, "status": status, "seconds": seconds, "transitions": transitions}
+            for (user_id, day, status), (seconds, transitions) in daily.items()
+        ],
+    )
+    add_to_table(
+        PresenceHourlySummary,
+        ["user", "day", "hour"],
+        [
+            {"user": user_id, "day": day, "hour": hour, "seconds": seconds}
+            for (user_id, day, hour), seconds in hourly.items()
+        ],
+    )
+
+
+def replace_rollups(rollups, hourly=True):
+    """
+    Overwrite the summary rows in ``rollups`` with their values.
+    """
+    daily, hours = rollups
+    written = PresenceDailySummary.objects.bulk_create(
+        [
+            PresenceDailySummary(user_id=user_id, day=day, status=status, seconds=seconds, transitions=transitions)
+            for (user_id, day, status), (seconds, transitions) in daily.items()
+        ],
+        update_conflicts=True,
+        unique_fields=["user", "day", "status"],
+        update_fields=["seconds", "transitions"],
+    )
+    if hourly:
+        PresenceHourlySummary.objects.bulk_create(
+            [
+                PresenceHourlySummary(user_id=user_id, day=day, hour=hour, seconds=seconds)
+                for (user_id, day, hour), seconds in hours.items()
+            ],
+            update_conflicts=True,
+            unique_fields=["user", "day", "hour"],
+            update_fields=["seconds"],
+        )
+    return len(written)
+
+
+def record_transitions(changes):
+    """
+    Keep PresenceSpan and the rollups in step with new statuses. ``changes``
+    holds (user_id, status, device_type, at) tuples, oldest first. A
+    different status closes the user's open span and opens a new one; a
+    repeat of the current status changes nothing. At most five queries per
+    batch.
+    """
+    if not changes:
+        return
+    with transaction.atomic(savepoint=False):
+        open_spans = {
+            str(span.user_id): span
+            for span in PresenceSpan.objects.select_for_update().filter(
+                user_id__in={str(user_id) for user_id, *_ in changes}, ended_at__isnull=True
+            )
+        }
+        closed, created = [], []
+        for user_id, status, device_type, at in changes:
+            user_id = str(user_id)
+            current = open_spans.get(user_id)
+            if current is not None:
+                if current.status == status:
+                    continue
+                current.ended_at = max(at, current.started_at)
+                if current.pk is not None:
+                    closed.append(current)
+            span = open_spans[user_id] = PresenceSpan(
+                user_id=user_id, status=status, device_type=device_type or "", started_at=at
+            )
+            created.append(span)
+        # Close first: only one open span per user is allowed.
+        if closed:
+            PresenceSpan.objects.bulk_update(closed, ["ended_at"])
+        if created:
+            PresenceSpan.objects.bulk_create(created)
+
+        rollups = new_rollups()
+        for span in closed:
+            accumulate(rollups, span, transition=False)  # counted when it was opened
+        for span in created:
+            accumulate(rollups, span)
+        add_rollups(rollups)
+
+
+def rebuild_rollups(user_ids):
+    """
+    Recompute the daily and hourly rollups of ``user_ids`` from their spans.
+    Days before the compaction watermark, whose spans are gone, are kept.
+    """
+    watermark = get_compaction_watermark()
+    with transaction.atomic():
+        stale = {"user_id__in": user_ids}
+        if watermark:
+            stale["day__gte"] = timezone.localdate(watermark)
+        PresenceDailySummary.objects.filter(**stale).delete()
+        PresenceHourlySummary.objects.filter(**stale).delete()
+        rollups = new_rollups()
+        spans = PresenceSpan.objects.filter(user_id__in=user_ids)
+        if watermark:
+            spans = spans.filter(Q(ended_at__gt=watermark) | Q(ended_at__isnull=True))
+        for span in spans.iterator():
+            accumulate(rollups, span, start=watermark)
+        return replace_rollups(rollups)
+
+
+def rebuild_spans(user_ids):
+    """
+    Recreate the spans of ``user_ids`` from their raw presence rows, then
+    their rollups.
+    """
+    with transaction.atomic():
+        PresenceSpan.objects.filter(user_id__in=user_ids).delete()
+        rows = (
+            Presence.objects.filter(user_id__in=user_ids)
+            .order_by("user_id", "last_seen", "id")
+            .values_list("user_id", "status", "device_type", "last_seen")
+        )
+        spans = []
+        for user_id, samples in groupby(rows.iterator(), key=lambda row: row[0]):
+            current = None
+            for _, status, device_type, at in samples:
+                if current is not None and current.status == status:
+                    continue
+                if current is not None:
+                    current.ended_at = at
+                current = PresenceSpan(user_id=user_id, status=status, device_type=device_type, started_at=at)
+                spans.append(current)
+        PresenceSpan.objects.bulk_create(spans)
+        rebuild_rollups(user_ids)
+    return len(spans)
+
+
+def get_compaction_watermark():
+    """
+    The cutoff of the latest compaction, or None. Raw rows and closed spans
+    before it have been deleted; only the rollups cover that time.
+    """
+    return PresenceCompaction.objects.order_by("-cutoff").values_list("cutoff", flat=True).first()
+
+
+def get_open_span(user_id):
+    return PresenceSpan.objects.filter(user_id=user_id, ended_at__isnull=True).first()
+
+
+def get_daily_status_totals(user_id, first_day, last_day, open_span=None):
+    """
+    {day: {status: {"seconds", "transitions"}}} for first_day..last_day
+    inclusive: the daily rollups plus the time so far in the open span.
+    Pass ``open_span`` if it has already been loaded.
+    """
+    days = defaultdict(dict)
+    for row in PresenceDailySummary.objects.filter(user_id=user_id, day__gte=first_day, day__lte=last_day).values(
+        "day", "status", "seconds", "transitions"
+    ):
+        days[row["day"]][row["status"]] = {"seconds": row["seconds"], "transitions": row["transitions"]}
+
+    span = open_span if open_span is not None else get_open_span(user_id)
+    if span is not None and span.status != "offline":
+        begin = max(span.started_at, day_start(first_day))
+        end = min(timezone.now(), day_start(last_day + datetime.timedelta(days=1)))
+        for day, seconds in split_days(begin, end):
+            totals = days[day].setdefault(span.status, {"seconds": 0, "transitions": 0})
+            totals["seconds"] += seconds
+    return dict(days)
+
+
+def get_status_durations(user_id, start, end):
+    """
+    Seconds spent in each status from the day of ``start`` through the day
+    before ``end`` (the rollups are daily), plus the open span's time
+    within [start, end).
+    """
+    rows = (
+        PresenceDailySummary.objects.filter(
+            user_id=user_id, day__gte=timezone.localdate(start), day__lt=timezone.localdate(end)
+        )
+        .values("status")
+        .annotate(total=Sum("seconds"))
+    )
+    totals = defaultdict(float, {row["status"]: row["total"] for row in rows})
+    span = get_open_span(user_id)
+    if span is not None and span.status != "offline":
+        totals[span.status] += max((min(end, timezone.now()) - max(span.started_at, start)).total_seconds(), 0)
+    return {status: seconds for status, seconds in totals.items() if seconds}
+
+
+def compaction_cutoff(retention_days, now=None):
+    today = timezone.localdate(now or timezone.now())
+    return day_start(today - datetime.timedelta(days=retention_days))
+
+
+def superseded_rows(watermark):
+    """
+    Raw rows before ``watermark`` other than each user's last one, which is
+    kept as the user's current status.
+    """
+    newer = Presence.objects.filter(user_id=OuterRef("user_id"), last_seen__lt=watermark).filter(
+        Q(last_seen__gt=OuterRef("last_seen")) | Q(last_seen=OuterRef("last_seen"), id__gt=OuterRef("id"))
+    )
+    return Presence.objects.filter(last_seen__lt=watermark).filter(Exists(newer))
+
+
+def roll_up(start, cutoff, batch_size):
+    """
+    Recompute the daily rollups for [start, cutoff) from spans, a batch of
+    users at a time, before those spans are deleted. This repairs any drift
+    in the incremental rollups and is safe to repeat. Returns the number of
+    summary rows written.
+    """
+    written = 0
+    spans = PresenceSpan.objects.filter(started_at__lt=cutoff)
+    if start:
+        spans = spans.filter(Q(ended_at__gt=start) | Q(ended_at__isnull=True))
+    users = spans.order_by("user_id").values_list("user_id", flat=True).distinct()
+    after = None
+    while True:
+        batch = list((users.filter(user_id__gt=after) if after else users)[:batch_size])
+        if not batch:
+            return written
+        after = batch[-1]
+        rollups = new_rollups()
+        for span in spans.filter(user_id__in=batch).iterator():
+            accumulate(rollups, span, start=start, end=cutoff)
+        written += replace_rollups(rollups, hourly=False)
+
+
+def delete_in_batches(queryset, batch_size):
+    deleted = 0
+    while True:
+        ids = list(queryset.values_list("pk", flat=True)[:batch_size])
+        if not ids:
+            return deleted
+        deleted += queryset.model.objects.filter(pk__in=ids).delete()[0]
+
+
+def delete_superseded(watermark, batch_size):
+    delete_in_batches(PresenceSpan.objects.filter(ended_at__lte=watermark), batch_size)
+    return delete_in_batches(superseded_rows(watermark), batch_size)
+
+
+def compact_presence_history(retention_days=None, batch_size=None):
+    """
+    Bring the daily rollups for everything older than ``retention_days`` up
+    to date, then delete the raw rows and closed spans they cover in
+    batches. Returns the PresenceCompaction recorded for this run, or None
+    if there was nothing new to compact.
+    """
+    config = get_history_settings()
+    retention_days = config["RETENTION_DAYS"] if retention_days is None else retention_days
+    batch_size = batch_size or config["BATCH_SIZE"]
+    cutoff = compaction_cutoff(retention_days)
+
+    # Finish the deletes of a previous run first.
+    start = get_compaction_watermark()
+    if start is not None:
+        delete_superseded(start, batch_size)
+        if start >= cutoff:
+            return None
+
+    summaries = roll_up(start, cutoff, batch_size)
+    compaction = PresenceCompaction.objects.create(cutoff=cutoff, summaries=summaries)
+    compaction.deleted = delete_superseded(cutoff, batch_size)
+    compaction.save(update_fields=["deleted"])
+    return compaction
@@ -0,0 +1,188 @@
+# presence/layers.py
+import asyncio
+import random
+import string
+import time
+from copy import deepcopy
+
+from channels.exceptions import ChannelFull
+from channels.layers import BaseChannelLayer
+
+OVERFLOW_POLICIES = ("drop_newest", "drop_oldest")
+
+
+class LocalChannelLayer(BaseChannelLayer):
+    """
+    In-process channel layer for single-process deployments, where every
+    consumer lives in this process and Redis would only add a round-trip.
+
+    Compared to channels' InMemoryChannelLayer:
+
+    - group_send copies the message once and enqueues the same object for
+      every member, instead of a deep copy and a task per member. Receivers
+      must treat messages as read-only.
+    - Expiry is checked lazily per channel rather than by scanning every
+      channel and group on each send and receive.
+    - Every channel queue is bounded by ``capacity``. With the default
+      ``overflow="drop_newest"`` a full channel makes send() raise
+      ChannelFull and group_send() skip that member, as the channels spec
+      requires. ``"drop_oldest"`` evicts the oldest queued message instead,
+      which suits presence where only the latest state matters.
+    - A member whose queue is full of expired messages is treated as dead
+      and removed from its groups.
+
+    Counters are available from get_stats().
+    """
+
+    extensions = ["groups", "flush"]
+
+    def __init__(self, expiry=60, group_expiry=86400, capacity=100, channel_capacity=None, overflow="drop_newest", **kwargs):
+        super().__init__(expiry=expiry, capacity=capacity, channel_capacity=channel_capacity, **kwargs)
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"overflow must be one of {', '.join(OVERFLOW_POLICIES)}")
+        self.group_expiry = group_expiry
+        self.overflow = overflow
+        self.channels = {}
+        self.groups = {}
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.stats = {
+            "sent": 0,
+            "group_sent": 0,
+            "delivered": 0,
+            "received": 0,
+            "dropped_full": 0,
+            "dropped_oldest": 0,
+            "expired": 0,
+            "evicted_channels": 0,
+        }
+
+    def get_stats(self):
+        """
+        Counters since the last reset, plus current queue sizes.
+        """
+        depths = [queue.qsize() for queue in self.channels.values()]
+        return {
+            **self.stats,
+            "channels": len(self.channels),
+            "groups": len(self.groups),
+            "queued": sum(depths),
+            "max_queue_depth": max(depths, default=0),
+        }
+
+    # Channel layer API
+
+    def _queue(self, channel):
+        queue = self.channels.get(channel)
+        if queue is None:
+            queue = self.channels[channel] = asyncio.Queue(maxsize=self.get_capacity(channel))
+        return queue
+
+    def _drop_expired(self, queue, now):
+        # Messages are queued in expiry order, so only the head needs checking.
+        while not queue.empty() and queue._queue[0][0] < now:
+            queue.get_nowait()
+            self.stats["expired"] += 1
+
+    def _put(self, channel, entry, now):
+        """
+        Enqueue (expires_at, message). Returns False if it was dropped.
+        """
+        queue = self._queue(channel)
+        if queue.full():
+            self._drop_expired(queue, now)
+        if queue.full():
+            if self.overflow == "drop_newest":
+                self.stats["dropped_full"] += 1
+                return False
+            queue.get_nowait()
+            self.stats["dropped_oldest"] += 1
+        queue.put_nowait(entry)
+        self.stats["delivered"] += 1
+        return True
+
+    async def send(self, channel, message):
+        assert isinstance(message, dict), "message is not a dict"
+        self.require_valid_channel_name(channel)
+        assert "__asgi_channel__" not in message
+        now = time.time()
+        self.stats["sent"] += 1
+        if not self._put(channel, (now + self.expiry, deepcopy(message)), now):
+            raise ChannelFull(channel)
+
+    async def receive(self, channel):
+        self.require_valid_channel_name(channel)
+        queue = self._queue(channel)
+        try:
+            while True:
+                expires_at, message = await queue.get()
+                if expires_at >= time.time():
+                    self.stats["received"] += 1
+                    return message
+                self.stats["expired"] += 1
+        finally:
+            if queue.empty() and not queue._getters:
+                self.channels.pop(channel, None)
+
+    async def new_channel(self, prefix="specific."):
+        return "%s.local!%s" % (prefix, "".join(random.choice(string.ascii_letters) for _ in range(12)))
+
+    # Flush extension
+
+    async def flush(self):
+        self.channels = {}
+        self.groups = {}
+
+    async def close(self):
+        pass
+
+    # Groups extension
+
+    async def group_add(self, group, channel):
+        self.require_valid_group_name(group)
+        self.require_valid_channel_name(channel)
+        self.groups.setdefault(group, {})[channel] = time.time()
+
+    async def group_discard(self, group, channel):
+        self.require_valid_channel_name(channel)
+        self.require_valid_group_name(group)
+        members = self.groups.get(group)
+        if members:
+            members.pop(channel, None)
+            if not members:
+                self.groups.pop(group, None)
+
+    async def group_send(self, group, message):
+        assert isinstance(message, dict), "Message is not a dict"
+        self.require_valid_group_name(group)
+        members = self.groups.get(group)
+        if not members:
+            return
+        self.stats["group_sent"] += 1
+        now = time.time()
+        # One copy shared by every member
+        entry = (now + self.expiry, deepcopy(message))
+        joined_after = now - self.group_expiry
+        for channel, joined_at in list(members.items()):
+            if joined_at < joined_after:
+                members.pop(channel, None)
+                continue
+            queue = self.channels.get(channel)
+            if queue is not None and queue.full():
+                self._drop_expired(queue, now)
+                if queue.empty():
+                    # Nobody has read this channel for a whole expiry period.
+                    self._remove_from_groups(channel)
+                    self.stats["evicted_channels"] += 1
+                    continue
+            self._put(channel, entry, now)
+        if not members:
+            self.groups.pop(group, None)
+
+    def _remove_from_groups(self, channel):
+        self.channels.pop(channel, None)
+        for group, members in list(self.groups.items()):
+            members.pop(channel, None)
+            if not members:
+                self.groups.pop(group, None)
@@ -0,0 +1,309 @@
+# presence/liveness.py
+import asyncio
+import heapq
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from .buffer import get_presence_buffer
+from .services import aget_current_presence, aget_current_presences
+
+logger = logging.getLogger(__name__)
+
+LEVELS = {"active": 0, "away": 1, "offline": 2}
+
+
+def connections_key(user_id):
+    return f"presence:liveness:{user_id}:connections"
+
+
+def activity_key(user_id):
+    return f"presence:liveness:{user_id}:activity"
+
+
+class UserLiveness:
+    __slots__ = ("connections", "last_activity", "disconnected_at", "level", "deadline", "shared_at")
+
+    def __init__(self, now):
+        self.connections = 0
+        self.last_activity = now
+        self.disconnected_at = None
+        self.level = "active"
+        self.deadline = None  # earliest live entry for this user in the heap
+        self.shared_at = None  # when last_activity was last written to the cache
+
+
+class LivenessTracker:
+    """
+    Server-side idle and disconnect detection for WebSocket users.
+
+    Consumers report connects, disconnects and every inbound frame. One task
+    on the event loop sleeps until the next deadline in a heap, then marks
+    users idle for ``away_after`` seconds as away, and users idle for
+    ``offline_after`` seconds, or disconnected for ``disconnect_grace``
+    seconds, as offline. Everything due at once goes through the presence
+    buffer as one batch, so it is written and broadcast once.
+
+    Activity only updates a timestamp. Each user has at most one live heap
+    entry; when it fires the user's state is re-checked and a new entry is
+    pushed for the next deadline, so chatty clients cost nothing extra.
+
+    A user may be connected to several workers, each with its own tracker.
+    The async methods also keep a per-user connection count and the time of
+    the last activity, written at most every ``activity_interval`` seconds,
+    in the default cache; a worker only marks someone away or offline when
+    no other worker has a connection for them that was active since.
+    """
+
+    def __init__(self, away_after=300, offline_after=900, disconnect_grace=30, activity_interval=30):
+        self.away_after = away_after
+        self.offline_after = offline_after
+        self.disconnect_grace = disconnect_grace
+        self.activity_interval = activity_interval
+        self.users = {}
+        self.heap = []
+        self.transition_count = 0
+        self._loop = None
+        self._task = None
+        self._wakeup = None
+
+    def connect(self, user_id, now=None):
+        now = time.monotonic() if now is None else now
+        state = self._ensure_state(str(user_id), now)
+        state.connections += 1
+        state.disconnected_at = None
+
+    def disconnect(self, user_id, now=None):
+        now = time.monotonic() if now is None else now
+        user_id = str(user_id)
+        state = self.users.get(user_id)
+        if state is None:
+            return
+        state.connections = max(state.connections - 1, 0)
+        if not state.connections:
+            state.disconnected_at = now
+            self._schedule(user_id, state, now + self.disconnect_grace)
+
+    def touch(self, user_id, now=None):
+        """
+        Record activity. Returns True if the tracker had marked the user away
+        or offline, in which case the caller should restore() them unless the
+        frame sets a status itself.
+        """
+        now = time.monotonic() if now is None else now
+        user_id = str(user_id)
+        state = self._ensure_state(user_id, now)
+        state.last_activity = now
+        if state.level == "active":
+            return False
+        state.level = "active"
+        self._schedule(user_id, state, now + self.away_after)
+        return True
+
+    async def aconnect(self, user_id):
+        self.connect(user_id)
+        key = connections_key(user_id)
+        await cache.aadd(key, 0, timeout=self.offline_after)
+        try:
+            await cache.aincr(key)
+        except ValueError:  # expired in between
+            await cache.aset(key, 1, timeout=self.offline_after)
+        await self.share_activity(str(user_id))
+
+    async def adisconnect(self, user_id):
+        self.disconnect(user_id)
+        try:
+            await cache.adecr(connections_key(user_id))
+        except ValueError:
+            pass  # expired: no worker saw activity for offline_after seconds
+
+    async def atouch(self, user_id):
+        """
+        touch(), also sharing the activity with other workers when it is
+        more than ``activity_interval`` seconds since it was last shared.
+        """
+        restored = self.touch(user_id)
+        state = self.users.get(str(user_id))
+        if state is not None and (state.shared_at is None or state.last_activity - state.shared_at >= self.activity_interval):
+            await self.share_activity(str(user_id))
+        return restored
+
+    async def share_activity(self, user_id):
+        state = self.users.get(user_id)
+        if state is not None:
+            state.shared_at = state.last_activity
+        # Both keys live as long as someone is active, so a count left behind
+        # by a worker that died expires with it.
+        await cache.aset(activity_key(user_id), time.time(), timeout=self.offline_after)
+        await cache.atouch(connections_key(user_id), timeout=self.offline_after)
+
+    async def active_elsewhere(self, transitions, now):
+        """
+        The users in ``transitions`` that another worker still has a
+        connection for, with activity too recent for their new level.
+        """
+        keys = {user_id: (connections_key(user_id), activity_key(user_id)) for user_id in transitions}
+        shared = await cache.aget_many([key for pair in keys.values() for key in pair])
+        wall_now = time.time() - (time.monotonic() - now)
+        active = set()
+        for user_id, level in transitions.items():
+            state = self.users.get(user_id)
+            others = (shared.get(keys[user_id][0]) or 0) - (state.connections if state else 0)
+            last_activity = shared.get(keys[user_id][1])
+            idle_after = self.away_after if level == "away" else self.offline_after
+            # The shared time lags the real activity by up to activity_interval
+            if others > 0 and last_activity is not None and wall_now - last_activity < idle_after + self.activity_interval:
+                active.add(user_id)
+        return active
+
+    async def restore(self, user_id):
+        record = await aget_current_presence(user_id)
+        await get_presence_buffer().add(user_id, "online", record["device_type"] if record else "unknown")
+
+    def _ensure_state(self, user_id, now):
+        self._ensure_runner()
+        state = self.users.get(user_id)
+        if state is None:
+            state = self.users[user_id] = UserLiveness(now)
+            self._schedule(user_id, state, now + self.away_after)
+        return state
+
+    def _schedule(self, user_id, state, deadline):
+        if state.deadline is not None and state.deadline <= deadline:
+            return  # the existing entry fires first and reschedules
+        state.deadline = deadline
+        heapq.heappush(self.heap, (deadline, user_id))
+        if self.heap[0][1] == user_id and self._wakeup is not None:
+            self._wakeup.set()
+
+    def due_level(self, state, now):
+        if state.disconnected_at is not None and now - state.disconnected_at >= self.disconnect_grace:
+            return "offline"
+        idle = now - state.last_activity
+        if idle >= self.offline_after:
+            return "offline"
+        if idle >= self.away_after:
+            return "away"
+        return "active"
+
+    def next_deadline(self, state):
+        deadlines = []
+        if state.level == "active":
+            deadlines.append(state.last_activity + self.away_after)
+        if state.level != "offline":
+            deadlines.append(state.last_activity + self.offline_after)
+            if state.disconnected_at is not None:
+                deadlines.append(state.disconnected_at + self.disconnect_grace)
+        return min(deadlines, default=None)
+
+    def collect_due(self, now):
+        """
+        Pop every heap entry due by ``now`` and return {user_id: new level}
+        for users whose level got worse.
+        """
+        transitions = {}
+        while self.heap and self.heap[0][0] <= now:
+            deadline, user_id = heapq.heappop(self.heap)
+            state = self.users.get(user_id)
+            if state is None or state.deadline != deadline:
+                continue  # superseded by an earlier entry
+            state.deadline = None
+            level = self.due_level(state, now)
+            if LEVELS[level] > LEVELS[state.level]:
+                state.level = level
+                transitions[user_id] = level
+            if state.level == "offline" and not state.connections:
+                del self.users[user_id]
+                continue
+            deadline = self.next_deadline(state)
+            if deadline is not None:
+                self._schedule(user_id, state, max(deadline, now))
+        return transitions
+
+    async def expire(self, now=None):
+        """
+        Apply every transition due by ``now`` in one buffered batch.
+        """
+        now = time.monotonic() if now is None else now
+        transitions = self.collect_due(now)
+        if not transitions:
+            return {}
+        # Left to the workers the user is still connected to
+        for user_id in await self.active_elsewhere(transitions, now):
+            del transitions[user_id]
+        records = await aget_current_presences(list(transitions))
+        buffer = get_presence_buffer()
+        written = {}
+        for user_id, level in transitions.items():
+            record = records.get(user_id)
+            current = record["status"] if record else None
+            # Only idle users who were online go away; explicit statuses such
+            # as busy are kept until the user goes offline.
+            if (level == "away" and current == "online") or (level == "offline" and current not in (None, "offline")):
+                await buffer.add(user_id, level, record["device_type"])
+                written[user_id] = level
+        if written:
+            await buffer.flush()
+            self.transition_count += len(written)
+            logger.debug(f"Liveness marked {len(written)} users away/offline")
+        return written
+
+    def _ensure_runner(self):
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        if self._loop is not loop:
+            # Connections counted on another loop are gone with it.
+            self.users.clear()
+            self.heap.clear()
+            self._loop = loop
+            self._wakeup = asyncio.Event()
+            self._task = None
+        if self._task is None or self._task.done():
+            self._task = loop.create_task(self.run())
+
+    async def run(self):
+        while True:
+            try:
+                await self.expire()
+            except Exception:
+                logger.exception("Liveness expiry failed")
+            timeout = self.heap[0][0] - time.monotonic() if self.heap else None
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+
+_tracker = None
+
+
+def get_liveness_tracker():
+    """
+    Return the process-wide tracker configured by settings.PRESENCE_LIVENESS.
+    """
+    global _tracker
+    if _tracker is None:
+        config = getattr(settings, "PRESENCE_LIVENESS", {})
+        _tracker = LivenessTracker(
+            away_after=config.get("AWAY_AFTER", 300),
+            offline_after=config.get("OFFLINE_AFTER", 900),
+            disconnect_grace=config.get("DISCONNECT_GRACE", 30),
+            activity_interval=config.get("ACTIVITY_INTERVAL", 30),
+        )
+    return _tracker
+
+
+@receiver(setting_changed)
+def reset_liveness_tracker(setting, **kwargs):
+    global _tracker
+    if setting == "PRESENCE_LIVENESS":
+        if _tracker is not None and _tracker._task is not None:
+            _tracker._task.cancel()
+        _tracker = None
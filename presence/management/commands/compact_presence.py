@@ -0,0 +1,45 @@
+# presence/management/commands/compact_presence.py
+
+from django.core.management.base import BaseCommand
+
+from presence.history import (
+    compact_presence_history,
+    compaction_cutoff,
+    get_history_settings,
+    superseded_rows,
+)
+from presence.models import Presence
+
+
+class Command(BaseCommand):
+    help = (
+        'Roll presence history older than the retention period up into per-user daily summaries '
+        'and delete the raw rows in batches, keeping each user\'s last known status.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--retention-days', type=int, help='Raw rows to keep, in days (default: PRESENCE_HISTORY)')
+        parser.add_argument('--batch-size', type=int, help='Users per rollup batch and rows per delete')
+        parser.add_argument('--dry-run', action='store_true', help='Only report how many rows would be compacted')
+
+    def handle(self, *args, **options):
+        retention_days = options['retention_days']
+        if retention_days is None:
+            retention_days = get_history_settings()['RETENTION_DAYS']
+
+        if options['dry_run']:
+            cutoff = compaction_cutoff(retention_days)
+            self.stdout.write(
+                f'{Presence.objects.filter(last_seen__lt=cutoff).count()} presence rows before {cutoff:%Y-%m-%d}, '
+                f'{superseded_rows(cutoff).count()} would be deleted'
+            )
+            return
+
+        compaction = compact_presence_history(retention_days, options['batch_size'])
+        if compaction is None:
+            self.stdout.write('Nothing to compact')
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f'Compacted history before {compaction.cutoff:%Y-%m-%d}: '
+            f'{compaction.summaries} daily summaries written, {compaction.deleted} presence rows deleted'
+        ))
@@ -0,0 +1,30 @@
+# presence/management/commands/rebuild_presence_spans.py
+
+from django.core.management.base import BaseCommand
+
+from presence.history import rebuild_spans
+from presence.models import Presence
+
+
+class Command(BaseCommand):
+    help = (
+        'Rebuild presence spans from the raw presence history, e.g. after upgrading from a '
+        'version without spans. Existing spans of the processed users are replaced.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Users per transaction')
+
+    def handle(self, *args, **options):
+        users = Presence.objects.order_by('user_id').values_list('user_id', flat=True).distinct()
+        after = None
+        totals = {'users': 0, 'spans': 0}
+        while True:
+            batch = list((users.filter(user_id__gt=after) if after else users)[:options['batch_size']])
+            if not batch:
+                break
+            after = batch[-1]
+            totals['spans'] += rebuild_spans(batch)
+            totals['users'] += len(batch)
+
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {totals["spans"]} spans for {totals["users"]} users'))
@@ -0,0 +1,87 @@
+# presence/middleware.py
+from urllib.parse import parse_qs
+
+from channels.middleware import BaseMiddleware
+from django.contrib.auth.models import AnonymousUser
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.settings import api_settings
+from users.cache import get_user_cache
+from users.revocation import ais_token_revoked
+
+SUBPROTOCOL_MARKER = "bearer"
+
+# Revocation is checked separately so it can be awaited
+_authentication = JWTAuthentication()
+
+
+def get_scope_token(scope):
+    """
+    Find the raw JWT in a WebSocket scope. Checked in order:
+
+    - an ``Authorization: Bearer <token>`` header,
+    - the subprotocol pair ``["bearer", "<token>"]``,
+    - the ``token`` query-string parameter.
+
+    Returns (token, subprotocol) where subprotocol is the value the consumer
+    has to accept with, or None.
+    """
+    headers = dict(scope.get("headers", []))
+    authorization = headers.get(b"authorization", b"").decode()
+    if authorization:
+        parts = authorization.split()
+        if len(parts) == 2 and parts[0] in api_settings.AUTH_HEADER_TYPES:
+            return parts[1], None
+
+    subprotocols = scope.get("subprotocols") or []
+    if SUBPROTOCOL_MARKER in subprotocols:
+        index = subprotocols.index(SUBPROTOCOL_MARKER)
+        if index + 1 < len(subprotocols):
+            return subprotocols[index + 1], SUBPROTOCOL_MARKER
+
+    query = parse_qs(scope.get("query_string", b"").decode())
+    token = query.get("token", [None])[0]
+    return token, None
+
+
+def validate_token(raw_token):
+    """
+    Validate the signature and expiry locally. Returns the validated token
+    or None; never touches the database. Revocation is checked by
+    authenticate_token.
+    """
+    if not raw_token:
+        return None
+    try:
+        return _authentication.get_validated_token(raw_token)
+    except (InvalidToken, TokenError):
+        return None
+
+
+async def authenticate_token(raw_token):
+    """
+    Resolve a raw JWT to an active user, or None. Users come from the
+    process-wide user cache; only a cache miss goes to the database.
+    """
+    validated_token = validate_token(raw_token)
+    if validated_token is None or await ais_token_revoked(validated_token):
+        return None
+    user_id = validated_token.get(api_settings.USER_ID_CLAIM)
+    if user_id is None:
+        return None
+    return await get_user_cache().aload(user_id)
+
+
+class JWTAuthMiddleware(BaseMiddleware):
+    """
+    Populates scope["user"] from a JWT for WebSocket connections, replacing
+    the session/cookie based AuthMiddlewareStack.
+    """
+
+    async def __call__(self, scope, receive, send):
+        scope = dict(scope)
+        raw_token, subprotocol = get_scope_token(scope)
+        user = await authenticate_token(raw_token)
+        scope["user"] = user or AnonymousUser()
+        scope["auth_subprotocol"] = subprotocol if user else None
+        return await super().__call__(scope, receive, send)
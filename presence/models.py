@@ -1,6 +1,7 @@
 # presence/models.py
 from django.db import models
 from django.contrib.auth import get_user_model
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
 User = get_user_model()
@@ -22,4 +23,129 @@ class Presence(models.Model):
         db_table = "presence_record"
         indexes = [
             models.Index(fields=["user", "last_seen"]),
-        ]
\ No newline at end of file
+        ]
+
+
+class PresenceSpan(models.Model):
+    """
+    One continuous period in a status. The open span (``ended_at`` null)
+    is the user's current status and is closed when the status changes.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="presence_spans")
+    status = models.CharField(max_length=20, choices=Presence.STATUS_CHOICES)
+    device_type = models.CharField(max_length=50, blank=True)
+    started_at = models.DateTimeField()
+    ended_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = "presence_span"
+        constraints = [
+            # Also the index for "current span of this user"
+            models.UniqueConstraint(
+                fields=["user"], condition=models.Q(ended_at__isnull=True), name="unique_open_presence_span"
+            ),
+        ]
+        indexes = [
+            # Range overlap: started_at < end AND (ended_at > start OR ended_at IS NULL)
+            models.Index(fields=["user", "started_at", "ended_at"]),
+        ]
+
+    @property
+    def duration(self):
+        return ((self.ended_at or timezone.now()) - self.started_at).total_seconds()
+
+
+class Team(models.Model):
+    """
+    A group of users who can all watch each other's presence.
+    """
+    name = models.CharField(max_length=100)
+    members = models.ManyToManyField(User, through="TeamMembership", related_name="teams")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = "presence_team"
+
+    def __str__(self):
+        return self.name
+
+
+class TeamMembership(models.Model):
+    team = models.ForeignKey(Team, on_delete=models.CASCADE, related_name="memberships")
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="team_memberships")
+    joined_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = "presence_team_membership"
+        constraints = [
+            models.UniqueConstraint(fields=["team", "user"], name="unique_team_membership"),
+        ]
+
+
+class PresenceSubscription(models.Model):
+    """
+    Lets ``watcher`` see ``target``'s presence. Created by the target, so
+    users decide who can follow them.
+    """
+    watcher = models.ForeignKey(User, on_delete=models.CASCADE, related_name="watching")
+    target = models.ForeignKey(User, on_delete=models.CASCADE, related_name="watchers")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = "presence_subscription"
+        constraints = [
+            models.UniqueConstraint(fields=["watcher", "target"], name="unique_presence_subscription"),
+        ]
+
+
+class PresenceDailySummary(models.Model):
+    """
+    Per-user, per-day rollup of presence spans, added to as spans open and
+    close. ``seconds`` is time spent in ``status`` that day in closed spans
+    (not tracked for offline) and ``transitions`` the number of changes
+    into it. These rows outlive the raw history removed by compact_presence.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="presence_summaries")
+    day = models.DateField()
+    status = models.CharField(max_length=20, choices=Presence.STATUS_CHOICES)
+    seconds = models.FloatField(default=0)
+    transitions = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        db_table = "presence_daily_summary"
+        constraints = [
+            models.UniqueConstraint(fields=["user", "day", "status"], name="unique_presence_daily_summary"),
+        ]
+
+
+class PresenceHourlySummary(models.Model):
+    """
+    Seconds a user spent online or busy in one local hour of a day, for
+    peak-activity reporting.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="presence_hourly_summaries")
+    day = models.DateField()
+    hour = models.PositiveSmallIntegerField()
+    seconds = models.FloatField(default=0)
+
+    class Meta:
+        db_table = "presence_hourly_summary"
+        constraints = [
+            models.UniqueConstraint(fields=["user", "day", "hour"], name="unique_presence_hourly_summary"),
+        ]
+
+
+class PresenceCompaction(models.Model):
+    """
+    One compact_presence run. Raw presence rows before the latest
+    ``cutoff`` only survive as each user's last known status; history
+    before it is read from PresenceDailySummary.
+    """
+    cutoff = models.DateTimeField()
+    summaries = models.PositiveIntegerField(default=0)
+    deleted = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = "presence_compaction"
+        get_latest_by = "cutoff"
@@ -0,0 +1,183 @@
+# presence/replay.py
+import os
+import threading
+from collections import deque
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from .dispatch import presence_dispatched
+
+
+class PresenceReplayBuffer:
+    """
+    The last ``size`` presence updates seen by this process, numbered in
+    order, so that event-stream clients can resume after a reconnect with
+    Last-Event-ID instead of starting over.
+
+    Updates are recorded when they are dispatched here and when a stream
+    receives them from the channel layer, so one update may be recorded
+    several times; it keeps the number it got first. IDs are
+    "<epoch>:<seq>" where the epoch is unique to this buffer, so IDs from
+    another worker or from before a restart are recognised as unknown.
+
+    Updates dispatched by other workers only arrive while a local stream
+    is in the user's group, so streams report what they watch. A user is
+    only replayed from a sequence number at which they were already being
+    watched here; starting to watch someone takes a number of its own, so
+    no earlier position can be mistaken for a covered one. The watch start
+    is kept after the last stream closes, so a lone client can resume.
+    For the time nobody watched the user, updates from other workers may
+    be missing, so replay is then only used if the newest update recorded
+    for the user is what the presence store currently holds.
+    """
+
+    def __init__(self, size=1000):
+        self.size = size
+        self.epoch = os.urandom(4).hex()
+        self.entries = deque()  # (seq, key, data)
+        self.index = {}  # key -> seq
+        self.latest = {}  # user_id -> key of their newest retained update
+        self.last_seq = 0
+        self.dropped_seq = 0  # newest entry evicted so far
+        self.watchers = {}  # user_id -> open streams watching them
+        self.watched_since = {}  # user_id -> number taken when first watched
+        self.gaps = {}  # user_id -> (left, rejoined or None) for the latest time nobody watched them
+        self.unwatched = deque()  # (left, user_id), to forget users once that is trimmed
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(data):
+        return (data["user_id"], data["last_seen"], data["status"])
+
+    def record(self, data):
+        """
+        Return the sequence number of ``data``, numbering it if it is new.
+        """
+        key = self.make_key(data)
+        with self._lock:
+            seq = self.index.get(key)
+            if seq is not None:
+                return seq
+            self.last_seq = seq = self.last_seq + 1
+            self.entries.append((seq, key, data))
+            self.index[key] = seq
+            self.latest[key[0]] = key
+            while len(self.entries) > self.size:
+                self.dropped_seq, old_key, _ = self.entries.popleft()
+                del self.index[old_key]
+                if self.latest.get(old_key[0]) == old_key:
+                    del self.latest[old_key[0]]
+            self._forget_unwatched()
+            return seq
+
+    def _forget_unwatched(self):
+        # Every retained ID was issued after these users were last watched,
+        # by streams that didn't watch them, so they can't be replayed.
+        while self.unwatched and self.unwatched[0][0] <= self.dropped_seq:
+            left, user_id = self.unwatched.popleft()
+            if user_id not in self.watchers and self.gaps.get(user_id, (None,))[0] == left:
+                self.watched_since.pop(user_id, None)
+                self.gaps.pop(user_id, None)
+
+    def event_id(self, seq):
+        return f"{self.epoch}:{seq}"
+
+    def parse_event_id(self, event_id):
+        """
+        The sequence number in ``event_id``, or None if it wasn't issued by
+        this buffer.
+        """
+        epoch, _, seq = (event_id or "").partition(":")
+        if epoch != self.epoch or not seq.isdigit():
+            return None
+        return int(seq)
+
+    def watch(self, user_ids):
+        """
+        Note that a stream has joined the groups of ``user_ids``, so every
+        update for them now reaches this process.
+        """
+        with self._lock:
+            new = [user_id for user_id in user_ids if not self.watchers.get(user_id)]
+            if new:
+                self.last_seq += 1
+            for user_id in new:
+                if user_id not in self.watched_since:
+                    self.watched_since[user_id] = self.last_seq
+                elif user_id in self.gaps:
+                    self.gaps[user_id] = (self.gaps[user_id][0], self.last_seq)
+            for user_id in user_ids:
+                self.watchers[user_id] = self.watchers.get(user_id, 0) + 1
+
+    def unwatch(self, user_ids):
+        with self._lock:
+            for user_id in user_ids:
+                count = self.watchers.get(user_id, 0) - 1
+                if count > 0:
+                    self.watchers[user_id] = count
+                else:
+                    self.watchers.pop(user_id, None)
+                    self.gaps[user_id] = (self.last_seq, None)
+                    self.unwatched.append((self.last_seq, user_id))
+
+    def unwatched_since(self, seq, user_ids):
+        """
+        Those of ``user_ids`` that nobody here watched for a while after
+        ``seq``; since() needs their current store records.
+        """
+        with self._lock:
+            return [
+                user_id for user_id in user_ids
+                if user_id in self.gaps and (self.gaps[user_id][1] is None or self.gaps[user_id][1] > seq)
+            ]
+
+    def since(self, seq, user_ids, current=None):
+        """
+        [(seq, data)] recorded after ``seq`` for ``user_ids``, or None if
+        some of them have already been dropped or updates for some of them
+        may have been missed since. ``current`` maps the users returned by
+        unwatched_since() to their records in the presence store.
+        """
+        current = current or {}
+        with self._lock:
+            if seq > self.last_seq or seq < self.dropped_seq:
+                return None
+            for user_id in user_ids:
+                if self.watched_since.get(user_id, seq + 1) > seq:
+                    return None
+                left, rejoined = self.gaps.get(user_id, (None, None))
+                if left is not None and (rejoined is None or rejoined > seq):
+                    record = current.get(user_id)
+                    if record is None or self.make_key(record) != self.latest.get(user_id):
+                        return None
+            return [(number, data) for number, key, data in self.entries if number > seq and key[0] in user_ids]
+
+
+_buffer = None
+
+
+def get_replay_buffer():
+    """
+    Return the process-wide buffer sized by settings.PRESENCE_EVENT_STREAM.
+    """
+    global _buffer
+    if _buffer is None:
+        config = getattr(settings, "PRESENCE_EVENT_STREAM", {})
+        _buffer = PresenceReplayBuffer(size=config.get("REPLAY_SIZE", 1000))
+    return _buffer
+
+
+@receiver(setting_changed)
+def reset_replay_buffer(setting, **kwargs):
+    global _buffer
+    if setting == "PRESENCE_EVENT_STREAM":
+        _buffer = None
+
+
+@receiver(presence_dispatched)
+def record_dispatched(sender, events, **kwargs):
+    if _buffer is not None:
+        for data in events:
+            _buffer.record(data)
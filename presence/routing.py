@@ -1,7 +1,14 @@
 # presence/routing.py
 from django.urls import re_path
 from . import consumers
+from .middleware import JWTAuthMiddleware
 
 websocket_urlpatterns = [
+    re_path(r"ws/presence/$", consumers.MultiplexPresenceConsumer.as_asgi()),
     re_path(r"ws/presence/(?P<user_id>[^/]+)/$", consumers.PresenceConsumer.as_asgi()),
-]
\ No newline at end of file
+]
+
+# Served ahead of Django on the ASGI "http" route
+http_urlpatterns = [
+    re_path(r"^sse/presence/$", JWTAuthMiddleware(consumers.PresenceEventStreamConsumer.as_asgi())),
+]
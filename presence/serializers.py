@@ -1,7 +1,9 @@
 # presence/serializers.py
 from rest_framework import serializers
-from .models import Presence
+from .models import Presence, PresenceSubscription
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.utils.translation import gettext_lazy as _
 
 User = get_user_model()
 
@@ -11,4 +13,39 @@ class PresenceDataSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Presence
-        fields = ["user_id", "status", "device_type", "last_seen", "predicted_response_time", "engagement_score"]
\ No newline at end of file
+        fields = ["user_id", "status", "device_type", "last_seen", "predicted_response_time", "engagement_score"]
+
+class PresenceRecordSerializer(serializers.Serializer):
+    """
+    Serializes a record from the current-presence store.
+    """
+    user_id = serializers.CharField()
+    status = serializers.CharField()
+    device_type = serializers.CharField()
+    last_seen = serializers.DateTimeField()
+    predicted_response_time = serializers.FloatField(allow_null=True)
+    engagement_score = serializers.FloatField(allow_null=True)
+
+class PresenceSnapshotRequestSerializer(serializers.Serializer):
+    user_ids = serializers.ListField(
+        child=serializers.UUIDField(),
+        allow_empty=False,
+        max_length=getattr(settings, "PRESENCE_SNAPSHOT_MAX_IDS", 5000),
+    )
+
+class WatcherSerializer(serializers.ModelSerializer):
+    """
+    A user allowed to watch the authenticated user's presence.
+    """
+    user_id = serializers.PrimaryKeyRelatedField(source="watcher", queryset=User.objects.filter(is_active=True))
+    username = serializers.CharField(source="watcher.username", read_only=True)
+
+    class Meta:
+        model = PresenceSubscription
+        fields = ["user_id", "username", "created_at"]
+        read_only_fields = ["created_at"]
+
+    def validate_user_id(self, value):
+        if value == self.context["request"].user:
+            raise serializers.ValidationError(_("You can always see your own presence."))
+        return value
@@ -0,0 +1,63 @@
+# presence/services.py
+from asgiref.sync import sync_to_async
+
+from .buffer import get_presence_buffer
+from .graph import get_subscription_graph
+from .store import get_presence_store, latest_presences, presence_to_record
+
+STATUSES = ("online", "away", "offline", "busy")
+
+
+# Async entry points for WebSocket consumers. Hot paths (store reads, cached
+# users and subscription graph, buffered writes) are answered on the event
+# loop; only cold misses reach the database, through the async ORM.
+
+
+async def aget_current_presences(user_ids):
+    """
+    get_current_presences() for the event loop.
+    """
+    store = get_presence_store()
+    user_ids = [str(user_id) for user_id in user_ids]
+    records = await store.aget_many(user_ids)
+    missing = [user_id for user_id in user_ids if user_id not in records]
+    if missing:
+        loaded = {
+            str(presence.user_id): presence_to_record(presence, engagement_score=presence.user_engagement_score)
+            async for presence in latest_presences(missing)
+        }
+        await store.aset_many(loaded)
+        records.update(loaded)
+    return records
+
+
+async def aget_current_presence(user_id):
+    return (await aget_current_presences([user_id])).get(str(user_id))
+
+
+async def auser_can_watch(user, user_id):
+    """
+    user_can_watch() for the event loop. The subscription graph is only
+    loaded in a worker thread when it has expired.
+    """
+    if user.is_staff:
+        return True
+    graph = get_subscription_graph()
+    index = graph.fresh_index()
+    if index is None:
+        index = await sync_to_async(graph.get_index)()
+    return graph.can_watch(user.id, user_id, index=index)
+
+
+async def awatchable(user, user_ids):
+    return [user_id for user_id in user_ids if await auser_can_watch(user, user_id)]
+
+
+async def aupdate_presence(user_id, status, device_type="unknown", predicted_response_time=None):
+    """
+    Queue a presence update in the write buffer. Returns False if the status
+    is unknown or the update was coalesced away.
+    """
+    if status not in STATUSES:
+        return False
+    return await get_presence_buffer().add(user_id, status, device_type, predicted_response_time)
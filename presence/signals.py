@@ -1,47 +1,29 @@
 # presence/signals.py
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
-from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync
+from django.utils import timezone
+from .dispatch import dispatcher
+from .history import record_transitions
 from .models import Presence
+from .store import get_presence_store, presence_to_record
 
 @receiver(post_save, sender=Presence)
-def broadcast_presence_update(sender, instance, created, **kwargs):
+def dispatch_presence_event(sender, instance, created, **kwargs):
     if created:
-        channel_layer = get_channel_layer()
-        async_to_sync(channel_layer.group_send)(
-            f"presence_{instance.user_id}",
-            {
-                "type": "presence_update",
-                "data": {
-                    "user_id": str(instance.user_id),
-                    "status": instance.status,
-                    "device_type": instance.device_type,
-                    "last_seen": instance.last_seen.isoformat(),
-                    "predicted_response_time": instance.predicted_response_time,
-                    "engagement_score": instance.user.engagement_score,
-                },
-            },
-        )
-        
-@receiver(post_save, sender=Presence)
-def update_engagement_score(sender, instance, created, **kwargs):
-    if created and instance.status == "online":
-        instance.user.engagement_score += 0.1
-        instance.user.save(update_fields=["engagement_score"])
-        # Include in WebSocket broadcast
-        channel_layer = get_channel_layer()
-        async_to_sync(channel_layer.group_send)(
-            f"presence_{instance.user_id}",
-            {
-                "type": "presence_update",
-                "data": {
-                    "user_id": str(instance.user_id),
-                    "status": instance.status,
-                    "device_type": instance.device_type,
-                    "last_seen": instance.last_seen.isoformat(),
-                    "predicted_response_time": instance.predicted_response_time,
-                    "engagement_score": instance.user.engagement_score,
-                },
-            },
-        )
\ No newline at end of file
+        dispatcher.dispatch([instance])
+        return
+    # An edit (e.g. logout flipping the latest row to offline) only needs the
+    # store refreshed, and must not let an older row replace a newer one.
+    store = get_presence_store()
+    current = store.get(instance.user_id)
+    if current is not None and current["id"] == instance.pk:
+        store.set(instance.user_id, presence_to_record(instance, engagement_score=current.get("engagement_score")))
+        if instance.status != current["status"]:
+            record_transitions([(instance.user_id, instance.status, instance.device_type, timezone.now())])
+
+@receiver(post_delete, sender=Presence)
+def evict_presence_store(sender, instance, **kwargs):
+    store = get_presence_store()
+    current = store.get(instance.user_id)
+    if current is not None and current["id"] == instance.pk:
+        store.delete(instance.user_id)
@@ -0,0 +1,274 @@
+# presence/store.py
+import asyncio
+import json
+import threading
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db.models import F, OuterRef, Subquery
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+from .models import Presence
+
+
+class BasePresenceStore:
+    """
+    Keeps exactly one "current presence" record per user so that reads never
+    have to go through the append-only presence_record history table.
+    """
+
+    def get(self, user_id):
+        raise NotImplementedError
+
+    def get_many(self, user_ids):
+        raise NotImplementedError
+
+    def set(self, user_id, record):
+        raise NotImplementedError
+
+    def set_many(self, records):
+        for user_id, record in records.items():
+            self.set(user_id, record)
+
+    def delete(self, user_id):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    # Async counterparts for consumers. By default they run the sync method
+    # in a worker thread; backends that can answer on the event loop override
+    # them.
+
+    async def aget(self, user_id):
+        return await sync_to_async(self.get)(user_id)
+
+    async def aget_many(self, user_ids):
+        return await sync_to_async(self.get_many)(user_ids)
+
+    async def aset_many(self, records):
+        await sync_to_async(self.set_many)(records)
+
+
+class LocalPresenceStore(BasePresenceStore):
+    """
+    In-process store. Only suitable for a single worker or for tests.
+    """
+
+    def __init__(self):
+        self._records = {}
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        record = self._records.get(str(user_id))
+        return dict(record) if record is not None else None
+
+    def get_many(self, user_ids):
+        records = {}
+        for user_id in user_ids:
+            record = self._records.get(str(user_id))
+            if record is not None:
+                records[str(user_id)] = dict(record)
+        return records
+
+    def set(self, user_id, record):
+        with self._lock:
+            self._records[str(user_id)] = dict(record)
+
+    def set_many(self, records):
+        with self._lock:
+            for user_id, record in records.items():
+                self._records[str(user_id)] = dict(record)
+
+    def delete(self, user_id):
+        with self._lock:
+            self._records.pop(str(user_id), None)
+
+    def clear(self):
+        with self._lock:
+            self._records.clear()
+
+    # Plain dict operations: no reason to leave the event loop.
+
+    async def aget(self, user_id):
+        return self.get(user_id)
+
+    async def aget_many(self, user_ids):
+        return self.get_many(user_ids)
+
+    async def aset_many(self, records):
+        self.set_many(records)
+
+
+class RedisPresenceStore(BasePresenceStore):
+    """
+    Redis-backed store shared by every worker. Each user is a single JSON
+    string key, so a bulk read is one MGET.
+
+    Pass ``client`` to use an existing connection (e.g. ``fakeredis.FakeRedis``
+    in tests); otherwise one is created from ``url``. Consumers go through a
+    ``redis.asyncio`` client, ``async_client`` or one per event loop made
+    from ``url``, so their reads never borrow a worker thread.
+    """
+
+    def __init__(self, url="redis://localhost:6379/0", key_prefix="presence:current:", client=None, async_client=None):
+        self.url = url if client is None else None
+        if client is None:
+            import redis
+
+            client = redis.Redis.from_url(url)
+        self.client = client
+        self.key_prefix = key_prefix
+        self._async_client = async_client
+        self._loop_client = None
+        self._loop = None
+
+    def make_key(self, user_id):
+        return f"{self.key_prefix}{user_id}"
+
+    def get(self, user_id):
+        value = self.client.get(self.make_key(user_id))
+        return json.loads(value) if value is not None else None
+
+    def get_many(self, user_ids):
+        user_ids = [str(user_id) for user_id in user_ids]
+        if not user_ids:
+            return {}
+        values = self.client.mget([self.make_key(user_id) for user_id in user_ids])
+        return {
+            user_id: json.loads(value)
+            for user_id, value in zip(user_ids, values)
+            if value is not None
+        }
+
+    def set(self, user_id, record):
+        self.client.set(self.make_key(user_id), json.dumps(record))
+
+    def set_many(self, records):
+        if records:
+            self.client.mset({self.make_key(user_id): json.dumps(record) for user_id, record in records.items()})
+
+    def delete(self, user_id):
+        self.client.delete(self.make_key(user_id))
+
+    def clear(self):
+        keys = list(self.client.scan_iter(match=f"{self.key_prefix}*"))
+        if keys:
+            self.client.delete(*keys)
+
+    def get_async_client(self):
+        """
+        The asyncio client for the running loop, or None when the store was
+        given a sync client only.
+        """
+        if self._async_client is not None or self.url is None:
+            return self._async_client
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            import redis.asyncio
+
+            # Connections belong to the loop that opened them
+            self._loop_client = redis.asyncio.Redis.from_url(self.url)
+            self._loop = loop
+        return self._loop_client
+
+    async def aget(self, user_id):
+        return (await self.aget_many([user_id])).get(str(user_id))
+
+    async def aget_many(self, user_ids):
+        client = self.get_async_client()
+        if client is None:
+            return await super().aget_many(user_ids)
+        user_ids = [str(user_id) for user_id in user_ids]
+        if not user_ids:
+            return {}
+        values = await client.mget([self.make_key(user_id) for user_id in user_ids])
+        return {
+            user_id: json.loads(value)
+            for user_id, value in zip(user_ids, values)
+            if value is not None
+        }
+
+    async def aset_many(self, records):
+        client = self.get_async_client()
+        if client is None:
+            return await super().aset_many(records)
+        if records:
+            await client.mset({self.make_key(user_id): json.dumps(record) for user_id, record in records.items()})
+
+
+_store = None
+
+
+def get_presence_store():
+    """
+    Return the process-wide store configured by settings.PRESENCE_STORE.
+    """
+    global _store
+    if _store is None:
+        config = getattr(settings, "PRESENCE_STORE", {})
+        backend = import_string(config.get("BACKEND", "presence.store.LocalPresenceStore"))
+        _store = backend(**config.get("OPTIONS", {}))
+    return _store
+
+
+@receiver(setting_changed)
+def reset_presence_store(setting, **kwargs):
+    global _store
+    if setting == "PRESENCE_STORE":
+        _store = None
+
+
+def presence_to_record(presence, engagement_score=None):
+    return {
+        "id": presence.pk,
+        "user_id": str(presence.user_id),
+        "status": presence.status,
+        "device_type": presence.device_type,
+        "last_seen": presence.last_seen.isoformat(),
+        "predicted_response_time": presence.predicted_response_time,
+        "engagement_score": engagement_score,
+    }
+
+
+def latest_presences(user_ids):
+    """
+    The newest history row of each user, annotated with their engagement
+    score. Used for store misses.
+    """
+    latest = Presence.objects.filter(user_id=OuterRef("user_id")).order_by("-last_seen").values("pk")[:1]
+    return Presence.objects.filter(user_id__in=user_ids, pk=Subquery(latest)).annotate(
+        user_engagement_score=F("user__engagement_score")
+    )
+
+
+def get_current_presence(user_id):
+    """
+    Return the current presence record for a user, or None.
+    """
+    return get_current_presences([user_id]).get(str(user_id))
+
+
+def get_current_presences(user_ids):
+    """
+    Return {user_id: record} for the given users; users with no presence are
+    left out.
+
+    The history table is only consulted for cold misses, with one query for
+    all of them, and the results are written back so the next read is served
+    from the store.
+    """
+    store = get_presence_store()
+    user_ids = [str(user_id) for user_id in user_ids]
+    records = store.get_many(user_ids)
+    missing = [user_id for user_id in user_ids if user_id not in records]
+    if missing:
+        loaded = {
+            str(presence.user_id): presence_to_record(presence, engagement_score=presence.user_engagement_score)
+            for presence in latest_presences(missing)
+        }
+        store.set_many(loaded)
+        records.update(loaded)
+    return records
@@ -1,15 +1,51 @@
 # presence/tests.py
-from channels.testing import WebsocketCommunicator
+import asyncio
+import json
+import time
+from datetime import timedelta
+from io import StringIO
+from unittest.mock import patch
+
+from asgiref.sync import async_to_sync
+from channels.routing import URLRouter
+from channels.testing import ApplicationCommunicator, WebsocketCommunicator
 from channels.db import database_sync_to_async
-from django.test import TestCase
+from channels.exceptions import ChannelFull
+from channels.layers import get_channel_layer
+from django.core.management import call_command
+from django.core.cache import cache
+from django.db import DatabaseError
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
 from rest_framework_simplejwt.tokens import AccessToken
+from analytics.predictions import get_session_durations
+from LiveStatusAPI.routers import PrimaryReplicaRouter, is_sticky, request_routing, use_replica_reads
+from LiveStatusAPI.throttling import LocalRateLimitStore, RedisRateLimitStore, ScopedRateThrottle, get_rate_limit_store
+from users.cache import get_user_cache
 from users.models import CustomUser
-from .models import Presence
-from .consumers import PresenceConsumer
+from users.revocation import revoke_token
+from .models import Presence, PresenceSpan, PresenceSubscription, Team, TeamMembership
+from .buffer import get_presence_buffer
+from .dispatch import dispatcher
+from .graph import SubscriptionGraph, fanout_group, get_subscription_graph, shard_for
+from .history import day_start, get_daily_status_totals, get_status_durations
+from .layers import LocalChannelLayer
+from .liveness import LivenessTracker, activity_key, connections_key, get_liveness_tracker
+from .middleware import JWTAuthMiddleware, authenticate_token
+from .replay import PresenceReplayBuffer
+from .routing import http_urlpatterns, websocket_urlpatterns
+from .services import aget_current_presences, auser_can_watch
+from .store import LocalPresenceStore, RedisPresenceStore, get_current_presence, get_presence_store
+
+IN_MEMORY_CHANNEL_LAYERS = {"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}}
+
 
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS)
 class PresenceConsumerTests(TestCase):
-    async def setUp(self):
-        self.user = await database_sync_to_async(CustomUser.objects.create_user)(
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
             email="test@example.com",
             username="testuser",
             password="Test123!@#",
@@ -17,13 +53,11 @@ class PresenceConsumerTests(TestCase):
             is_active=True,
         )
         self.token = str(AccessToken.for_user(self.user))
-        await database_sync_to_async(Presence.objects.create)(
-            user=self.user, status="online", device_type="desktop"
-        )
+        Presence.objects.create(user=self.user, status="online", device_type="desktop")
 
     async def test_presence_consumer(self):
         communicator = WebsocketCommunicator(
-            PresenceConsumer.as_asgi(), f"/ws/presence/{self.user.id}/?token={self.token}"
+            URLRouter(websocket_urlpatterns), f"/ws/presence/{self.user.id}/?token={self.token}"
         )
         connected, subprotocol = await communicator.connect()
         self.assertTrue(connected)
@@ -32,9 +66,964 @@ class PresenceConsumerTests(TestCase):
         self.assertEqual(response["data"]["user_id"], str(self.user.id))
         await communicator.disconnect()
 
+        # The score comes from the store, not the cached user from the handshake
+        await database_sync_to_async(Presence.objects.create)(user=self.user, status="online", device_type="mobile")
+        communicator = WebsocketCommunicator(
+            URLRouter(websocket_urlpatterns), f"/ws/presence/{self.user.id}/?token={self.token}"
+        )
+        await communicator.connect()
+        response = await communicator.receive_json_from()
+        self.assertAlmostEqual(response["data"]["engagement_score"], 0.2)
+        await communicator.disconnect()
+
     async def test_unauthorized_access(self):
         communicator = WebsocketCommunicator(
-            PresenceConsumer.as_asgi(), f"/ws/presence/{self.user.id}/?token=invalid"
+            URLRouter(websocket_urlpatterns), f"/ws/presence/{self.user.id}/?token=invalid"
+        )
+        connected, subprotocol = await communicator.connect()
+        self.assertFalse(connected)
+
+
+@override_settings(
+    CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS,
+    PRESENCE_STORE={"BACKEND": "presence.store.LocalPresenceStore"},
+)
+class PresenceStoreTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            email="store@example.com", username="storeuser", password="Test123!@#"
+        )
+
+    def test_store_tracks_latest_write(self):
+        Presence.objects.create(user=self.user, status="online", device_type="desktop")
+        latest = Presence.objects.create(user=self.user, status="busy", device_type="mobile")
+        record = get_presence_store().get(self.user.id)
+        self.assertEqual(record["id"], latest.pk)
+        self.assertEqual(record["status"], "busy")
+
+    def test_read_does_not_query_history(self):
+        Presence.objects.create(user=self.user, status="away", device_type="desktop")
+        with self.assertNumQueries(0):
+            record = get_current_presence(self.user.id)
+        self.assertEqual(record["status"], "away")
+
+    def test_cold_miss_reads_through(self):
+        Presence.objects.create(user=self.user, status="online", device_type="desktop")
+        get_presence_store().clear()
+        with self.assertNumQueries(1):
+            self.assertEqual(get_current_presence(self.user.id)["status"], "online")
+        with self.assertNumQueries(0):
+            get_current_presence(self.user.id)
+
+    def test_deleting_current_row_evicts(self):
+        presence = Presence.objects.create(user=self.user, status="online", device_type="desktop")
+        presence.delete()
+        self.assertIsNone(get_presence_store().get(self.user.id))
+
+    def test_local_store_matches_interface(self):
+        local = LocalPresenceStore()
+        local.set("u1", {"status": "online"})
+        self.assertEqual(local.get_many(["u1", "u2"]), {"u1": {"status": "online"}})
+
+
+class RedisPresenceStoreTests(TestCase):
+    def setUp(self):
+        try:
+            import fakeredis
+        except ImportError:
+            self.skipTest("fakeredis is not installed")
+        self.store = RedisPresenceStore(client=fakeredis.FakeRedis())
+
+    def test_round_trip(self):
+        self.store.set("u1", {"status": "online"})
+        self.store.set_many({"u2": {"status": "busy"}})
+        self.assertEqual(self.store.get("u1"), {"status": "online"})
+        self.assertEqual(self.store.get_many(["u1", "u2", "u3"]), {"u1": {"status": "online"}, "u2": {"status": "busy"}})
+        self.store.clear()
+        self.assertIsNone(self.store.get("u1"))
+
+    async def test_async_client(self):
+        import fakeredis
+
+        server = fakeredis.FakeServer()
+        store = RedisPresenceStore(
+            client=fakeredis.FakeRedis(server=server), async_client=fakeredis.FakeAsyncRedis(server=server)
+        )
+        await store.aset_many({"u1": {"status": "online"}})
+        self.assertEqual(store.get("u1"), {"status": "online"})
+        self.assertEqual(await store.aget_many(["u1", "u2"]), {"u1": {"status": "online"}})
+        self.assertIsNone(await store.aget("u2"))
+
+
+@override_settings(
+    CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS,
+    PRESENCE_STORE={"BACKEND": "presence.store.LocalPresenceStore"},
+    PRESENCE_WRITE_BUFFER={"COALESCE_WINDOW": 60, "FLUSH_INTERVAL": 60, "MAX_BATCH_SIZE": 3},
+)
+class PresenceWriteBufferTests(TestCase):
+    def setUp(self):
+        self.users = [
+            CustomUser.objects.create_user(email=f"buffer{i}@example.com", username=f"buffer{i}", password="Test123!@#")
+            for i in range(3)
+        ]
+        self.buffer = get_presence_buffer()
+
+    async def test_repeated_heartbeats_are_coalesced(self):
+        user_id = self.users[0].id
+        self.assertTrue(await self.buffer.add(user_id, "online", "desktop"))
+        self.assertFalse(await self.buffer.add(user_id, "online", "desktop"))
+        self.assertTrue(await self.buffer.add(user_id, "busy", "desktop"))
+        await self.buffer.flush()
+        statuses = await database_sync_to_async(list)(
+            Presence.objects.filter(user_id=user_id).order_by("id").values_list("status", flat=True)
+        )
+        self.assertEqual(statuses, ["online", "busy"])
+        self.assertEqual(self.buffer.coalesced_count, 1)
+
+    async def test_size_threshold_flushes_and_broadcasts(self):
+        channel_layer = get_channel_layer()
+        channel_name = await channel_layer.new_channel()
+        await channel_layer.group_add(f"presence_{self.users[2].id}", channel_name)
+        # Sent from the event loop, not via async_to_sync from a worker thread
+        with patch.object(dispatcher, "broadcast", side_effect=AssertionError("sync broadcast")):
+            for user in self.users:
+                await self.buffer.add(user.id, "online", "mobile")
+        self.assertEqual(self.buffer.pending, [])
+        self.assertEqual(await database_sync_to_async(Presence.objects.count)(), 3)
+        message = await channel_layer.receive(channel_name)
+        self.assertEqual(message["data"]["user_id"], str(self.users[2].id))
+        self.assertEqual(get_presence_store().get(self.users[2].id)["status"], "online")
+
+    async def test_failed_write_is_retried(self):
+        await self.buffer.add(self.users[0].id, "busy", "desktop")
+        with patch.object(self.buffer, "write_batch", side_effect=DatabaseError("database is locked")):
+            await self.buffer.flush()
+        self.assertEqual(len(self.buffer.pending), 1)
+        await self.buffer.flush()
+        self.assertEqual(self.buffer.pending, [])
+        self.assertEqual(await database_sync_to_async(Presence.objects.filter(status="busy").count)(), 1)
+
+    async def test_dropped_write_does_not_coalesce_later_heartbeats(self):
+        user_id = self.users[0].id
+        await self.buffer.add(user_id, "busy", "desktop")
+        with patch.object(self.buffer, "write_batch", side_effect=DatabaseError("database is locked")):
+            with self.assertLogs("presence.buffer", level="ERROR"):
+                for _ in range(self.buffer.max_retries + 1):
+                    await self.buffer.flush()
+        self.assertEqual(self.buffer.pending, [])
+        self.assertTrue(await self.buffer.add(user_id, "busy", "desktop"))
+        await self.buffer.flush()
+        self.assertEqual(await database_sync_to_async(Presence.objects.filter(status="busy").count)(), 1)
+        self.assertEqual(get_presence_store().get(user_id)["status"], "busy")
+
+    async def test_unchanged_status_after_reconnect_is_not_rewritten(self):
+        user = self.users[1]
+        await database_sync_to_async(Presence.objects.create)(user=user, status="away", device_type="desktop")
+        self.assertFalse(await self.buffer.add(user.id, "away", "desktop"))
+
+
+@override_settings(
+    CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS,
+    PRESENCE_STORE={"BACKEND": "presence.store.LocalPresenceStore"},
+)
+class PresenceServiceTests(TestCase):
+    def setUp(self):
+        self.users = [
+            CustomUser.objects.create_user(email=f"service{i}@example.com", username=f"service{i}", password="Test123!@#")
+            for i in range(3)
+        ]
+        team = Team.objects.create(name="Service")
+        for user in self.users[:2]:
+            TeamMembership.objects.create(team=team, user=user)
+            Presence.objects.create(user=user, status="online", device_type="desktop")
+
+    def test_cold_misses_use_the_async_orm_once(self):
+        user_ids = [str(user.id) for user in self.users]
+        get_presence_store().clear()
+        with self.assertNumQueries(1):
+            records = async_to_sync(aget_current_presences)(user_ids)
+        self.assertEqual(set(records), set(user_ids[:2]))
+        with self.assertNumQueries(0):
+            self.assertEqual(async_to_sync(aget_current_presences)(user_ids[:2]), records)
+
+    def test_watch_checks_use_the_loaded_graph(self):
+        get_subscription_graph().get_index()
+        with self.assertNumQueries(0):
+            self.assertTrue(async_to_sync(auser_can_watch)(self.users[0], self.users[1].id))
+            self.assertFalse(async_to_sync(auser_can_watch)(self.users[2], self.users[0].id))
+
+
+@override_settings(
+    CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS,
+    PRESENCE_STORE={"BACKEND": "presence.store.LocalPresenceStore"},
+)
+class PresenceSpanTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(email="spans@example.com", username="spans", password="Test123!@#")
+
+    def test_status_changes_close_and_open_spans(self):
+        for status in ["online", "online", "away"]:
+            Presence.objects.create(user=self.user, status=status, device_type="desktop")
+        spans = list(PresenceSpan.objects.filter(user=self.user).order_by("started_at"))
+        self.assertEqual([(span.status, span.ended_at is None) for span in spans], [("online", False), ("away", True)])
+        self.assertEqual(spans[0].ended_at, spans[1].started_at)
+
+        # Editing the current row, as logout does, is a transition too
+        latest = Presence.objects.filter(user=self.user).latest("id")
+        latest.status = "offline"
+        latest.save()
+        self.assertEqual(PresenceSpan.objects.get(user=self.user, ended_at__isnull=True).status, "offline")
+
+    def test_session_duration_is_one_lookup(self):
+        Presence.objects.create(user=self.user, status="busy", device_type="desktop")
+        PresenceSpan.objects.filter(user=self.user).update(started_at=timezone.now() - timedelta(hours=2))
+        with self.assertNumQueries(1):
+            durations = get_session_durations({str(self.user.id): "busy"})
+        self.assertAlmostEqual(durations[str(self.user.id)], 7200, delta=5)
+        self.assertEqual(get_session_durations({str(self.user.id): "online"}), {})
+
+
+@override_settings(
+    CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS,
+    PRESENCE_STORE={"BACKEND": "presence.store.LocalPresenceStore"},
+)
+class PresenceHistoryTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(email="history@example.com", username="history", password="Test123!@#")
+        self.day = timezone.localdate() - timedelta(days=100)
+        self.base = day_start(self.day)
+        for status, offset in [("online", 8), ("away", 10), ("offline", 12), ("online", 33), ("offline", 35)]:
+            presence = Presence.objects.create(user=self.user, status=status, device_type="desktop")
+            Presence.objects.filter(pk=presence.pk).update(last_seen=self.base + timedelta(hours=offset))
+        self.recent = Presence.objects.create(user=self.user, status="busy", device_type="desktop")
+        call_command("rebuild_presence_spans", stdout=StringIO())
+
+    def test_compaction_rolls_up_and_keeps_last_status(self):
+        span = (self.user.id, self.base, self.base + timedelta(days=2))
+        raw = get_status_durations(*span)
+        self.assertEqual(raw, {"online": 4 * 3600, "away": 2 * 3600})
+
+        out = StringIO()
+        call_command("compact_presence", retention_days=90, batch_size=1, stdout=out)
+        self.assertIn("4 presence rows deleted", out.getvalue())
+        self.assertEqual(Presence.objects.filter(user=self.user).count(), 2)
+        self.assertEqual(get_status_durations(*span), raw)
+        self.assertEqual(
+            get_daily_status_totals(self.user.id, self.day, self.day),
+            {
+                self.day: {
+                    "online": {"seconds": 7200, "transitions": 1},
+                    "away": {"seconds": 7200, "transitions": 1},
+                    "offline": {"seconds": 0, "transitions": 1},
+                }
+            },
+        )
+
+        out = StringIO()
+        call_command("compact_presence", retention_days=90, stdout=out)
+        self.assertIn("Nothing to compact", out.getvalue())
+        self.assertEqual(get_presence_store().get(self.user.id)["id"], self.recent.pk)
+
+
+class LivenessTrackerTests(TestCase):
+    def setUp(self):
+        self.tracker = LivenessTracker(away_after=10, offline_after=20, disconnect_grace=5)
+
+    def test_idle_users_go_away_then_offline(self):
+        self.tracker.connect("a", now=0)
+        self.tracker.connect("b", now=0)
+        self.assertFalse(self.tracker.touch("b", now=8))
+        self.assertEqual(self.tracker.collect_due(5), {})
+        self.assertEqual(self.tracker.collect_due(10), {"a": "away"})
+        self.assertEqual(self.tracker.collect_due(20), {"a": "offline", "b": "away"})
+        # One live heap entry per user, however often they are touched
+        self.assertEqual(len(self.tracker.heap), 1)
+
+    def test_disconnect_grace_covers_reconnects(self):
+        self.tracker.connect("a", now=0)
+        self.tracker.disconnect("a", now=1)
+        self.tracker.connect("a", now=3)
+        self.assertEqual(self.tracker.collect_due(7), {})
+        self.tracker.disconnect("a", now=8)
+        self.assertEqual(self.tracker.collect_due(13), {"a": "offline"})
+        self.assertNotIn("a", self.tracker.users)
+
+
+@override_settings(
+    CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS,
+    PRESENCE_STORE={"BACKEND": "presence.store.LocalPresenceStore"},
+    PRESENCE_WRITE_BUFFER={"COALESCE_WINDOW": 60, "FLUSH_INTERVAL": 60, "MAX_BATCH_SIZE": 500},
+    PRESENCE_LIVENESS={"AWAY_AFTER": 10, "OFFLINE_AFTER": 20, "DISCONNECT_GRACE": 5},
+)
+class LivenessExpiryTests(TestCase):
+    def setUp(self):
+        self.users = [
+            CustomUser.objects.create_user(email=f"idle{i}@example.com", username=f"idle{i}", password="Test123!@#")
+            for i in range(3)
+        ]
+        for user, status in zip(self.users, ["online", "online", "busy"]):
+            Presence.objects.create(user=user, status=status, device_type="mobile")
+
+    async def test_transitions_are_written_as_one_batch(self):
+        tracker = get_liveness_tracker()
+        for user in self.users:
+            tracker.connect(user.id)
+        with patch.object(dispatcher, "dispatch", wraps=dispatcher.dispatch) as dispatch:
+            written = await tracker.expire(now=time.monotonic() + 10)
+        self.assertEqual(written, {str(self.users[0].id): "away", str(self.users[1].id): "away"})
+        self.assertEqual(dispatch.call_count, 1)
+        self.assertEqual(get_presence_store().get(self.users[0].id)["device_type"], "mobile")
+        self.assertEqual(get_presence_store().get(self.users[2].id)["status"], "busy")
+
+        # Activity brings an away user back online
+        self.assertTrue(tracker.touch(self.users[0].id))
+        await tracker.restore(self.users[0].id)
+        await get_presence_buffer().flush()
+        self.assertEqual(get_presence_store().get(self.users[0].id)["status"], "online")
+
+    async def test_users_connected_to_another_worker_stay_online(self):
+        user_id = str(self.users[0].id)
+        here, elsewhere = get_liveness_tracker(), LivenessTracker(away_after=10, offline_after=20, disconnect_grace=5)
+        self.addCleanup(cache.delete_many, [connections_key(user_id), activity_key(user_id)])
+        await here.aconnect(user_id)
+        await elsewhere.aconnect(user_id)
+        await here.adisconnect(user_id)
+        self.assertEqual(await here.expire(now=time.monotonic() + 5), {})
+        self.assertEqual(get_presence_store().get(user_id)["status"], "online")
+
+        await elsewhere.adisconnect(user_id)
+        self.assertEqual(await elsewhere.expire(now=time.monotonic() + 5), {user_id: "offline"})
+
+    async def test_heartbeat_keeps_socket_user_online(self):
+        communicator = WebsocketCommunicator(
+            URLRouter(websocket_urlpatterns), f"/ws/presence/?token={AccessToken.for_user(self.users[0])}"
+        )
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        tracker = get_liveness_tracker()
+        await communicator.send_json_to({"type": "heartbeat"})
+        self.assertTrue(await communicator.receive_nothing())
+        self.assertEqual(await tracker.expire(now=tracker.users[str(self.users[0].id)].last_activity + 9), {})
+
+        await communicator.disconnect()
+        written = await tracker.expire(now=time.monotonic() + 5)
+        self.assertEqual(written, {str(self.users[0].id): "offline"})
+
+
+@override_settings(
+    CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS,
+    PRESENCE_STORE={"BACKEND": "presence.store.LocalPresenceStore"},
+)
+class PresenceDispatcherTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            email="dispatch@example.com", username="dispatchuser", password="Test123!@#"
+        )
+        # Load the subscription graph up front so query counts only cover dispatch
+        get_subscription_graph().invalidate()
+        get_subscription_graph().recipients_by_shard(self.user.id)
+
+    async def test_online_record_sends_one_combined_event(self):
+        channel_layer = get_channel_layer()
+        channel_name = await channel_layer.new_channel()
+        await channel_layer.group_add(f"presence_{self.user.id}", channel_name)
+        await database_sync_to_async(Presence.objects.create)(user=self.user, status="online", device_type="desktop")
+        message = await channel_layer.receive(channel_name)
+        self.assertAlmostEqual(message["data"]["engagement_score"], 0.1)
+        with self.assertRaises(asyncio.TimeoutError):
+            await asyncio.wait_for(channel_layer.receive(channel_name), timeout=0.1)
+
+    def test_engagement_is_updated_atomically_for_a_batch(self):
+        presences = [
+            Presence(user=self.user, status="online", device_type="desktop", last_seen=timezone.now()),
+            Presence(user=self.user, status="online", device_type="mobile", last_seen=timezone.now()),
+        ]
+        # SELECT open span, INSERT span, upsert daily rollup, UPDATE
+        # engagement, SELECT scores, SELECT webhook subscriptions
+        with self.assertNumQueries(6):
+            dispatcher.dispatch(presences)
+        self.user.refresh_from_db()
+        self.assertAlmostEqual(self.user.engagement_score, 0.2)
+        self.assertAlmostEqual(get_presence_store().get(self.user.id)["engagement_score"], 0.2)
+
+    def test_offline_record_reuses_cached_score(self):
+        Presence.objects.create(user=self.user, status="online", device_type="desktop")
+        # INSERT, SELECT/UPDATE/INSERT spans, upsert daily and hourly
+        # rollups, SELECT webhook subscriptions
+        with self.assertNumQueries(7):
+            Presence.objects.create(user=self.user, status="offline", device_type="desktop")
+        self.assertEqual(get_presence_store().get(self.user.id)["status"], "offline")
+
+
+@override_settings(
+    CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS,
+    PRESENCE_STORE={"BACKEND": "presence.store.LocalPresenceStore"},
+)
+class MultiplexPresenceConsumerTests(TestCase):
+    def setUp(self):
+        self.staff = CustomUser.objects.create_user(
+            email="staff@example.com", username="staffuser", password="Test123!@#", is_staff=True
+        )
+        self.member = CustomUser.objects.create_user(
+            email="member@example.com", username="memberuser", password="Test123!@#"
+        )
+        self.teammates = [
+            CustomUser.objects.create_user(email=f"mate{i}@example.com", username=f"mate{i}", password="Test123!@#")
+            for i in range(3)
+        ]
+        for user in self.teammates:
+            Presence.objects.create(user=user, status="online", device_type="desktop")
+
+    async def connect(self, user):
+        communicator = WebsocketCommunicator(
+            URLRouter(websocket_urlpatterns), f"/ws/presence/?token={AccessToken.for_user(user)}"
+        )
+        connected, subprotocol = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    async def test_subscribe_returns_one_snapshot_and_streams_updates(self):
+        communicator = await self.connect(self.staff)
+        await communicator.send_json_to({"type": "subscribe", "user_ids": [str(u.id) for u in self.teammates]})
+        snapshot = await communicator.receive_json_from()
+        self.assertEqual(snapshot["type"], "presence_snapshot")
+        self.assertEqual({r["user_id"] for r in snapshot["data"]}, {str(u.id) for u in self.teammates})
+
+        await database_sync_to_async(Presence.objects.create)(user=self.teammates[1], status="busy", device_type="desktop")
+        update = await communicator.receive_json_from()
+        self.assertEqual(update["data"]["user_id"], str(self.teammates[1].id))
+        self.assertEqual(update["data"]["status"], "busy")
+
+        await communicator.send_json_to({"type": "unsubscribe", "user_ids": [str(self.teammates[1].id)]})
+        self.assertEqual((await communicator.receive_json_from())["type"], "unsubscribed")
+        await database_sync_to_async(Presence.objects.create)(user=self.teammates[1], status="away", device_type="desktop")
+        self.assertTrue(await communicator.receive_nothing())
+        await communicator.disconnect()
+
+    async def test_non_staff_cannot_watch_others(self):
+        communicator = await self.connect(self.member)
+        await communicator.send_json_to(
+            {"type": "subscribe", "user_ids": [str(self.member.id), str(self.teammates[0].id), "not-a-uuid"]}
+        )
+        snapshot = await communicator.receive_json_from()
+        self.assertEqual(snapshot["denied"], [str(self.teammates[0].id), "not-a-uuid"])
+        self.assertEqual(snapshot["data"], [])
+        await communicator.disconnect()
+
+    async def test_subscriptions_over_the_limit_are_denied(self):
+        with self.settings(PRESENCE_MAX_SUBSCRIPTIONS=2):
+            communicator = await self.connect(self.staff)
+        await communicator.send_json_to({"type": "subscribe", "user_ids": [str(u.id) for u in self.teammates]})
+        snapshot = await communicator.receive_json_from()
+        self.assertEqual(len(snapshot["data"]), 2)
+        self.assertEqual(snapshot["denied"], [str(self.teammates[2].id)])
+        await communicator.disconnect()
+
+
+@override_settings(
+    CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS,
+    PRESENCE_STORE={"BACKEND": "presence.store.LocalPresenceStore"},
+    PRESENCE_FANOUT={"SHARDS": 4, "TTL": 60, "CACHE_SIZE": 100},
+)
+class PresenceFanoutTests(TestCase):
+    def setUp(self):
+        self.alice, self.bob, self.carol, self.dave = [
+            CustomUser.objects.create_user(email=f"{name}@example.com", username=name, password="Test123!@#")
+            for name in ("alice", "bob", "carol", "dave")
+        ]
+        team = Team.objects.create(name="Support")
+        for user in (self.alice, self.bob, self.carol):
+            TeamMembership.objects.create(team=team, user=user)
+        PresenceSubscription.objects.create(target=self.alice, watcher=self.dave)
+
+    def test_teammates_and_granted_watchers_can_watch(self):
+        graph = get_subscription_graph()
+        self.assertTrue(graph.can_watch(self.bob.id, self.alice.id))
+        self.assertTrue(graph.can_watch(self.dave.id, self.alice.id))
+        self.assertFalse(graph.can_watch(self.alice.id, self.dave.id))
+
+        TeamMembership.objects.filter(user=self.carol).delete()
+        self.assertFalse(graph.can_watch(self.carol.id, self.alice.id))
+
+    def test_changes_reach_other_processes(self):
+        other = SubscriptionGraph(version_check=0)  # another worker's graph
+        self.assertTrue(other.can_watch(self.dave.id, self.alice.id))
+        with self.captureOnCommitCallbacks(execute=True):
+            PresenceSubscription.objects.filter(watcher=self.dave).delete()
+        self.assertFalse(other.can_watch(self.dave.id, self.alice.id))
+
+    async def test_revoked_watchers_are_dropped_from_live_subscriptions(self):
+        multiplexed = WebsocketCommunicator(
+            URLRouter(websocket_urlpatterns), f"/ws/presence/?token={AccessToken.for_user(self.dave)}"
+        )
+        single = WebsocketCommunicator(
+            URLRouter(websocket_urlpatterns), f"/ws/presence/{self.alice.id}/?token={AccessToken.for_user(self.bob)}"
+        )
+        for communicator in (multiplexed, single):
+            connected, _ = await communicator.connect()
+            self.assertTrue(connected)
+        await multiplexed.send_json_to({"type": "subscribe", "user_ids": [str(self.alice.id)]})
+        self.assertEqual((await multiplexed.receive_json_from())["denied"], [])
+
+        await database_sync_to_async(PresenceSubscription.objects.filter(watcher=self.dave).delete)()
+        await database_sync_to_async(TeamMembership.objects.filter(user=self.bob).delete)()
+        await database_sync_to_async(Presence.objects.create)(user=self.alice, status="busy", device_type="desktop")
+        self.assertEqual(
+            await multiplexed.receive_json_from(),
+            {"type": "unsubscribed", "user_ids": [str(self.alice.id)], "reason": "revoked"},
+        )
+        self.assertTrue(await multiplexed.receive_nothing())
+        self.assertEqual((await single.receive_output())["code"], 4001)
+        await multiplexed.disconnect()
+        await single.disconnect()
+
+    def test_fanout_sends_one_message_per_shard(self):
+        watchers = {str(user.id) for user in (self.bob, self.carol, self.dave)}
+        event = (f"presence_{self.alice.id}", {"type": "presence_update", "data": {"user_id": str(self.alice.id)}})
+        with self.assertNumQueries(2):
+            messages = get_subscription_graph().build_fanout([event])
+
+        self.assertEqual(
+            {group for group, _ in messages}, {fanout_group(shard_for(user_id, 4)) for user_id in watchers}
+        )
+        recipients = [user_id for _, message in messages for update in message["updates"] for user_id in update["recipients"]]
+        self.assertCountEqual(recipients, watchers)
+
+    async def test_watchers_receive_updates_without_subscribing(self):
+        communicator = WebsocketCommunicator(
+            URLRouter(websocket_urlpatterns), f"/ws/presence/?token={AccessToken.for_user(self.dave)}"
+        )
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        await database_sync_to_async(Presence.objects.create)(user=self.alice, status="busy", device_type="desktop")
+        update = await communicator.receive_json_from()
+        self.assertEqual((update["data"]["user_id"], update["data"]["status"]), (str(self.alice.id), "busy"))
+
+        # Presence of users dave cannot watch is not delivered
+        await database_sync_to_async(Presence.objects.create)(user=self.carol, status="busy", device_type="desktop")
+        self.assertTrue(await communicator.receive_nothing())
+        await communicator.disconnect()
+
+    async def test_teammate_can_open_user_socket(self):
+        await database_sync_to_async(Presence.objects.create)(user=self.alice, status="online", device_type="desktop")
+        communicator = WebsocketCommunicator(
+            URLRouter(websocket_urlpatterns), f"/ws/presence/{self.alice.id}/?token={AccessToken.for_user(self.bob)}"
+        )
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        self.assertEqual((await communicator.receive_json_from())["data"]["status"], "online")
+
+        # Watching someone doesn't allow setting their status
+        await communicator.send_json_to({"type": "presence_update", "data": {"status": "offline"}})
+        self.assertEqual((await communicator.receive_json_from())["code"], "forbidden")
+        await get_presence_buffer().flush()
+        self.assertEqual(get_presence_store().get(self.alice.id)["status"], "online")
+        self.assertEqual(await database_sync_to_async(Presence.objects.filter(user=self.alice).count)(), 1)
+        await communicator.disconnect()
+
+    def test_grant_and_revoke_watchers(self):
+        client = APIClient()
+        client.force_authenticate(self.carol)
+        response = client.post(reverse("presence-watchers"), {"user_id": str(self.dave.id)}, format="json")
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(get_subscription_graph().can_watch(self.dave.id, self.carol.id))
+        self.assertEqual([w["user_id"] for w in client.get(reverse("presence-watchers")).data], [self.dave.id])
+
+        response = client.delete(reverse("presence-watcher-detail", args=[self.dave.id]))
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(get_subscription_graph().can_watch(self.dave.id, self.carol.id))
+
+        response = client.post(reverse("presence-watchers"), {"user_id": str(self.carol.id)}, format="json")
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(
+    CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS,
+    PRESENCE_STORE={"BACKEND": "presence.store.LocalPresenceStore"},
+)
+class PresenceSnapshotViewTests(TestCase):
+    def setUp(self):
+        self.users = [
+            CustomUser.objects.create_user(email=f"roster{i}@example.com", username=f"roster{i}", password="Test123!@#")
+            for i in range(3)
+        ]
+        for user in self.users[:2]:
+            Presence.objects.create(user=user, status="online", device_type="desktop")
+        self.client = APIClient()
+        self.client.force_authenticate(self.users[0])
+        self.url = reverse("presence-snapshot")
+
+    def test_post_returns_latest_presence_for_every_user(self):
+        user_ids = [str(user.id) for user in self.users]
+        with self.assertNumQueries(1):  # only the cold miss for the user with no presence
+            response = self.client.post(self.url, {"user_ids": user_ids}, format="json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([r["user_id"] for r in response.data["results"]], user_ids[:2])
+        self.assertEqual(response.data["missing"], [user_ids[2]])
+
+    def test_get_supports_if_none_match(self):
+        query = ",".join(str(user.id) for user in self.users[:2])
+        response = self.client.get(self.url, {"user_ids": query})
+        self.assertEqual(response.status_code, 200)
+        etag = response["ETag"]
+
+        response = self.client.get(self.url, {"user_ids": query}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        Presence.objects.create(user=self.users[1], status="busy", device_type="desktop")
+        response = self.client.get(self.url, {"user_ids": query}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_rejects_invalid_ids(self):
+        response = self.client.get(self.url, {"user_ids": "not-a-uuid"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_rejects_body_that_is_not_an_object(self):
+        response = self.client.post(self.url, [str(self.users[0].id)], format="json")
+        self.assertEqual(response.status_code, 400)
+
+    def test_single_user_presence_is_served_from_store(self):
+        response = self.client.get(reverse("user-presence", kwargs={"userId": self.users[1].id}))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["status"], "online")
+
+
+@override_settings(
+    CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS,
+    USER_CACHE={"MAX_SIZE": 100, "TTL": 300},
+)
+class JWTAuthMiddlewareTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            email="ws@example.com", username="wsuser", password="Test123!@#", is_verified=True
+        )
+        self.token = str(AccessToken.for_user(self.user))
+        Presence.objects.create(user=self.user, status="online", device_type="desktop")
+        self.application = JWTAuthMiddleware(URLRouter(websocket_urlpatterns))
+
+    async def test_authorization_header(self):
+        communicator = WebsocketCommunicator(
+            self.application, f"/ws/presence/{self.user.id}/",
+            headers=[(b"authorization", f"Bearer {self.token}".encode())],
+        )
+        connected, subprotocol = await communicator.connect()
+        self.assertTrue(connected)
+        self.assertEqual((await communicator.receive_json_from())["data"]["status"], "online")
+        await communicator.disconnect()
+
+    async def test_subprotocol_token_is_echoed_back(self):
+        communicator = WebsocketCommunicator(
+            self.application, f"/ws/presence/{self.user.id}/", subprotocols=["bearer", self.token]
         )
         connected, subprotocol = await communicator.connect()
-        self.assertFalse(connected)
\ No newline at end of file
+        self.assertTrue(connected)
+        self.assertEqual(subprotocol, "bearer")
+        await communicator.disconnect()
+
+    async def test_query_string_token_and_anonymous_rejection(self):
+        communicator = WebsocketCommunicator(self.application, f"/ws/presence/{self.user.id}/?token={self.token}")
+        connected, subprotocol = await communicator.connect()
+        self.assertTrue(connected)
+        await communicator.disconnect()
+
+        communicator = WebsocketCommunicator(self.application, f"/ws/presence/{self.user.id}/")
+        connected, subprotocol = await communicator.connect()
+        self.assertFalse(connected)
+
+    def test_cached_user_needs_no_query(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(async_to_sync(authenticate_token)(self.token), self.user)
+        with self.assertNumQueries(0):
+            self.assertEqual(async_to_sync(authenticate_token)(self.token), self.user)
+
+    def test_cache_invalidated_when_user_changes(self):
+        async_to_sync(authenticate_token)(self.token)
+        self.user.is_active = False
+        self.user.save()
+        self.assertIsNone(get_user_cache().get(self.user.id))
+        self.assertIsNone(async_to_sync(authenticate_token)(self.token))
+
+    async def test_revoked_token_is_rejected(self):
+        revoke_token(AccessToken(self.token))
+        self.assertIsNone(await authenticate_token(self.token))
+        communicator = WebsocketCommunicator(self.application, f"/ws/presence/{self.user.id}/?token={self.token}")
+        connected, subprotocol = await communicator.connect()
+        self.assertFalse(connected)
+
+
+class LocalChannelLayerTests(TestCase):
+    async def test_group_send_shares_one_copy(self):
+        layer = LocalChannelLayer()
+        channels = [await layer.new_channel() for _ in range(3)]
+        for channel in channels:
+            await layer.group_add("presence_room", channel)
+        message = {"type": "presence_update", "data": {"status": "online"}}
+        await layer.group_send("presence_room", message)
+        received = [await layer.receive(channel) for channel in channels]
+        self.assertEqual(received[0], message)
+        self.assertIsNot(received[0], message)
+        self.assertTrue(all(item is received[0] for item in received))
+        self.assertEqual(layer.get_stats()["delivered"], 3)
+
+    async def test_full_channels_drop_newest_or_oldest(self):
+        layer = LocalChannelLayer(capacity=2)
+        channel = await layer.new_channel()
+        await layer.group_add("room", channel)
+        for index in range(3):
+            await layer.group_send("room", {"type": "update", "index": index})
+        with self.assertRaises(ChannelFull):
+            await layer.send(channel, {"type": "update", "index": 3})
+        self.assertEqual([(await layer.receive(channel))["index"] for _ in range(2)], [0, 1])
+        self.assertEqual(layer.get_stats()["dropped_full"], 2)
+
+        layer = LocalChannelLayer(capacity=2, overflow="drop_oldest")
+        channel = await layer.new_channel()
+        for index in range(3):
+            await layer.send(channel, {"type": "update", "index": index})
+        self.assertEqual([(await layer.receive(channel))["index"] for _ in range(2)], [1, 2])
+        self.assertEqual(layer.get_stats()["dropped_oldest"], 1)
+
+    async def test_dead_members_are_evicted(self):
+        layer = LocalChannelLayer(capacity=1, expiry=0.01)
+        dead, alive = await layer.new_channel(), await layer.new_channel()
+        await layer.group_add("room", dead)
+        await layer.group_add("room", alive)
+        await layer.group_send("room", {"type": "update", "index": 0})
+        await layer.receive(alive)
+        await asyncio.sleep(0.02)
+        await layer.group_send("room", {"type": "update", "index": 1})
+        self.assertEqual(list(layer.groups["room"]), [alive])
+        stats = layer.get_stats()
+        self.assertEqual((stats["evicted_channels"], stats["expired"]), (1, 1))
+
+
+@override_settings(CHANNEL_LAYERS={"default": {"BACKEND": "presence.layers.LocalChannelLayer"}})
+class LocalChannelLayerConsumerTests(MultiplexPresenceConsumerTests):
+    """
+    The multiplexed consumer tests, run against the local layer.
+    """
+
+
+@override_settings(DATABASE_ROUTING={"REPLICAS": ["replica"], "STICKY_SECONDS": 5})
+class ReplicaRouterTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.router = PrimaryReplicaRouter()
+        self.user = CustomUser(email="router@example.com", username="router")
+
+    def test_opted_in_reads_use_a_replica_until_a_write(self):
+        self.assertIsNone(self.router.db_for_read(Presence))  # outside a request
+        with request_routing() as state:
+            self.assertIsNone(self.router.db_for_read(Presence))
+            use_replica_reads(self.user)
+            self.assertEqual(self.router.db_for_read(Presence), "replica")
+            self.assertEqual(self.router.db_for_write(Presence), "default")
+            self.assertIsNone(self.router.db_for_read(Presence))
+            self.assertTrue(state.wrote)
+        self.assertFalse(self.router.allow_migrate("replica", "presence"))
+
+    def test_sticky_user_reads_from_the_primary(self):
+        cache.set(f"database-routing:sticky:{self.user.pk}", 1)
+        with request_routing():
+            use_replica_reads(self.user)
+            self.assertIsNone(self.router.db_for_read(Presence))
+
+
+@override_settings(
+    CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS,
+    PRESENCE_STORE={"BACKEND": "presence.store.LocalPresenceStore"},
+    DATABASE_ROUTING={"REPLICAS": ["replica"], "STICKY_SECONDS": 5},
+)
+class ReadYourWritesTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user, self.other = [
+            CustomUser.objects.create_user(email=f"ryw{i}@example.com", username=f"ryw{i}", password="Test123!@#")
+            for i in range(2)
+        ]
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_only_requests_that_write_make_the_user_sticky(self):
+        response = self.client.post(reverse("presence-snapshot"), {"user_ids": [str(self.other.id)]}, format="json")
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(is_sticky(self.user.pk))
+
+        response = self.client.post(reverse("presence-watchers"), {"user_id": str(self.other.id)}, format="json")
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(is_sticky(self.user.pk))
+        self.assertFalse(is_sticky(self.other.pk))
+
+
+class SlidingWindowRateLimitTests(SimpleTestCase):
+    def check_store(self, store):
+        results = [store.hit("k", 3, 60, now=now) for now in (0, 10, 20, 30)]
+        self.assertEqual([result.allowed for result in results], [True, True, True, False])
+        self.assertEqual(results[2].remaining, 0)
+        # 20s into the next window the three hits weigh little enough
+        self.assertEqual(results[3].retry_after, 50)
+        # Half-way through the next window the old hits weigh 1.5
+        self.assertTrue(store.hit("k", 3, 60, now=90).allowed)
+        denied = store.hit("k", 3, 60, now=90)
+        self.assertFalse(denied.allowed)
+        self.assertEqual(denied.retry_after, 10)
+        self.assertTrue(store.hit("other", 3, 60, now=90).allowed)
+
+    def test_local_store(self):
+        self.check_store(LocalRateLimitStore())
+
+    def test_redis_store(self):
+        try:
+            import fakeredis
+            import lupa  # noqa: F401 (fakeredis runs Lua scripts with it)
+        except ImportError:
+            self.skipTest("fakeredis with Lua support is not installed")
+        self.check_store(RedisRateLimitStore(client=fakeredis.FakeRedis()))
+
+
+@override_settings(
+    CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS,
+    PRESENCE_STORE={"BACKEND": "presence.store.LocalPresenceStore"},
+)
+class ThrottlingTests(TestCase):
+    def setUp(self):
+        get_rate_limit_store().clear()
+        self.user = CustomUser.objects.create_user(email="throttle@example.com", username="throttle", password="Test123!@#")
+
+    def test_views_are_limited_through_the_shared_store(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        url = reverse("presence-snapshot")
+        with patch.dict(ScopedRateThrottle.THROTTLE_RATES, {"user": "2/minute"}):
+            statuses = [client.get(url, {"user_ids": str(self.user.id)}).status_code for _ in range(3)]
+        self.assertEqual(statuses, [200, 200, 429])
+
+    async def test_websocket_messages_are_limited(self):
+        communicator = WebsocketCommunicator(
+            URLRouter(websocket_urlpatterns), f"/ws/presence/?token={AccessToken.for_user(self.user)}"
+        )
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        with patch.dict(ScopedRateThrottle.THROTTLE_RATES, {"websocket": "2/minute"}):
+            for _ in range(2):
+                await communicator.send_json_to({"type": "heartbeat"})
+                self.assertTrue(await communicator.receive_nothing())
+            await communicator.send_json_to({"type": "heartbeat"})
+            message = await communicator.receive_json_from()
+        self.assertEqual(message["code"], "throttled")
+        self.assertGreater(message["retry_after"], 0)
+        await communicator.disconnect()
+
+
+def parse_events(body):
+    events = []
+    for block in body.decode().strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.split("\n") if not line.startswith(":"))
+        if "data" in fields:
+            events.append((fields.get("id"), fields["event"], json.loads(fields["data"])))
+    return events
+
+
+@override_settings(
+    CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS,
+    PRESENCE_STORE={"BACKEND": "presence.store.LocalPresenceStore"},
+    PRESENCE_EVENT_STREAM={"REPLAY_SIZE": 100, "BATCH_INTERVAL": 0.2, "MAX_BATCH": 100, "KEEPALIVE": 15},
+)
+class PresenceEventStreamTests(TestCase):
+    def setUp(self):
+        self.staff = CustomUser.objects.create_user(
+            email="staff@example.com", username="staffuser", password="Test123!@#", is_staff=True
+        )
+        self.member = CustomUser.objects.create_user(
+            email="member@example.com", username="memberuser", password="Test123!@#"
+        )
+        self.teammates = [
+            CustomUser.objects.create_user(email=f"mate{i}@example.com", username=f"mate{i}", password="Test123!@#")
+            for i in range(2)
+        ]
+        for user in self.teammates:
+            Presence.objects.create(user=user, status="online", device_type="desktop")
+
+    async def open(self, user, user_ids, last_event_id=None):
+        query = f"user_ids={','.join(str(user_id) for user_id in user_ids)}"
+        if user is not None:
+            query += f"&token={AccessToken.for_user(user)}"
+        communicator = ApplicationCommunicator(URLRouter(http_urlpatterns), {
+            "type": "http",
+            "method": "GET",
+            "path": "/sse/presence/",
+            "query_string": query.encode(),
+            "headers": [(b"last-event-id", last_event_id.encode())] if last_event_id else [],
+        })
+        await communicator.send_input({"type": "http.request", "body": b""})
+        return communicator, await communicator.receive_output()
+
+    async def close(self, communicator):
+        await communicator.send_input({"type": "http.disconnect"})
+        await communicator.wait()
+
+    async def test_snapshot_then_batched_updates(self):
+        communicator, start = await self.open(self.staff, [u.id for u in self.teammates])
+        self.assertEqual(start["status"], 200)
+        self.assertIn((b"Content-Type", b"text/event-stream"), start["headers"])
+        [(_, event, snapshot)] = parse_events((await communicator.receive_output())["body"])
+        self.assertEqual(event, "presence_snapshot")
+        self.assertEqual({r["user_id"] for r in snapshot["data"]}, {str(u.id) for u in self.teammates})
+
+        for user in self.teammates:
+            await database_sync_to_async(Presence.objects.create)(user=user, status="busy", device_type="desktop")
+        # Both updates land within the batch interval, so they share a chunk
+        events = parse_events((await communicator.receive_output(timeout=2))["body"])
+        self.assertEqual([event for _, event, _ in events], ["presence_update", "presence_update"])
+        self.assertEqual([data["user_id"] for _, _, data in events], [str(u.id) for u in self.teammates])
+        await self.close(communicator)
+
+    async def test_last_event_id_replays_missed_updates(self):
+        watched = [self.teammates[0].id]
+        communicator, _ = await self.open(self.staff, watched)
+        [(event_id, _, _)] = parse_events((await communicator.receive_output())["body"])
+        await self.close(communicator)
+
+        # The only client reconnects and resumes where it left off
+        await database_sync_to_async(Presence.objects.create)(user=self.teammates[1], status="away", device_type="desktop")
+        await database_sync_to_async(Presence.objects.create)(user=self.teammates[0], status="busy", device_type="desktop")
+        communicator, _ = await self.open(self.staff, watched, last_event_id=event_id)
+        [(replayed_id, event, data)] = parse_events((await communicator.receive_output())["body"])
+        self.assertEqual(event, "presence_update")
+        self.assertEqual((data["user_id"], data["status"]), (str(self.teammates[0].id), "busy"))
+        self.assertNotEqual(replayed_id, event_id)
+        await self.close(communicator)
+
+        # While nobody here watched, another worker changed the status: the
+        # replay would miss it, so the client gets a snapshot
+        store = get_presence_store()
+        record = store.get(self.teammates[0].id)
+        store.set(self.teammates[0].id, {**record, "status": "away", "last_seen": timezone.now().isoformat()})
+        communicator, _ = await self.open(self.staff, watched, last_event_id=replayed_id)
+        [(_, event, snapshot)] = parse_events((await communicator.receive_output())["body"])
+        self.assertEqual(event, "presence_snapshot")
+        self.assertEqual(snapshot["data"][0]["status"], "away")
+        await self.close(communicator)
+
+        # An ID this worker never issued gets a fresh snapshot instead
+        communicator, _ = await self.open(self.staff, watched, last_event_id="unknown:1")
+        [(_, event, _)] = parse_events((await communicator.receive_output())["body"])
+        self.assertEqual(event, "presence_snapshot")
+        await self.close(communicator)
+
+    def test_replay_buffer_forgets_users_once_trimmed_past(self):
+        buffer = PresenceReplayBuffer(size=2)
+        buffer.watch(["a"])
+        buffer.unwatch(["a"])
+        self.assertIn("a", buffer.watched_since)
+        for second in range(3):
+            buffer.record({"user_id": "b", "last_seen": str(second), "status": "online"})
+        self.assertNotIn("a", buffer.watched_since)
+        self.assertNotIn("a", buffer.gaps)
+
+    async def test_requires_authentication_and_permission(self):
+        communicator, start = await self.open(None, [self.teammates[0].id])
+        self.assertEqual(start["status"], 401)
+        communicator, start = await self.open(self.member, [self.teammates[0].id])
+        self.assertEqual(start["status"], 403)
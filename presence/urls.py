@@ -1,8 +1,11 @@
 # presence/urls.py
 
 from django.urls import path
-from .views import PresenceUpdateView
+from .views import UserPresenceView, PresenceSnapshotView, WatcherListCreateView, WatcherDetailView
 
 urlpatterns = [
-    path('users/<uuid:userId>/presence/', PresenceUpdateView.as_view(), name='user-presence'),
+    path('users/<uuid:userId>/presence/', UserPresenceView.as_view(), name='user-presence'),
+    path('presence/snapshot/', PresenceSnapshotView.as_view(), name='presence-snapshot'),
+    path('presence/watchers/', WatcherListCreateView.as_view(), name='presence-watchers'),
+    path('presence/watchers/<uuid:userId>/', WatcherDetailView.as_view(), name='presence-watcher-detail'),
 ]
@@ -1,25 +1,115 @@
 # presence/views.py
-from rest_framework import generics
+import hashlib
+import json
+
+from rest_framework import generics, status
+from rest_framework.views import APIView
 from rest_framework.permissions import IsAuthenticated
-from .models import Presence
-from .serializers import PresenceDataSerializer
+from LiveStatusAPI.routers import ReplicaReadMixin
+from .models import PresenceSubscription
+from .serializers import PresenceRecordSerializer, PresenceSnapshotRequestSerializer, WatcherSerializer
+from .store import get_current_presence, get_current_presences
 from rest_framework.response import Response
+from django.http import Http404
+from django.shortcuts import get_object_or_404
+from django.utils.http import parse_etags, quote_etag
 from django.utils.translation import gettext_lazy as _
 from drf_spectacular.utils import extend_schema
 
-class UserPresenceView(generics.RetrieveAPIView):
-    queryset = Presence.objects.select_related("user")
-    serializer_class = PresenceDataSerializer
+class UserPresenceView(ReplicaReadMixin, generics.GenericAPIView):
+    serializer_class = PresenceRecordSerializer
     permission_classes = [IsAuthenticated]
-    lookup_field = "user_id"
 
     @extend_schema(
         summary="Get user presence",
         description="Retrieve the latest presence data for a user. WebSocket endpoint: ws://your-domain.com/ws/presence/{user_id}/?token=<JWT_TOKEN>",
     )
-    def get(self, request, *args, **kwargs):
-        presence = self.get_object()
+    def get(self, request, userId, *args, **kwargs):
+        presence = get_current_presence(userId)
+        if presence is None:
+            raise Http404(_("No presence data found for this user."))
         serializer = self.get_serializer(presence)
         data = serializer.data
-        data["websocket_url"] = f"ws://your-domain.com/ws/presence/{self.kwargs['user_id']}/?token=<JWT_TOKEN>"
-        return Response(data)
\ No newline at end of file
+        data["websocket_url"] = f"ws://your-domain.com/ws/presence/{userId}/?token=<JWT_TOKEN>"
+        return Response(data)
+
+class PresenceSnapshotView(ReplicaReadMixin, APIView):
+    """
+    Latest presence for many users at once, served from the current-presence
+    store. Pass IDs as ``?user_ids=<id>,<id>`` or POST ``{"user_ids": [...]}``.
+    Responses carry an ETag; send it back in If-None-Match to get a 304 when
+    nothing has changed.
+    """
+    permission_classes = [IsAuthenticated]
+
+    @extend_schema(
+        summary="Get presence snapshot",
+        request=PresenceSnapshotRequestSerializer,
+        responses=PresenceRecordSerializer(many=True),
+    )
+    def get(self, request, *args, **kwargs):
+        user_ids = [user_id for user_id in request.query_params.get("user_ids", "").split(",") if user_id]
+        return self.snapshot(request, {"user_ids": user_ids})
+
+    @extend_schema(
+        summary="Get presence snapshot",
+        request=PresenceSnapshotRequestSerializer,
+        responses=PresenceRecordSerializer(many=True),
+    )
+    def post(self, request, *args, **kwargs):
+        return self.snapshot(request, request.data)
+
+    def snapshot(self, request, data):
+        # A body that isn't a JSON object fails validation with a 400
+        serializer = PresenceSnapshotRequestSerializer(data=data)
+        serializer.is_valid(raise_exception=True)
+        user_ids = [str(user_id) for user_id in dict.fromkeys(serializer.validated_data["user_ids"])]
+
+        records = get_current_presences(user_ids)
+        data = {
+            "results": PresenceRecordSerializer([records[user_id] for user_id in user_ids if user_id in records], many=True).data,
+            "missing": [user_id for user_id in user_ids if user_id not in records],
+        }
+
+        etag = quote_etag(hashlib.sha1(json.dumps(data, sort_keys=True, default=str).encode()).hexdigest())
+        if_none_match = request.headers.get("If-None-Match")
+        if if_none_match and (etag in parse_etags(if_none_match) or if_none_match.strip() == "*"):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = Response(data)
+        response["ETag"] = etag
+        return response
+
+class WatcherListCreateView(generics.ListCreateAPIView):
+    """
+    List the users allowed to watch the authenticated user's presence, or
+    grant one more. Teammates can always watch each other and are not listed.
+    """
+    serializer_class = WatcherSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        return PresenceSubscription.objects.filter(target=self.request.user).select_related("watcher").order_by("created_at")
+
+    @extend_schema(summary="Grant presence access")
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        subscription, created = PresenceSubscription.objects.get_or_create(
+            target=request.user, watcher=serializer.validated_data["watcher"]
+        )
+        return Response(
+            self.get_serializer(subscription).data,
+            status=status.HTTP_201_CREATED if created else status.HTTP_200_OK,
+        )
+
+class WatcherDetailView(APIView):
+    """
+    Revoke a user's access to the authenticated user's presence.
+    """
+    permission_classes = [IsAuthenticated]
+
+    @extend_schema(summary="Revoke presence access", responses={204: None})
+    def delete(self, request, userId, *args, **kwargs):
+        get_object_or_404(PresenceSubscription, target=request.user, watcher_id=userId).delete()
+        return Response(status=status.HTTP_204_NO_CONTENT)
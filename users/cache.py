@@ -0,0 +1,118 @@
+# users/cache.py
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.signals import setting_changed
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+
+User = get_user_model()
+
+
+class UserCache:
+    """
+    Per-process LRU cache of active users keyed by id, with a TTL so that
+    changes made by other processes are picked up eventually. Saves and
+    deletes in this process invalidate immediately.
+    """
+
+    def __init__(self, max_size=10000, ttl=300):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._users = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        """
+        Return the cached user, or None on a miss. Never touches the database.
+        """
+        key = str(user_id)
+        with self._lock:
+            entry = self._users.get(key)
+            if entry is None:
+                return None
+            user, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._users[key]
+                return None
+            self._users.move_to_end(key)
+            return user
+
+    def load(self, user_id):
+        """
+        Return the user, reading and caching it on a miss. Inactive or
+        missing users return None and are not cached.
+        """
+        user = self.get(user_id)
+        if user is not None:
+            return user
+        user = User.objects.filter(pk=user_id, is_active=True).first()
+        if user is not None:
+            self.set(user)
+        return user
+
+    async def aload(self, user_id):
+        """
+        load() for the event loop: hits never leave it, misses use the
+        async ORM.
+        """
+        user = self.get(user_id)
+        if user is not None:
+            return user
+        user = await User.objects.filter(pk=user_id, is_active=True).afirst()
+        if user is not None:
+            self.set(user)
+        return user
+
+    def set(self, user):
+        with self._lock:
+            self._users[str(user.pk)] = (user, time.monotonic() + self.ttl)
+            self._users.move_to_end(str(user.pk))
+            while len(self._users) > self.max_size:
+                self._users.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._users.pop(str(user_id), None)
+
+    def clear(self):
+        with self._lock:
+            self._users.clear()
+
+
+_cache = None
+
+
+def get_user_cache():
+    """
+    Return the process-wide cache configured by settings.USER_CACHE.
+    """
+    global _cache
+    if _cache is None:
+        config = getattr(settings, "USER_CACHE", {})
+        _cache = UserCache(max_size=config.get("MAX_SIZE", 10000), ttl=config.get("TTL", 300))
+    return _cache
+
+
+@receiver(setting_changed)
+def reset_user_cache(setting, **kwargs):
+    global _cache
+    if setting == "USER_CACHE":
+        _cache = None
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_cached_user(sender, instance, **kwargs):
+    if _cache is not None:
+        _cache.invalidate(instance.pk)
+
+
+@receiver(post_save, sender=BlacklistedToken)
+def invalidate_blacklisted_user(sender, instance, **kwargs):
+    if _cache is not None and instance.token.user_id is not None:
+        _cache.invalidate(instance.token.user_id)
@@ -0,0 +1,130 @@
+# users/devices.py
+import re
+from functools import lru_cache
+from typing import NamedTuple
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+# Substrings of a lowercased User-Agent and what they tell us. Within each
+# category the first entry found wins, so more specific tokens come first:
+# crawlers claim other platforms, "ipad" is a tablet although iPads also send
+# "mobile", and Chrome and Edge both say "safari".
+DEVICE_TOKENS = [
+    ("device", "bot", ["bot", "crawl", "spider", "slurp"]),
+    ("device", "tablet", ["ipad", "tablet", "kindle", "silk/", "nexus 7", "playbook"]),
+    ("device", "mobile", [
+        "mobile", "iphone", "ipod", "android", "opera mini", "webos", "blackberry", "windows phone", "iemobile",
+    ]),
+    ("device", "desktop", ["windows", "macintosh", "linux", "x11", "cros ", "postmanruntime"]),
+    ("os", "Windows Phone", ["windows phone"]),
+    ("os", "iOS", ["iphone", "ipad", "ipod"]),
+    ("os", "Android", ["android"]),
+    ("os", "ChromeOS", ["cros "]),
+    ("os", "macOS", ["macintosh", "mac os x"]),
+    ("os", "Windows", ["windows"]),
+    ("os", "Linux", ["linux", "x11"]),
+    ("client", "Edge", ["edg/", "edga/", "edgios/"]),
+    ("client", "Opera", ["opr/", "opera mini", "opera"]),
+    ("client", "Samsung Internet", ["samsungbrowser"]),
+    ("client", "Firefox", ["firefox", "fxios"]),
+    ("client", "Chrome", ["chrome", "crios"]),
+    ("client", "Safari", ["safari"]),
+    ("client", "Postman", ["postmanruntime"]),
+    ("client", "curl", ["curl/"]),
+    ("client", "python-requests", ["python-requests"]),
+    ("client", "OkHttp", ["okhttp"]),
+]
+
+
+class DeviceInfo(NamedTuple):
+    device_type: str
+    os: str
+    client: str
+
+
+UNKNOWN_DEVICE = DeviceInfo("unknown", "unknown", "unknown")
+
+
+class DeviceClassifier:
+    """
+    Classify User-Agent strings into device type, OS and client family.
+
+    All tokens are compiled into one alternation, so a User-Agent is scanned
+    once however many tokens there are, and results are kept in an LRU keyed
+    by the raw header; a fleet of clients sends few distinct User-Agents, so
+    nearly every call is a cache hit.
+    """
+
+    def __init__(self, cache_size=1024, max_length=512):
+        self.max_length = max_length
+        self.meanings = {}  # token -> [(category, value, rank)]
+        for rank, (category, value, tokens) in enumerate(DEVICE_TOKENS):
+            for token in tokens:
+                self.meanings.setdefault(token, []).append((category, value, rank))
+        # Longest first, so "windows phone" is matched in preference to "windows"
+        self.pattern = re.compile("|".join(re.escape(token) for token in sorted(self.meanings, key=len, reverse=True)))
+        self.classify = lru_cache(maxsize=cache_size)(self._classify)
+
+    def _classify(self, user_agent):
+        if not user_agent:
+            return UNKNOWN_DEVICE
+        found = set(self.pattern.findall(user_agent[: self.max_length].lower()))
+        best = {}
+        for token in found:
+            for category, value, rank in self.meanings[token]:
+                if category not in best or rank < best[category][0]:
+                    best[category] = (rank, value)
+        device_type = best.get("device", (None, "unknown"))[1]
+        if device_type == "mobile" and "android" in found and "mobile" not in found:
+            device_type = "tablet"  # Android tablets leave "Mobile" out
+        return DeviceInfo(
+            device_type, best.get("os", (None, "unknown"))[1], best.get("client", (None, "unknown"))[1]
+        )
+
+
+_classifier = None
+
+
+def get_device_classifier():
+    """
+    Return the process-wide classifier configured by
+    settings.DEVICE_CLASSIFICATION.
+    """
+    global _classifier
+    if _classifier is None:
+        config = getattr(settings, "DEVICE_CLASSIFICATION", {})
+        _classifier = DeviceClassifier(
+            cache_size=config.get("CACHE_SIZE", 1024),
+            max_length=config.get("MAX_LENGTH", 512),
+        )
+    return _classifier
+
+
+def classify_user_agent(user_agent):
+    return get_device_classifier().classify(user_agent)
+
+
+def get_device_type(user_agent: str) -> str:
+    """
+    Parse the User-Agent header to determine the device type.
+    """
+    return classify_user_agent(user_agent).device_type
+
+
+def get_scope_device(scope):
+    """
+    Classify the User-Agent header of an ASGI scope.
+    """
+    for name, value in scope.get("headers", []):
+        if name == b"user-agent":
+            return classify_user_agent(value.decode("latin-1"))
+    return UNKNOWN_DEVICE
+
+
+@receiver(setting_changed)
+def reset_device_classifier(setting, **kwargs):
+    global _classifier
+    if setting == "DEVICE_CLASSIFICATION":
+        _classifier = None
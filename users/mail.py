@@ -0,0 +1,131 @@
+# users/mail.py
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from LiveStatusAPI.workers import BackgroundWorker
+
+from .models import OutgoingEmail
+
+logger = logging.getLogger(__name__)
+
+
+def get_mail_queue_settings():
+    config = getattr(settings, "EMAIL_QUEUE", {})
+    return {
+        "WORKER": config.get("WORKER", "thread"),
+        "BATCH_SIZE": config.get("BATCH_SIZE", 50),
+        "MAX_ATTEMPTS": config.get("MAX_ATTEMPTS", 5),
+        "RETRY_BACKOFF": config.get("RETRY_BACKOFF", 60),
+        "LEASE": config.get("LEASE", 300),
+    }
+
+
+def queue_mail(subject, message, recipient_list, from_email=None):
+    """
+    Persist one email per recipient and return without contacting the mail
+    server. Takes the same arguments as send_mail.
+    """
+    emails = OutgoingEmail.objects.bulk_create([
+        OutgoingEmail(subject=str(subject), body=str(message), from_email=from_email, to_email=recipient)
+        for recipient in recipient_list
+    ])
+    if get_mail_queue_settings()["WORKER"] == "thread":
+        transaction.on_commit(mail_worker.wake)
+    return emails
+
+
+def mark_failed(email, error, config, now):
+    email.last_error = str(error)
+    if email.attempts >= config["MAX_ATTEMPTS"]:
+        email.status = "failed"
+        logger.error(f"Giving up on email {email.id} to {email.to_email} after {email.attempts} attempts: {error}")
+    else:
+        email.next_attempt_at = now + timedelta(seconds=config["RETRY_BACKOFF"] * 2 ** (email.attempts - 1))
+
+
+def claim_queued_mail(config, batch_size):
+    """
+    Lease up to ``batch_size`` due emails and count the attempt, in one short
+    transaction that is committed before the mail server is contacted.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        # skip_locked lets several workers drain the queue side by side.
+        emails = list(
+            OutgoingEmail.objects.select_for_update(skip_locked=True)
+            .filter(status="pending", next_attempt_at__lte=now)
+            .order_by("next_attempt_at", "id")[:batch_size]
+        )
+        # Leased rows are skipped by other workers until delivered or the
+        # lease runs out (e.g. if this process dies mid-delivery).
+        OutgoingEmail.objects.filter(pk__in=[email.pk for email in emails]).update(
+            attempts=F("attempts") + 1, next_attempt_at=now + timedelta(seconds=config["LEASE"])
+        )
+    for email in emails:
+        email.attempts += 1
+    return emails
+
+
+def deliver_queued_mail(batch_size=None):
+    """
+    Deliver one batch of due emails over a single SMTP connection and return
+    (sent, failed) for the batch. Failures are retried with exponential
+    backoff until MAX_ATTEMPTS is reached.
+    """
+    config = get_mail_queue_settings()
+    emails = claim_queued_mail(config, batch_size or config["BATCH_SIZE"])
+    if not emails:
+        return 0, 0
+
+    now = timezone.now()
+    sent = failed = 0
+    connection = get_connection(fail_silently=False)
+    try:
+        connection.open()
+    except Exception as e:
+        # Mail server unreachable: the whole batch counts as one attempt.
+        for email in emails:
+            mark_failed(email, e, config, now)
+        failed = len(emails)
+    else:
+        try:
+            for email in emails:
+                try:
+                    EmailMessage(
+                        email.subject, email.body, email.from_email, [email.to_email], connection=connection
+                    ).send()
+                except Exception as e:
+                    mark_failed(email, e, config, now)
+                    failed += 1
+                else:
+                    email.status = "sent"
+                    email.sent_at = timezone.now()
+                    email.last_error = ""
+                    sent += 1
+        finally:
+            connection.close()
+
+    OutgoingEmail.objects.bulk_update(emails, ["status", "next_attempt_at", "last_error", "sent_at"])
+    return sent, failed
+
+
+def drain_queued_mail(batch_size=None):
+    """
+    Deliver batches until nothing is due. Returns total (sent, failed).
+    """
+    totals = [0, 0]
+    while True:
+        sent, failed = deliver_queued_mail(batch_size)
+        if not sent and not failed:
+            return tuple(totals)
+        totals[0] += sent
+        totals[1] += failed
+
+
+# Drains the queue on a background thread in each process (WORKER "thread")
+mail_worker = BackgroundWorker("mail-worker", drain_queued_mail, OutgoingEmail)
@@ -0,0 +1,40 @@
+# users/management/commands/prune_tokens.py
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+
+
+class Command(BaseCommand):
+    help = (
+        'Delete expired outstanding tokens and their blacklist entries in batches. Expired '
+        'tokens are rejected on their own, so these rows are no longer needed.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows per delete')
+        parser.add_argument('--dry-run', action='store_true', help='Only report how many rows would be deleted')
+
+    def handle(self, *args, **options):
+        expired = OutstandingToken.objects.filter(expires_at__lte=timezone.now())
+        if options['dry_run']:
+            self.stdout.write(
+                f'Would delete {expired.count()} outstanding and '
+                f'{BlacklistedToken.objects.filter(token__in=expired).count()} blacklisted tokens'
+            )
+            return
+
+        # Delete by primary key in batches so a large backlog does not hold one
+        # long transaction; blacklist entries go with their token (CASCADE).
+        totals = {'outstanding': 0, 'blacklisted': 0}
+        while True:
+            ids = list(expired.values_list('pk', flat=True)[:options['batch_size']])
+            if not ids:
+                break
+            _, deleted = OutstandingToken.objects.filter(pk__in=ids).delete()
+            totals['outstanding'] += deleted.get(OutstandingToken._meta.label, 0)
+            totals['blacklisted'] += deleted.get(BlacklistedToken._meta.label, 0)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Deleted {totals["outstanding"]} outstanding and {totals["blacklisted"]} blacklisted tokens'
+        ))
@@ -0,0 +1,24 @@
+# users/management/commands/send_queued_mail.py
+
+import time
+
+from django.core.management.base import BaseCommand
+from users.mail import drain_queued_mail
+
+
+class Command(BaseCommand):
+    help = 'Deliver queued outbound email in batches over one SMTP connection per batch'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None, help='Emails per batch (default: EMAIL_QUEUE["BATCH_SIZE"])')
+        parser.add_argument('--loop', action='store_true', help='Keep polling the queue instead of exiting when it is empty')
+        parser.add_argument('--interval', type=float, default=5.0, help='Seconds between polls with --loop')
+
+    def handle(self, *args, **options):
+        while True:
+            sent, failed = drain_queued_mail(options['batch_size'])
+            if sent or failed or not options['loop']:
+                self.stdout.write(self.style.SUCCESS(f'Sent {sent} emails, {failed} failed'))
+            if not options['loop']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,288 @@
+# users/revocation.py
+import asyncio
+import heapq
+import logging
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+
+logger = logging.getLogger(__name__)
+
+
+class BaseRevocationStore:
+    """
+    Holds revoked token JTIs and per-user "issued before" watermarks. Every
+    entry expires once no token it could apply to is still valid, so the
+    store stays bounded by the number of revocations per token lifetime.
+    """
+
+    def revoke(self, jti, ttl):
+        raise NotImplementedError
+
+    def is_revoked(self, jti):
+        raise NotImplementedError
+
+    def set_watermark(self, user_id, issued_before, ttl):
+        raise NotImplementedError
+
+    def get_watermark(self, user_id):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    # Async variants for the WebSocket handshake. The defaults run the sync
+    # methods in a worker thread; backends override them where they can
+    # answer without blocking the event loop.
+
+    async def ais_revoked(self, jti):
+        return await sync_to_async(self.is_revoked)(jti)
+
+    async def aget_watermark(self, user_id):
+        return await sync_to_async(self.get_watermark)(user_id)
+
+
+class LocalRevocationStore(BaseRevocationStore):
+    """
+    In-process store. Only suitable for a single worker or for tests.
+
+    Entries are only ever dropped once they have expired, i.e. once the token
+    they cover would have expired anyway. Expired entries are purged when
+    ``max_size`` is reached; if the store is still full after that it keeps
+    growing and logs a warning rather than forgetting a live revocation.
+    """
+
+    def __init__(self, max_size=100000):
+        self.max_size = max_size
+        self._entries = {}  # key -> (value, expires_at)
+        self._expiry = []  # heap of (expires_at, key)
+        self._lock = threading.Lock()
+        self._over_capacity = False
+
+    def _get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at < time.monotonic():
+            return None
+        return value
+
+    def _set(self, key, value, ttl):
+        if ttl <= 0:
+            return
+        now = time.monotonic()
+        with self._lock:
+            expires_at = now + ttl
+            previous = self._entries.get(key)
+            if previous is not None and previous[1] > expires_at:
+                expires_at = previous[1]  # never shorten a revocation
+            self._entries[key] = (value, expires_at)
+            heapq.heappush(self._expiry, (expires_at, key))
+            if len(self._entries) > self.max_size:
+                self._purge(now)
+            over_capacity = len(self._entries) > self.max_size
+            if over_capacity and not self._over_capacity:
+                logger.warning(
+                    f"Token revocation store holds {len(self._entries)} live entries, over its max_size of "
+                    f"{self.max_size}; use a shared store such as RedisRevocationStore"
+                )
+            self._over_capacity = over_capacity
+
+    def _purge(self, now):
+        while self._expiry and self._expiry[0][0] < now:
+            expires_at, key = heapq.heappop(self._expiry)
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] == expires_at:
+                del self._entries[key]
+        if len(self._expiry) > 2 * max(len(self._entries), self.max_size):
+            # Drop heap entries left behind by keys that were set again
+            self._expiry = [(entry[1], key) for key, entry in self._entries.items()]
+            heapq.heapify(self._expiry)
+
+    def revoke(self, jti, ttl):
+        self._set(f"jti:{jti}", True, ttl)
+
+    def is_revoked(self, jti):
+        return self._get(f"jti:{jti}") is not None
+
+    def set_watermark(self, user_id, issued_before, ttl):
+        self._set(f"user:{user_id}", issued_before, ttl)
+
+    def get_watermark(self, user_id):
+        return self._get(f"user:{user_id}")
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._expiry.clear()
+            self._over_capacity = False
+
+    # Plain dict lookups: cheaper inline than a thread hop.
+
+    async def ais_revoked(self, jti):
+        return self.is_revoked(jti)
+
+    async def aget_watermark(self, user_id):
+        return self.get_watermark(user_id)
+
+
+class RedisRevocationStore(BaseRevocationStore):
+    """
+    Redis-backed store shared by every worker; expiry is left to Redis.
+
+    Pass ``client`` to use an existing connection (e.g. ``fakeredis.FakeRedis``
+    in tests); otherwise one is created from ``url``. WebSocket handshakes
+    go through a ``redis.asyncio`` client, ``async_client`` or one per event
+    loop made from ``url``, so the check never blocks the loop.
+    """
+
+    def __init__(self, url="redis://localhost:6379/0", key_prefix="auth:revoked:", client=None, async_client=None):
+        self.url = url if client is None else None
+        if client is None:
+            import redis
+
+            client = redis.Redis.from_url(url)
+        self.client = client
+        self.key_prefix = key_prefix
+        self._async_client = async_client
+        self._loop_client = None
+        self._loop = None
+
+    def revoke(self, jti, ttl):
+        if ttl > 0:
+            self.client.set(f"{self.key_prefix}jti:{jti}", 1, ex=int(ttl) + 1)
+
+    def is_revoked(self, jti):
+        return bool(self.client.exists(f"{self.key_prefix}jti:{jti}"))
+
+    def set_watermark(self, user_id, issued_before, ttl):
+        if ttl > 0:
+            self.client.set(f"{self.key_prefix}user:{user_id}", int(issued_before), ex=int(ttl) + 1)
+
+    def get_watermark(self, user_id):
+        value = self.client.get(f"{self.key_prefix}user:{user_id}")
+        return int(value) if value is not None else None
+
+    def clear(self):
+        keys = list(self.client.scan_iter(match=f"{self.key_prefix}*"))
+        if keys:
+            self.client.delete(*keys)
+
+    def get_async_client(self):
+        """
+        The asyncio client for the running loop, or None when the store was
+        given a sync client only.
+        """
+        if self._async_client is not None or self.url is None:
+            return self._async_client
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            import redis.asyncio
+
+            # Connections belong to the loop that opened them
+            self._loop_client = redis.asyncio.Redis.from_url(self.url)
+            self._loop = loop
+        return self._loop_client
+
+    async def ais_revoked(self, jti):
+        client = self.get_async_client()
+        if client is None:
+            return await super().ais_revoked(jti)
+        return bool(await client.exists(f"{self.key_prefix}jti:{jti}"))
+
+    async def aget_watermark(self, user_id):
+        client = self.get_async_client()
+        if client is None:
+            return await super().aget_watermark(user_id)
+        value = await client.get(f"{self.key_prefix}user:{user_id}")
+        return int(value) if value is not None else None
+
+
+_store = None
+
+
+def get_revocation_store():
+    """
+    Return the process-wide store configured by settings.TOKEN_REVOCATION.
+    """
+    global _store
+    if _store is None:
+        config = getattr(settings, "TOKEN_REVOCATION", {})
+        backend = import_string(config.get("BACKEND", "users.revocation.LocalRevocationStore"))
+        _store = backend(**config.get("OPTIONS", {}))
+    return _store
+
+
+@receiver(setting_changed)
+def reset_revocation_store(setting, **kwargs):
+    global _store
+    if setting == "TOKEN_REVOCATION":
+        _store = None
+
+
+def max_token_lifetime():
+    return max(api_settings.ACCESS_TOKEN_LIFETIME, api_settings.REFRESH_TOKEN_LIFETIME).total_seconds()
+
+
+def revoke_token(token):
+    """
+    Revoke a single access or refresh token until it would have expired.
+    """
+    jti = token.get(api_settings.JTI_CLAIM)
+    if jti:
+        get_revocation_store().revoke(jti, token["exp"] - time.time())
+
+
+def revoke_user_tokens(user_id):
+    """
+    Revoke every token issued to the user up to now, e.g. after a password
+    reset. Tokens issued within the same second are not affected.
+    """
+    get_revocation_store().set_watermark(user_id, int(time.time()), max_token_lifetime())
+
+
+def is_token_revoked(token):
+    """
+    O(1) check against the revocation store; never touches the database.
+    """
+    store = get_revocation_store()
+    jti = token.get(api_settings.JTI_CLAIM)
+    if jti and store.is_revoked(jti):
+        return True
+    user_id = token.get(api_settings.USER_ID_CLAIM)
+    if user_id is None:
+        return False
+    watermark = store.get_watermark(user_id)
+    return watermark is not None and token.get("iat", 0) < watermark
+
+
+async def ais_token_revoked(token):
+    """
+    Async version of is_token_revoked for code running on the event loop.
+    """
+    store = get_revocation_store()
+    jti = token.get(api_settings.JTI_CLAIM)
+    if jti and await store.ais_revoked(jti):
+        return True
+    user_id = token.get(api_settings.USER_ID_CLAIM)
+    if user_id is None:
+        return False
+    watermark = await store.aget_watermark(user_id)
+    return watermark is not None and token.get("iat", 0) < watermark
+
+
+@receiver(post_save, sender=BlacklistedToken)
+def revoke_blacklisted_token(sender, instance, created, **kwargs):
+    # Covers token.blacklist() as well as blacklisting from the admin.
+    if created:
+        outstanding = instance.token
+        get_revocation_store().revoke(outstanding.jti, outstanding.expires_at.timestamp() - time.time())
@@ -2,37 +2,21 @@
 from rest_framework import serializers
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 from django.contrib.auth import get_user_model
-from django.core.mail import send_mail
 from django.urls import reverse
 from django.utils.translation import gettext_lazy as _
 from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
 from django.utils.encoding import force_bytes
 from django.contrib.auth.tokens import PasswordResetTokenGenerator
 from presence.models import Presence
+from .devices import get_device_type  # noqa: F401
+from .mail import queue_mail
+from .revocation import revoke_user_tokens
 import re
 from uuid import uuid4
 
 User = get_user_model()
 
 
-def get_device_type(user_agent: str) -> str:
-    """
-    Parse the User-Agent header to determine the device type.
-    """
-    if not user_agent:
-        return "unknown"
-
-    user_agent = user_agent.lower()
-    if re.search(r"mobile|android|iphone|ipad|ipod|opera mini|webos|blackberry|windows phone", user_agent):
-        return "mobile"
-    elif re.search(r"tablet|kindle|nexus 7|ipad", user_agent):
-        return "tablet"
-    elif re.search(r"windows|macintosh|linux|x11|postmanruntime", user_agent):
-        return "desktop"
-    elif re.search(r"bot|crawl|spider|slurp", user_agent):
-        return "bot"
-    return "unknown"
-
 class RegisterSerializer(serializers.ModelSerializer):
     password = serializers.CharField(write_only=True, min_length=8)
     email = serializers.EmailField()
@@ -79,13 +63,8 @@ class RegisterSerializer(serializers.ModelSerializer):
         )
         subject = _("Verify Your Email Address")
         message = _("Click the link to verify your email: {url}").format(url=verification_url)
-        send_mail(
-            subject,
-            message,
-            None,  # Use DEFAULT_FROM_EMAIL from settings
-            [user.email],
-            fail_silently=False,
-        )
+        # Delivered by the mail worker; the request does not wait on SMTP
+        queue_mail(subject, message, [user.email])
         return user
 
 class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
@@ -143,13 +122,8 @@ class PasswordResetRequestSerializer(serializers.Serializer):
         )
         subject = _("Reset Your Password")
         message = _("Click the link to reset your password: {url}").format(url=reset_url)
-        send_mail(
-            subject,
-            message,
-            None,  # Use DEFAULT_FROM_EMAIL from settings
-            [user.email],
-            fail_silently=False,
-        )
+        # Delivered by the mail worker; the request does not wait on SMTP
+        queue_mail(subject, message, [user.email])
 
 class PasswordResetConfirmSerializer(serializers.Serializer):
     new_password = serializers.CharField(min_length=8, write_only=True)
@@ -182,6 +156,7 @@ class PasswordResetConfirmSerializer(serializers.Serializer):
         password = self.validated_data["new_password"]
         self.user.set_password(password)
         self.user.save()
-        # Optionally invalidate existing tokens
+        # Invalidate existing tokens
         from rest_framework_simplejwt.token_blacklist.models import OutstandingToken
-        OutstandingToken.objects.filter(user=self.user).delete()
\ No newline at end of file
+        OutstandingToken.objects.filter(user=self.user).delete()
+        revoke_user_tokens(self.user.id)
\ No newline at end of file
@@ -1,5 +1,23 @@
-from django.test import TestCase
-from .models import CustomUser
+from datetime import timedelta
+from io import StringIO
+from smtplib import SMTPException
+from unittest import mock
+import time
+
+from django.core import mail
+from django.core.management import call_command
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+from LiveStatusAPI.workers import BackgroundWorker
+from .devices import DeviceClassifier, DeviceInfo, get_scope_device
+from .mail import deliver_queued_mail, drain_queued_mail, mail_worker, queue_mail
+from .models import CustomUser, OutgoingEmail
+from .revocation import LocalRevocationStore, RedisRevocationStore, is_token_revoked, revoke_user_tokens
+from .serializers import RegisterSerializer
 
 
 class CustomUserTestCase(TestCase):
@@ -15,4 +33,198 @@ class CustomUserTestCase(TestCase):
         # Check if the user is created with the correct attributes
         self.assertEqual(self.user.username, "testuser")
         self.assertEqual(self.user.email, "testuser@example.com")
-        self.assertTrue(self.user.check_password("testpassword"))
\ No newline at end of file
+        self.assertTrue(self.user.check_password("testpassword"))
+
+
+@override_settings(TOKEN_REVOCATION={"BACKEND": "users.revocation.LocalRevocationStore"})
+class TokenRevocationTestCase(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            username="revokeuser", email="revoke@example.com", password="Test123!@#"
+        )
+        self.client = APIClient()
+
+    def test_logout_revokes_access_token_without_queries(self):
+        refresh = RefreshToken.for_user(self.user)
+        access = refresh.access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {access}")
+        response = self.client.post(reverse("logout"), {"refresh": str(refresh)}, format="json")
+        self.assertEqual(response.status_code, 205)
+
+        with self.assertNumQueries(0):
+            self.assertTrue(is_token_revoked(access))
+            self.assertTrue(is_token_revoked(refresh))
+        response = self.client.get(reverse("user-presence", kwargs={"userId": self.user.id}))
+        self.assertEqual(response.status_code, 401)
+
+    def test_user_watermark_revokes_older_tokens_only(self):
+        old_token = AccessToken.for_user(self.user)
+        old_token["iat"] = int(time.time()) - 10
+        revoke_user_tokens(self.user.id)
+        self.assertTrue(is_token_revoked(old_token))
+
+        new_token = AccessToken.for_user(self.user)
+        new_token["iat"] = int(time.time()) + 1
+        self.assertFalse(is_token_revoked(new_token))
+
+    def test_local_store_never_drops_live_revocations(self):
+        store = LocalRevocationStore(max_size=2)
+        store.revoke("short", ttl=0.01)
+        store.revoke("a", ttl=60)
+        time.sleep(0.02)
+        store.revoke("b", ttl=60)  # full: the expired entry makes room
+        self.assertEqual(len(store._entries), 2)
+        with self.assertLogs("users.revocation", level="WARNING"):
+            store.revoke("c", ttl=60)
+        self.assertTrue(all(store.is_revoked(jti) for jti in ("a", "b", "c")))
+        store.revoke("expired", ttl=0)
+        self.assertFalse(store.is_revoked("expired"))
+        self.assertFalse(store.is_revoked("short"))
+
+    def test_redis_store(self):
+        try:
+            import fakeredis
+        except ImportError:
+            self.skipTest("fakeredis is not installed")
+        store = RedisRevocationStore(client=fakeredis.FakeRedis())
+        store.revoke("abc", ttl=60)
+        store.set_watermark(self.user.id, 1000, ttl=60)
+        self.assertTrue(store.is_revoked("abc"))
+        self.assertFalse(store.is_revoked("other"))
+        self.assertEqual(store.get_watermark(self.user.id), 1000)
+        self.assertGreater(store.client.ttl("auth:revoked:jti:abc"), 0)
+
+    async def test_redis_store_async_client(self):
+        try:
+            import fakeredis
+        except ImportError:
+            self.skipTest("fakeredis is not installed")
+        server = fakeredis.FakeServer()
+        store = RedisRevocationStore(
+            client=fakeredis.FakeRedis(server=server), async_client=fakeredis.FakeAsyncRedis(server=server)
+        )
+        store.revoke("abc", ttl=60)
+        store.set_watermark(self.user.id, 1000, ttl=60)
+        self.assertTrue(await store.ais_revoked("abc"))
+        self.assertFalse(await store.ais_revoked("other"))
+        self.assertEqual(await store.aget_watermark(self.user.id), 1000)
+        self.assertIsNone(await store.aget_watermark("nobody"))
+
+
+class PruneTokensCommandTestCase(TestCase):
+    def test_prunes_only_expired_tokens(self):
+        user = CustomUser.objects.create_user(username="pruneuser", email="prune@example.com", password="Test123!@#")
+        now = timezone.now()
+        for index, expires_at in enumerate([now - timedelta(days=2), now - timedelta(hours=1), now + timedelta(days=1)]):
+            token = OutstandingToken.objects.create(
+                user=user, jti=f"jti-{index}", token=f"token-{index}", expires_at=expires_at
+            )
+            BlacklistedToken.objects.create(token=token)
+
+        out = StringIO()
+        call_command("prune_tokens", batch_size=1, stdout=out)
+        self.assertIn("Deleted 2 outstanding and 2 blacklisted tokens", out.getvalue())
+        self.assertEqual(list(OutstandingToken.objects.values_list("jti", flat=True)), ["jti-2"])
+        self.assertEqual(BlacklistedToken.objects.count(), 1)
+
+
+@override_settings(EMAIL_QUEUE={"WORKER": "command", "BATCH_SIZE": 2, "MAX_ATTEMPTS": 2, "RETRY_BACKOFF": 60})
+class MailQueueTestCase(TestCase):
+    def test_registration_queues_instead_of_sending(self):
+        request = RequestFactory().post(reverse("register"))
+        serializer = RegisterSerializer(
+            data={"email": "queued@example.com", "username": "queued", "password": "Test123!@#"},
+            context={"request": request},
+        )
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        self.assertEqual(len(mail.outbox), 0)
+        email = OutgoingEmail.objects.get()
+        self.assertEqual(email.to_email, "queued@example.com")
+        self.assertEqual(email.status, "pending")
+
+    def test_thread_worker_is_woken_after_commit(self):
+        with self.settings(EMAIL_QUEUE={"WORKER": "thread"}):
+            with self.captureOnCommitCallbacks() as callbacks:
+                queue_mail("Subject", "Body", ["a@example.com"])
+        self.assertEqual(callbacks, [mail_worker.wake])
+
+    def test_worker_wakes_again_when_a_retry_falls_due(self):
+        queue_mail("Subject", "Body", ["later@example.com"])
+        OutgoingEmail.objects.update(next_attempt_at=timezone.now() + timedelta(hours=1))
+        worker = BackgroundWorker("test-worker", drain_queued_mail, OutgoingEmail)
+        with mock.patch("LiveStatusAPI.workers.db_connection"):
+            worker.run()
+        self.addCleanup(worker._timer.cancel)
+        self.assertGreater(worker._timer.interval, 3500)
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_delivers_in_batches(self):
+        queue_mail("Subject", "Body", [f"user{i}@example.com" for i in range(3)])
+        self.assertEqual(deliver_queued_mail(), (2, 0))
+        self.assertEqual(drain_queued_mail(), (1, 0))
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertFalse(OutgoingEmail.objects.exclude(status="sent").exists())
+
+    def test_batch_is_leased_before_sending(self):
+        queue_mail("Subject", "Body", ["lease@example.com"])
+        seen = []
+
+        def send(*args, **kwargs):
+            seen.append(OutgoingEmail.objects.values_list("attempts", "next_attempt_at").get())
+            return 1
+
+        with mock.patch("users.mail.EmailMessage.send", side_effect=send):
+            self.assertEqual(deliver_queued_mail(), (1, 0))
+        attempts, leased_until = seen[0]
+        self.assertEqual(attempts, 1)
+        self.assertGreater(leased_until, timezone.now() + timedelta(seconds=250))
+
+    def test_failures_back_off_then_give_up(self):
+        queue_mail("Subject", "Body", ["retry@example.com"])
+        with mock.patch("users.mail.EmailMessage.send", side_effect=SMTPException("boom")):
+            self.assertEqual(deliver_queued_mail(), (0, 1))
+            email = OutgoingEmail.objects.get()
+            self.assertEqual((email.status, email.attempts), ("pending", 1))
+            self.assertGreater(email.next_attempt_at, timezone.now() + timedelta(seconds=50))
+            self.assertEqual(deliver_queued_mail(), (0, 0))  # not due yet
+
+            OutgoingEmail.objects.update(next_attempt_at=timezone.now())
+            with self.assertLogs("users.mail", "ERROR"):
+                self.assertEqual(deliver_queued_mail(), (0, 1))
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.attempts, email.last_error), ("failed", 2, "boom"))
+
+
+class DeviceClassifierTestCase(TestCase):
+    def setUp(self):
+        self.classifier = DeviceClassifier(cache_size=8)
+
+    def test_classifies_device_os_and_client(self):
+        cases = {
+            "Mozilla/5.0 (iPad; CPU OS 17_0 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) "
+            "Version/17.0 Mobile/15E148 Safari/604.1": DeviceInfo("tablet", "iOS", "Safari"),
+            "Mozilla/5.0 (iPhone; CPU iPhone OS 17_0 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) "
+            "CriOS/120.0 Mobile/15E148 Safari/604.1": DeviceInfo("mobile", "iOS", "Chrome"),
+            "Mozilla/5.0 (Linux; Android 14; SM-X710) AppleWebKit/537.36 (KHTML, like Gecko) "
+            "Chrome/120.0 Safari/537.36": DeviceInfo("tablet", "Android", "Chrome"),
+            "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) "
+            "Chrome/120.0 Safari/537.36 Edg/120.0": DeviceInfo("desktop", "Windows", "Edge"),
+            "Mozilla/5.0 (Linux; Android 6.0.1; Nexus 5X Build/MMB29P) AppleWebKit/537.36 (KHTML, like Gecko) "
+            "Chrome/120.0 Mobile Safari/537.36 (compatible; Googlebot/2.1)": DeviceInfo("bot", "Android", "Chrome"),
+            "PostmanRuntime/7.36.0": DeviceInfo("desktop", "unknown", "Postman"),
+            "": DeviceInfo("unknown", "unknown", "unknown"),
+        }
+        for user_agent, expected in cases.items():
+            self.assertEqual(self.classifier.classify(user_agent), expected, user_agent)
+
+    def test_results_are_cached_per_user_agent(self):
+        user_agent = "Mozilla/5.0 (X11; Linux x86_64; rv:121.0) Gecko/20100101 Firefox/121.0"
+        self.assertEqual(self.classifier.classify(user_agent), DeviceInfo("desktop", "Linux", "Firefox"))
+        self.classifier.classify(user_agent)
+        self.assertEqual(self.classifier.classify.cache_info().hits, 1)
+
+    def test_scope_header(self):
+        scope = {"headers": [(b"user-agent", b"Mozilla/5.0 (iPhone; CPU iPhone OS 17_0 like Mac OS X) Mobile")]}
+        self.assertEqual(get_scope_device(scope).device_type, "mobile")
+        self.assertEqual(get_scope_device({"headers": []}).device_type, "unknown")
@@ -7,8 +7,12 @@ from rest_framework.throttling import ScopedRateThrottle
 from rest_framework_simplejwt.views import TokenObtainPairView
 from rest_framework_simplejwt.tokens import RefreshToken
 from django.contrib.auth import get_user_model
+from django.db import transaction
 from django.utils.translation import gettext_lazy as _
 from presence.models import Presence
+from presence.store import get_current_presence
+from users.devices import get_device_type
+from users.revocation import revoke_token
 from users.serializers import (
     RegisterSerializer,
     CustomTokenObtainPairSerializer,
@@ -34,11 +38,12 @@ class RegisterView(generics.CreateAPIView):
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data, context={"request": request})
         serializer.is_valid(raise_exception=True)
-        user = serializer.save()
+        with transaction.atomic():
+            user = serializer.save()
+            # Trigger webhook for user registration
+            from webhooks.tasks import trigger_webhook
+            trigger_webhook.delay(user_id=str(user.id), event="user.registered")
         logger.info(f"User registered: {user.email}")
-        # Trigger webhook for user registration
-        from webhooks.tasks import trigger_webhook
-        trigger_webhook.delay(user_id=str(user.id), event="user.registered")
         return Response(
             {
                 "message": _("User registered successfully. Please verify your email to activate your account."),
@@ -69,11 +74,12 @@ class VerifyEmailView(generics.GenericAPIView):
             user.is_verified = True
             user.is_active = True
             user.verification_token = None
-            user.save(update_fields=["is_verified", "is_active", "verification_token"])
+            with transaction.atomic():
+                user.save(update_fields=["is_verified", "is_active", "verification_token"])
+                # Trigger webhook for email verification
+                from webhooks.tasks import trigger_webhook
+                trigger_webhook.delay(user_id=str(user.id), event="user.email_verified")
             logger.info(f"Email verified for user: {user.email}")
-            # Trigger webhook for email verification
-            from webhooks.tasks import trigger_webhook
-            trigger_webhook.delay(user_id=str(user.id), event="user.email_verified")
             return Response(
                 {"message": _("Email verified successfully. You can now log in.")},
                 status=status.HTTP_200_OK,
@@ -133,11 +139,12 @@ class PasswordResetConfirmView(generics.GenericAPIView):
     def post(self, request, uidb64, token):
         serializer = self.get_serializer(data=request.data, context={"uidb64": uidb64, "token": token})
         serializer.is_valid(raise_exception=True)
-        serializer.save()
+        with transaction.atomic():
+            serializer.save()
+            # Trigger webhook for password reset
+            from webhooks.tasks import trigger_webhook
+            trigger_webhook.delay(user_id=str(serializer.user.id), event="user.password_reset")
         logger.info(f"Password reset for user: {serializer.user.email}")
-        # Trigger webhook for password reset
-        from webhooks.tasks import trigger_webhook
-        trigger_webhook.delay(user_id=str(serializer.user.id), event="user.password_reset")
         return Response(
             {"message": _("Password has been reset successfully.")},
             status=status.HTTP_200_OK,
@@ -158,11 +165,17 @@ class LogoutView(APIView):
                 )
             token = RefreshToken(refresh_token)
             token.blacklist()
+            # The blacklist only covers the refresh token; revoke the access
+            # token used for this request as well.
+            if request.auth is not None:
+                revoke_token(request.auth)
 
             # Update the latest Presence record to offline
-            presence = Presence.objects.filter(user=request.user).order_by("-last_seen").first()
+            current = get_current_presence(request.user.id)
+            presence = Presence.objects.filter(pk=current["id"]).first() if current else None
             if presence:
                 presence.status = "offline"
+                presence.device_type = get_device_type(request.META.get("HTTP_USER_AGENT", ""))
                 presence.save()  # This triggers the WebSocket broadcast via the signal
                 request.user.last_presence_update = presence.last_seen
                 request.user.save(update_fields=["last_presence_update"])
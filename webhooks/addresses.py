@@ -0,0 +1,65 @@
+# webhooks/addresses.py
+import ipaddress
+import socket
+from urllib.parse import urlsplit
+
+
+class UnsafeWebhookAddress(ValueError):
+    pass
+
+
+def is_public_address(address):
+    """
+    False for loopback, private (RFC 1918 and friends), link-local (e.g. the
+    169.254.169.254 cloud metadata service), shared, multicast and reserved
+    addresses.
+    """
+    ip = ipaddress.ip_address(address.split("%", 1)[0])
+    if ip.version == 6 and ip.ipv4_mapped is not None:
+        ip = ip.ipv4_mapped
+    return ip.is_global and not ip.is_multicast
+
+
+def resolve_public(host, port):
+    """
+    getaddrinfo() results for ``host``, or UnsafeWebhookAddress if it can't be
+    resolved or any address it resolves to is not public.
+    """
+    try:
+        infos = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    except (socket.gaierror, UnicodeError):
+        raise UnsafeWebhookAddress(f"Cannot resolve {host}.")
+    for info in infos:
+        if not is_public_address(info[4][0]):
+            raise UnsafeWebhookAddress(f"{host} resolves to a non-public address.")
+    return infos
+
+
+def check_url(url):
+    parts = urlsplit(url)
+    if not parts.hostname:
+        raise UnsafeWebhookAddress("URL has no host.")
+    resolve_public(parts.hostname, parts.port or (443 if parts.scheme == "https" else 80))
+
+
+def create_public_connection(address, timeout=socket._GLOBAL_DEFAULT_TIMEOUT, source_address=None):
+    """
+    socket.create_connection() that only connects to the public addresses it
+    checked, so a DNS answer that changes between the check and the connect
+    can't redirect a delivery to an internal host.
+    """
+    host, port = address
+    error = None
+    for family, type_, proto, _, sockaddr in resolve_public(host, port):
+        sock = socket.socket(family, type_, proto)
+        try:
+            if timeout is not socket._GLOBAL_DEFAULT_TIMEOUT:
+                sock.settimeout(timeout)
+            if source_address:
+                sock.bind(source_address)
+            sock.connect(sockaddr)
+            return sock
+        except OSError as e:
+            error = e
+            sock.close()
+    raise error or OSError(f"Cannot connect to {host}")
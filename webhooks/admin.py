@@ -0,0 +1,5 @@
+from django.contrib import admin
+from .models import WebhookEvent, WebhookSubscription
+
+admin.site.register(WebhookSubscription)
+admin.site.register(WebhookEvent)
@@ -0,0 +1,290 @@
+# webhooks/dispatch.py
+import hashlib
+import hmac
+import http.client
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.dispatch import receiver
+from django.utils import timezone
+from LiveStatusAPI.workers import BackgroundWorker
+
+from .addresses import create_public_connection
+from .models import WebhookEvent
+
+logger = logging.getLogger(__name__)
+
+USER_AGENT = "LiveStatusAPI-Webhooks/1.0"
+
+
+def get_webhook_settings():
+    config = getattr(settings, "WEBHOOKS", {})
+    return {
+        "WORKER": config.get("WORKER", "thread"),
+        "BATCH_SIZE": config.get("BATCH_SIZE", 500),
+        "MAX_EVENTS_PER_REQUEST": config.get("MAX_EVENTS_PER_REQUEST", 50),
+        "MAX_ATTEMPTS": config.get("MAX_ATTEMPTS", 8),
+        "RETRY_BACKOFF": config.get("RETRY_BACKOFF", 30),
+        "TIMEOUT": config.get("TIMEOUT", 10),
+        "CONCURRENCY": config.get("CONCURRENCY", 8),
+        "MAX_IDLE_CONNECTIONS": config.get("MAX_IDLE_CONNECTIONS", 4),
+        "LEASE": config.get("LEASE", 300),
+        "ALLOW_PRIVATE_ADDRESSES": config.get("ALLOW_PRIVATE_ADDRESSES", False),
+    }
+
+
+def sign_payload(secret, timestamp, body):
+    """
+    HMAC-SHA256 over "<timestamp>.<body>", sent as
+    ``X-Webhook-Signature: sha256=<hex>`` next to ``X-Webhook-Timestamp``.
+    """
+    message = f"{timestamp}.".encode() + body
+    return hmac.new(secret.encode(), message, hashlib.sha256).hexdigest()
+
+
+class ConnectionPool:
+    """
+    Keep-alive HTTP(S) connections per (scheme, host, port), shared by the
+    delivery threads so repeated deliveries to an endpoint skip the TCP and
+    TLS handshakes.
+    """
+
+    def __init__(self, max_idle=4, timeout=10, allow_private=False):
+        self.max_idle = max_idle
+        self.timeout = timeout
+        self.allow_private = allow_private
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    def _connect(self, key):
+        scheme, host, port = key
+        connection_class = http.client.HTTPSConnection if scheme == "https" else http.client.HTTPConnection
+        connection = connection_class(host, port, timeout=self.timeout)
+        if not self.allow_private:
+            # Checked again at connect time: the URL was validated when it was
+            # registered, but DNS may point somewhere else by now.
+            connection._create_connection = create_public_connection
+        return connection
+
+    def acquire(self, key):
+        """
+        Return (connection, reused).
+        """
+        with self._lock:
+            idle = self._idle.get(key)
+            if idle:
+                return idle.pop(), True
+        return self._connect(key), False
+
+    def release(self, key, connection):
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.max_idle:
+                idle.append(connection)
+                return
+        connection.close()
+
+    def post(self, url, body, headers):
+        """
+        POST ``body`` and return the response status. A reused connection the
+        server has since closed is retried once on a fresh one.
+        """
+        parts = urlsplit(url)
+        key = (parts.scheme, parts.hostname, parts.port or (443 if parts.scheme == "https" else 80))
+        path = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+        connection, reused = self.acquire(key)
+        while True:
+            try:
+                connection.request("POST", path, body=body, headers=headers)
+                response = connection.getresponse()
+                response.read()
+            except (OSError, http.client.HTTPException):
+                connection.close()
+                if not reused:
+                    raise
+                connection, reused = self._connect(key), False
+                continue
+            if response.will_close:
+                connection.close()
+            else:
+                self.release(key, connection)
+            return response.status
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for connections in idle.values():
+            for connection in connections:
+                connection.close()
+
+
+class WebhookDispatcher:
+    """
+    Delivers pending outbox rows. Each batch is claimed under a short lease,
+    grouped per subscription into requests of up to MAX_EVENTS_PER_REQUEST
+    events, and posted concurrently over pooled connections. Failed requests
+    are retried with exponential backoff until MAX_ATTEMPTS.
+    """
+
+    def __init__(self):
+        self._pool = None
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def get_pool(self, config):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ConnectionPool(
+                    max_idle=config["MAX_IDLE_CONNECTIONS"],
+                    timeout=config["TIMEOUT"],
+                    allow_private=config["ALLOW_PRIVATE_ADDRESSES"],
+                )
+                self._executor = ThreadPoolExecutor(max_workers=config["CONCURRENCY"], thread_name_prefix="webhook")
+            return self._pool, self._executor
+
+    def reset(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.close()
+                self._executor.shutdown(wait=False)
+            self._pool = self._executor = None
+
+    def claim(self, config, batch_size):
+        now = timezone.now()
+        with transaction.atomic():
+            events = list(
+                WebhookEvent.objects.select_for_update(skip_locked=True, of=("self",))
+                .filter(status="pending", next_attempt_at__lte=now)
+                .select_related("subscription")
+                .order_by("next_attempt_at", "id")[:batch_size]
+            )
+            # Leased rows are skipped by other workers until delivered or the
+            # lease runs out (e.g. if this process dies mid-delivery).
+            WebhookEvent.objects.filter(pk__in=[event.pk for event in events]).update(
+                next_attempt_at=now + timedelta(seconds=config["LEASE"])
+            )
+        return events
+
+    def build_request(self, subscription, events):
+        body = json.dumps(
+            {
+                "events": [
+                    {
+                        "id": event.id,
+                        "event": event.event,
+                        "created_at": event.created_at,
+                        "data": event.payload,
+                    }
+                    for event in events
+                ]
+            },
+            cls=DjangoJSONEncoder,
+        ).encode()
+        timestamp = str(int(time.time()))
+        headers = {
+            "Content-Type": "application/json",
+            "User-Agent": USER_AGENT,
+            "X-Webhook-Id": str(subscription.id),
+            "X-Webhook-Timestamp": timestamp,
+            "X-Webhook-Signature": f"sha256={sign_payload(subscription.secret, timestamp, body)}",
+        }
+        return body, headers
+
+    def send(self, pool, subscription, events):
+        body, headers = self.build_request(subscription, events)
+        try:
+            status = pool.post(subscription.url, body, headers)
+        except (OSError, http.client.HTTPException, ValueError) as e:
+            return f"{type(e).__name__}: {e}"
+        if 200 <= status < 300:
+            return None
+        return f"HTTP {status}"
+
+    def deliver_due(self, batch_size=None):
+        """
+        Deliver one batch of due events and return (delivered, failed).
+        """
+        config = get_webhook_settings()
+        events = self.claim(config, batch_size or config["BATCH_SIZE"])
+        if not events:
+            return 0, 0
+
+        requests = []
+        by_subscription = {}
+        for event in events:
+            by_subscription.setdefault(event.subscription_id, []).append(event)
+        for grouped in by_subscription.values():
+            for start in range(0, len(grouped), config["MAX_EVENTS_PER_REQUEST"]):
+                requests.append(grouped[start:start + config["MAX_EVENTS_PER_REQUEST"]])
+
+        pool, executor = self.get_pool(config)
+
+        def send_chunk(chunk):
+            # Anything send() doesn't expect becomes this chunk's error, so
+            # the outcome of the whole batch is still recorded below.
+            try:
+                return self.send(pool, chunk[0].subscription, chunk)
+            except Exception as e:
+                logger.exception(f"Unexpected error delivering webhooks to {chunk[0].subscription.url}")
+                return f"{type(e).__name__}: {e}"
+
+        errors = executor.map(send_chunk, requests)
+
+        now = timezone.now()
+        delivered = failed = 0
+        for chunk, error in zip(requests, errors):
+            for event in chunk:
+                event.attempts += 1
+                if error is None:
+                    event.status = "delivered"
+                    event.delivered_at = now
+                    event.last_error = ""
+                    delivered += 1
+                    continue
+                event.last_error = error
+                failed += 1
+                if event.attempts >= config["MAX_ATTEMPTS"]:
+                    event.status = "failed"
+                else:
+                    event.next_attempt_at = now + timedelta(seconds=config["RETRY_BACKOFF"] * 2 ** (event.attempts - 1))
+            if error is not None:
+                logger.warning(f"Webhook delivery to {chunk[0].subscription.url} failed: {error}")
+
+        WebhookEvent.objects.bulk_update(
+            events, ["status", "attempts", "next_attempt_at", "last_error", "delivered_at"]
+        )
+        return delivered, failed
+
+    def drain(self, batch_size=None):
+        """
+        Deliver batches until nothing is due. Returns total (delivered, failed).
+        """
+        totals = [0, 0]
+        while True:
+            delivered, failed = self.deliver_due(batch_size)
+            if not delivered and not failed:
+                return tuple(totals)
+            totals[0] += delivered
+            totals[1] += failed
+
+
+dispatcher = WebhookDispatcher()
+
+
+@receiver(setting_changed)
+def reset_webhook_dispatcher(setting, **kwargs):
+    if setting == "WEBHOOKS":
+        dispatcher.reset()
+
+
+# Drains the outbox on a background thread in each process (WORKER "thread")
+webhook_worker = BackgroundWorker("webhook-worker", dispatcher.drain, WebhookEvent)
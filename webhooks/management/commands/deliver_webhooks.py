@@ -0,0 +1,24 @@
+# webhooks/management/commands/deliver_webhooks.py
+
+import time
+
+from django.core.management.base import BaseCommand
+from webhooks.dispatch import dispatcher
+
+
+class Command(BaseCommand):
+    help = 'Deliver pending webhook events from the outbox'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None, help='Events per batch (default: WEBHOOKS["BATCH_SIZE"])')
+        parser.add_argument('--loop', action='store_true', help='Keep polling the outbox instead of exiting when it is empty')
+        parser.add_argument('--interval', type=float, default=1.0, help='Seconds between polls with --loop')
+
+    def handle(self, *args, **options):
+        while True:
+            delivered, failed = dispatcher.drain(options['batch_size'])
+            if delivered or failed or not options['loop']:
+                self.stdout.write(self.style.SUCCESS(f'Delivered {delivered} events, {failed} failed'))
+            if not options['loop']:
+                return
+            time.sleep(options['interval'])
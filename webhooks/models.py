@@ -0,0 +1,78 @@
+# webhooks/models.py
+import secrets
+import uuid
+
+from django.contrib.auth import get_user_model
+from django.db import models
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+
+User = get_user_model()
+
+EVENT_CHOICES = (
+    ("status_change", "Status change"),
+    ("engagement_update", "Engagement update"),
+    ("user.registered", "User registered"),
+    ("user.email_verified", "Email verified"),
+    ("user.logged_in", "Logged in"),
+    ("user.password_reset_requested", "Password reset requested"),
+    ("user.password_reset", "Password reset"),
+)
+
+
+def generate_secret():
+    return secrets.token_hex(32)
+
+
+class WebhookSubscription(models.Model):
+    """
+    An endpoint that receives the owner's events. Payloads are signed with
+    ``secret`` (HMAC-SHA256) so the receiver can verify them.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="webhooks")
+    url = models.URLField(max_length=500)
+    events = models.JSONField(default=list, help_text=_("Event names this endpoint subscribes to."))
+    secret = models.CharField(max_length=64, default=generate_secret, editable=False)
+    is_active = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = "webhook_subscription"
+        indexes = [
+            models.Index(fields=["user", "is_active"]),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} -> {self.url}"
+
+
+class WebhookEvent(models.Model):
+    """
+    Outbox row: one event waiting to be delivered to one subscription. Rows
+    are written in the same transaction as the change that caused them and
+    delivered later by the webhook dispatcher.
+    """
+    STATUS_CHOICES = (
+        ("pending", "Pending"),
+        ("delivered", "Delivered"),
+        ("failed", "Failed"),
+    )
+    subscription = models.ForeignKey(WebhookSubscription, on_delete=models.CASCADE, related_name="outbox")
+    event = models.CharField(max_length=50, choices=EVENT_CHOICES)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default="pending")
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True)
+    delivered_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = "webhook_event"
+        indexes = [
+            models.Index(fields=["status", "next_attempt_at"]),
+        ]
+
+    def __str__(self):
+        return f"{self.event} -> {self.subscription_id} ({self.status})"
@@ -0,0 +1,42 @@
+# webhooks/serializers.py
+from rest_framework import serializers
+from django.utils.translation import gettext_lazy as _
+
+from .addresses import UnsafeWebhookAddress, check_url
+from .dispatch import get_webhook_settings
+from .models import EVENT_CHOICES, WebhookSubscription
+
+
+class WebhookRegistrationSerializer(serializers.ModelSerializer):
+    events = serializers.ListField(
+        child=serializers.ChoiceField(choices=EVENT_CHOICES),
+        allow_empty=False,
+    )
+
+    class Meta:
+        model = WebhookSubscription
+        fields = ["id", "url", "events", "secret", "is_active", "created_at"]
+        read_only_fields = ["id", "secret", "is_active", "created_at"]
+
+    def validate_url(self, value):
+        if not value.startswith(("http://", "https://")):
+            raise serializers.ValidationError(_("Webhook URL must use http or https."))
+        if not get_webhook_settings()["ALLOW_PRIVATE_ADDRESSES"]:
+            # Deliveries must not reach the loopback, private network or
+            # cloud metadata addresses of the servers sending them.
+            try:
+                check_url(value)
+            except UnsafeWebhookAddress:
+                raise serializers.ValidationError(_("Webhook URL must resolve to a public address."))
+        return value
+
+    def validate_events(self, value):
+        # Keep the first occurrence of each event, in order
+        return list(dict.fromkeys(value))
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        # The signing secret is only shown once, when the webhook is created
+        if not self.context.get("include_secret"):
+            data.pop("secret", None)
+        return data
@@ -0,0 +1,15 @@
+# webhooks/signals.py
+from django.dispatch import receiver
+from presence.dispatch import presence_dispatched
+
+from .tasks import enqueue_events
+
+
+@receiver(presence_dispatched)
+def enqueue_presence_webhooks(sender, events, engagement_scores, **kwargs):
+    batch = [(data["user_id"], "status_change", data) for data in events]
+    batch += [
+        (user_id, "engagement_update", {"engagement_score": score})
+        for user_id, score in engagement_scores.items()
+    ]
+    enqueue_events(batch)
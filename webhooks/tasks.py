@@ -0,0 +1,59 @@
+# webhooks/tasks.py
+import functools
+
+from django.db import transaction
+
+from .dispatch import get_webhook_settings, webhook_worker
+from .models import WebhookEvent, WebhookSubscription
+
+
+def enqueue_events(events):
+    """
+    Write one outbox row per matching active subscription for a batch of
+    (user_id, event, data) tuples. Rows are written in the caller's
+    transaction; the dispatcher is woken once it commits.
+    """
+    if not events:
+        return []
+    subscriptions = {}
+    for subscription in WebhookSubscription.objects.filter(
+        user_id__in={str(user_id) for user_id, _, _ in events}, is_active=True
+    ).only("id", "user_id", "events"):
+        subscriptions.setdefault(str(subscription.user_id), []).append(subscription)
+    if not subscriptions:
+        return []
+
+    rows = [
+        WebhookEvent(subscription=subscription, event=event, payload={"user_id": str(user_id), **data})
+        for user_id, event, data in events
+        for subscription in subscriptions.get(str(user_id), [])
+        if event in subscription.events
+    ]
+    if rows:
+        WebhookEvent.objects.bulk_create(rows)
+        if get_webhook_settings()["WORKER"] == "thread":
+            transaction.on_commit(webhook_worker.wake)
+    return rows
+
+
+class Task:
+    """
+    Lets call sites use the familiar ``task.delay(...)`` form. Enqueueing
+    only writes outbox rows, so it runs inline in the caller's transaction
+    and delivery happens on the dispatcher.
+    """
+
+    def __init__(self, func):
+        self.func = func
+        functools.update_wrapper(self, func)
+
+    def __call__(self, *args, **kwargs):
+        return self.func(*args, **kwargs)
+
+    def delay(self, *args, **kwargs):
+        return self.func(*args, **kwargs)
+
+
+@Task
+def trigger_webhook(user_id, event, data=None):
+    return enqueue_events([(user_id, event, data or {})])
@@ -0,0 +1,194 @@
+# webhooks/tests.py
+import hashlib
+import hmac
+import json
+import socket
+import threading
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from presence.models import Presence
+from users.models import CustomUser
+from .addresses import UnsafeWebhookAddress
+from .dispatch import ConnectionPool, dispatcher
+from .models import WebhookEvent, WebhookSubscription
+from .tasks import trigger_webhook
+
+WEBHOOK_SETTINGS = {
+    "WORKER": "command",
+    "MAX_EVENTS_PER_REQUEST": 2,
+    "MAX_ATTEMPTS": 2,
+    "RETRY_BACKOFF": 60,
+    "CONCURRENCY": 1,
+    "ALLOW_PRIVATE_ADDRESSES": True,  # deliveries go to a stub server on 127.0.0.1
+}
+PUBLIC_ONLY = {**WEBHOOK_SETTINGS, "ALLOW_PRIVATE_ADDRESSES": False}
+ADDRESSES = {"example.com": "93.184.215.14", "metadata.internal": "169.254.169.254", "intranet": "10.0.0.8"}
+
+
+def fake_getaddrinfo(host, port, *args, **kwargs):
+    address = ADDRESSES.get(host, host)
+    return [(socket.AF_INET, socket.SOCK_STREAM, 6, "", (address, port))]
+IN_MEMORY_CHANNEL_LAYERS = {"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, so the pool can reuse connections
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        self.server.requests.append({"headers": dict(self.headers), "body": body, "client": self.client_address})
+        self.send_response(self.server.status)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class StubServer:
+    """
+    Local HTTP endpoint that records every request it receives.
+    """
+
+    def __enter__(self):
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+        self.httpd.requests = []
+        self.httpd.status = 200
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self.httpd
+
+    def __exit__(self, *exc_info):
+        dispatcher.reset()
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@override_settings(WEBHOOKS=PUBLIC_ONLY)
+class WebhookRegistrationTests(TestCase):
+    def setUp(self):
+        patcher = patch("webhooks.addresses.socket.getaddrinfo", side_effect=fake_getaddrinfo)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.user = CustomUser.objects.create_user(email="hooks@example.com", username="hooks", password="Test123!@#")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_register_returns_secret_once(self):
+        response = self.client.post(
+            reverse("webhook-list"),
+            {"url": "https://example.com/hook", "events": ["status_change", "status_change"]},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data["events"], ["status_change"])
+        self.assertEqual(len(response.data["secret"]), 64)
+
+        response = self.client.get(reverse("webhook-list"))
+        self.assertNotIn("secret", response.data[0])
+
+    def test_rejects_unknown_events(self):
+        response = self.client.post(
+            reverse("webhook-list"), {"url": "https://example.com/hook", "events": ["nope"]}, format="json"
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+    def test_rejects_internal_addresses(self):
+        for url in (
+            "http://127.0.0.1:8000/hook",
+            "http://[::ffff:127.0.0.1]/hook",
+            "http://metadata.internal/latest/meta-data/",
+            "https://intranet/hook",
+        ):
+            response = self.client.post(
+                reverse("webhook-list"), {"url": url, "events": ["status_change"]}, format="json"
+            )
+            self.assertEqual(response.status_code, 400, url)
+            self.assertIn("url", response.data)
+
+    def test_delivery_refuses_internal_addresses(self):
+        with self.assertRaises(UnsafeWebhookAddress):
+            ConnectionPool().post("http://metadata.internal/hook", b"{}", {})
+
+@override_settings(WEBHOOKS=WEBHOOK_SETTINGS, CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS)
+class WebhookDeliveryTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(email="owner@example.com", username="owner", password="Test123!@#")
+        self.other = CustomUser.objects.create_user(email="other@example.com", username="other", password="Test123!@#")
+
+    def subscribe(self, url, events=("status_change", "user.logged_in")):
+        return WebhookSubscription.objects.create(user=self.user, url=url, events=list(events))
+
+    def test_trigger_writes_outbox_for_matching_subscriptions(self):
+        self.subscribe("http://127.0.0.1:9/hook", events=["user.logged_in"])
+        trigger_webhook.delay(user_id=str(self.user.id), event="user.logged_in")
+        trigger_webhook.delay(user_id=str(self.user.id), event="user.password_reset")
+        trigger_webhook.delay(user_id=str(self.other.id), event="user.logged_in")
+        event = WebhookEvent.objects.get()
+        self.assertEqual((event.event, event.payload), ("user.logged_in", {"user_id": str(self.user.id)}))
+
+    def test_presence_changes_are_queued(self):
+        self.subscribe("http://127.0.0.1:9/hook", events=["status_change", "engagement_update"])
+        Presence.objects.create(user=self.user, status="online", device_type="desktop")
+        events = {event.event: event.payload for event in WebhookEvent.objects.all()}
+        self.assertEqual(events["status_change"]["status"], "online")
+        self.assertAlmostEqual(events["engagement_update"]["engagement_score"], 0.1)
+
+    def test_batches_signs_and_reuses_connections(self):
+        with StubServer() as server:
+            subscription = self.subscribe(f"http://127.0.0.1:{server.server_port}/hook")
+            for _ in range(3):
+                trigger_webhook.delay(user_id=str(self.user.id), event="user.logged_in")
+            self.assertEqual(dispatcher.drain(), (3, 0))
+
+            trigger_webhook.delay(user_id=str(self.user.id), event="user.logged_in")
+            self.assertEqual(dispatcher.drain(), (1, 0))
+
+        # Three events in requests of at most two, then one more request
+        self.assertEqual(
+            [len(json.loads(request["body"])["events"]) for request in server.requests], [2, 1, 1]
+        )
+        request = server.requests[0]
+        expected = hmac.new(
+            subscription.secret.encode(),
+            f"{request['headers']['X-Webhook-Timestamp']}.".encode() + request["body"],
+            hashlib.sha256,
+        ).hexdigest()
+        self.assertEqual(request["headers"]["X-Webhook-Signature"], f"sha256={expected}")
+        self.assertEqual(len({request["client"] for request in server.requests}), 1)
+        self.assertFalse(WebhookEvent.objects.exclude(status="delivered").exists())
+
+    def test_failures_back_off_then_give_up(self):
+        with StubServer() as server:
+            server.status = 500
+            self.subscribe(f"http://127.0.0.1:{server.server_port}/hook")
+            trigger_webhook.delay(user_id=str(self.user.id), event="user.logged_in")
+            with self.assertLogs("webhooks.dispatch", "WARNING"):
+                self.assertEqual(dispatcher.deliver_due(), (0, 1))
+            event = WebhookEvent.objects.get()
+            self.assertEqual((event.status, event.attempts, event.last_error), ("pending", 1, "HTTP 500"))
+            self.assertGreater(event.next_attempt_at, timezone.now() + timedelta(seconds=50))
+            self.assertEqual(dispatcher.deliver_due(), (0, 0))  # not due yet
+
+            WebhookEvent.objects.update(next_attempt_at=timezone.now())
+            with self.assertLogs("webhooks.dispatch", "WARNING"):
+                self.assertEqual(dispatcher.deliver_due(), (0, 1))
+        event.refresh_from_db()
+        self.assertEqual((event.status, event.attempts), ("failed", 2))
+
+    def test_unexpected_send_errors_are_recorded(self):
+        self.subscribe("http://127.0.0.1:9/hook")
+        trigger_webhook.delay(user_id=str(self.user.id), event="user.logged_in")
+        with patch.object(dispatcher, "send", side_effect=RuntimeError("bug")):
+            with self.assertLogs("webhooks.dispatch", "ERROR"):
+                self.assertEqual(dispatcher.deliver_due(), (0, 1))
+        event = WebhookEvent.objects.get()
+        self.assertEqual((event.status, event.attempts, event.last_error), ("pending", 1, "RuntimeError: bug"))
+        self.assertLess(event.next_attempt_at, timezone.now() + timedelta(seconds=120))  # backoff, not the lease
@@ -0,0 +1,9 @@
+# webhooks/urls.py
+
+from django.urls import path
+from .views import WebhookListCreateView, WebhookDetailView
+
+urlpatterns = [
+    path('webhooks/', WebhookListCreateView.as_view(), name='webhook-list'),
+    path('webhooks/<uuid:webhookId>/', WebhookDetailView.as_view(), name='webhook-detail'),
+]
@@ -0,0 +1,40 @@
+# webhooks/views.py
+from rest_framework import generics, status
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from drf_spectacular.utils import extend_schema
+
+from .models import WebhookSubscription
+from .serializers import WebhookRegistrationSerializer
+
+
+class WebhookListCreateView(generics.ListCreateAPIView):
+    """
+    Register a webhook for the authenticated user's events, or list the
+    user's webhooks. The signing secret is only returned on creation.
+    """
+    serializer_class = WebhookRegistrationSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        return WebhookSubscription.objects.filter(user=self.request.user).order_by("created_at")
+
+    @extend_schema(summary="Register webhook")
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        subscription = serializer.save(user=request.user)
+        data = self.get_serializer(subscription, context={"request": request, "include_secret": True}).data
+        return Response(data, status=status.HTTP_201_CREATED)
+
+
+class WebhookDetailView(generics.RetrieveDestroyAPIView):
+    """
+    Retrieve or delete one of the authenticated user's webhooks.
+    """
+    serializer_class = WebhookRegistrationSerializer
+    permission_classes = [IsAuthenticated]
+    lookup_url_kwarg = "webhookId"
+
+    def get_queryset(self):
+        return WebhookSubscription.objects.filter(user=self.request.user)